@@ -246,15 +246,18 @@ class SessionManager(object):
             headerargs=headerargs
         ))
 
+        # The request is only made once the semaphore has been acquired, so
+        # that no more than MAX_PARALLEL are outstanding at once.
         try:
             response = yield semaphore.run(
-                add_timeout,
-                agent.request(
-                    'GET',
-                    url,
-                    headers=headers
-                ),
-                READ_TIMEOUT
+                lambda: add_timeout(
+                    agent.request(
+                        'GET',
+                        url,
+                        headers=headers
+                    ),
+                    READ_TIMEOUT
+                )
             )
         except TimeoutError:
             raise TimeoutError("GET %s" % url)
@@ -302,14 +305,15 @@ class SessionManager(object):
 
         try:
             response = yield semaphore.run(
-                add_timeout,
-                agent.request(
-                    'POST',
-                    url,
-                    headers=headers,
-                    bodyProducer=StringProducer(body)
-                ),
-                READ_TIMEOUT
+                lambda: add_timeout(
+                    agent.request(
+                        'POST',
+                        url,
+                        headers=headers,
+                        bodyProducer=StringProducer(body)
+                    ),
+                    READ_TIMEOUT
+                )
             )
         except TimeoutError:
             raise TimeoutError("POST %s" % url)
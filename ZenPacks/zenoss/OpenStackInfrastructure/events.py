@@ -21,6 +21,8 @@ from ZenPacks.zenoss.OpenStackInfrastructure.utils import (get_subnets_from_fixe
                                                            )
 
 import ast
+import json
+import threading
 
 import logging
 LOG = logging.getLogger('zen.OpenStack.events')
@@ -135,19 +137,90 @@ def volsnapshot_name(evt):
     return volsnapshot_id(evt)
 
 
+# -----------------------------------------------------------------------------
+# Trait Parsing
+# -----------------------------------------------------------------------------
+_LITERAL_CACHE = {}
+_LITERAL_CACHE_SIZE = 1000
+
+# Events may be mapped in zenopenstack's worker threads as well as its
+# reactor thread, so the caches are only added to (or cleared) with this
+# held.  Lookups do not need it.
+_CACHE_LOCK = threading.Lock()
+
+
+def parse_trait_literal(value):
+    """
+    Parse a trait whose value is a string representation of a list or dict,
+    such as trait_fixed_ips, as ast.literal_eval would.
+
+    Depending on how the notification was produced, this is either JSON or
+    a python repr().  A list or dict is tried as JSON first, since that is
+    much faster to parse than ast.literal_eval.  Anything else is only
+    parsed as a python literal, so that (say) "true" is not accepted.
+
+    Because the same values recur across the many events for a single
+    resource, python literals are cached once parsed, and each caller
+    given its own copy (which is about as quick as parsing JSON).
+    """
+
+    if not isinstance(value, basestring):
+        raise ValueError("malformed string")
+
+    if value.lstrip()[:1] in ('[', '{'):
+        try:
+            return json.loads(value)
+        except ValueError:
+            pass
+
+    try:
+        parsed = _LITERAL_CACHE[value]
+    except KeyError:
+        parsed = ast.literal_eval(value)
+        with _CACHE_LOCK:
+            if len(_LITERAL_CACHE) >= _LITERAL_CACHE_SIZE:
+                _LITERAL_CACHE.clear()
+            _LITERAL_CACHE[value] = parsed
+
+    return _copy_literal(parsed)
+
+
+def _copy_literal(value):
+    # Copy the containers in a value returned by ast.literal_eval.
+    if isinstance(value, list):
+        return [_copy_literal(item) for item in value]
+    if isinstance(value, dict):
+        return dict((key, _copy_literal(item)) for key, item in value.iteritems())
+    if isinstance(value, tuple):
+        return tuple(_copy_literal(item) for item in value)
+    if isinstance(value, set):
+        return set(value)
+    return value
+
+
 # -----------------------------------------------------------------------------
 # Traitmap Functions
 # -----------------------------------------------------------------------------
+def compile_traitmap(traitmap):
+    """
+    Convert a traitmap ({trait name: [property name, ...]}) into the
+    tuple of (event field, property names) pairs used to apply it, so
+    that this only has to be done once, rather than for every event.
+    """
+    return tuple(
+        ('trait_' + trait, tuple(prop_names))
+        for trait, prop_names in traitmap.iteritems())
+
+
 def _apply_neutron_traits(evt, objmap, traitmap):
-    for trait in traitmap:
-        for prop_name in traitmap[trait]:
-            trait_field = 'trait_' + trait
-            if trait_field in evt:
-                # Cast trait_admin_state_up to boolean for renderers
-                if trait_field == 'trait_admin_state_up':
-                    value = str(evt.get('trait_admin_state_up')).lower() == 'true'
-                else:
-                    value = evt.get(trait_field)
+    for trait_field, prop_names in traitmap:
+        if trait_field in evt:
+            # Cast trait_admin_state_up to boolean for renderers
+            if trait_field == 'trait_admin_state_up':
+                value = str(evt['trait_admin_state_up']).lower() == 'true'
+            else:
+                value = evt[trait_field]
+            for prop_name in prop_names:
                 setattr(objmap, prop_name, value)
 
     # Set the Tenant ID
@@ -176,7 +249,7 @@ def _apply_router_gateway_info(evt, objmap):
     ''' Get the router gateways, network, and subnets'''
     if 'trait_external_gateway_info' in evt:
 
-        ext_gw_info = ast.literal_eval(evt['trait_external_gateway_info'])
+        ext_gw_info = parse_trait_literal(evt['trait_external_gateway_info'])
         if ext_gw_info:
             gateways = set()
             subnets = set()
@@ -193,44 +266,81 @@ def _apply_router_gateway_info(evt, objmap):
 def _apply_dns_info(evt, objmap):
     ''' Get the dns servers for subnets as a string'''
     if 'trait_dns_nameservers' in evt:
-        dns_info = ast.literal_eval(evt['trait_dns_nameservers'])
+        dns_info = parse_trait_literal(evt['trait_dns_nameservers'])
         servers = ", ".join(dns_info)
         setattr(objmap, 'dns_nameservers', servers)
 
 
-def _apply_instance_traits(evt, objmap):
-    # Note: The payload is currently (queens) built by
-    # openstack.nova.nova.notifications.base.info_from_instance
-
-    traitmap = {
-        'instance_id': ['resourceId', 'serverId'],
-        'state': ['serverStatus'],
-        'flavor_name': ['set_flavor_name'],
-        'instance_type': ['set_flavor_name'],
-        'host_name': ['set_host_name'],
-        'host': ['set_host_name'],
-        'image_name': ['set_image_name'],
-        'tenant_id': ['set_tenant_id']
-    }
-    for trait in traitmap:
-        for prop_name in traitmap[trait]:
-            trait_field = 'trait_' + trait
-            if trait_field in evt:
-                value = evt.get(trait_field)
+# Note: The payload is currently (queens) built by
+# openstack.nova.nova.notifications.base.info_from_instance
+INSTANCE_TRAITMAP = compile_traitmap({
+    'instance_id': ['resourceId', 'serverId'],
+    'state': ['serverStatus'],
+    'flavor_name': ['set_flavor_name'],
+    'instance_type': ['set_flavor_name'],
+    'host_name': ['set_host_name'],
+    'host': ['set_host_name'],
+    'image_name': ['set_image_name'],
+    'tenant_id': ['set_tenant_id']
+})
+
+# Possible vm state (vmState) values can be found in
+# nova.objects.fields.InstanceState
+#
+# The vm state, in combination with the task state
+# (which unfortunately is not exposed as a trait by the default
+# event_definitions.yaml), is used to compute the vm's status (serverStatus
+# in our model) by nova.api.openstack.common.status_from_state()
+#
+# Because the task state is unknown, we use the default state value
+# for each VM state value, which is what would be used if there
+# was no recognized task state.
+VM_STATE_SERVER_STATUS = {
+    'active': 'active',
+    'building': 'build',
+    'stopped': 'shutoff',
+    'resized': 'verify_resize',
+    'paused': 'paused',
+    'suspended': 'suspended',
+    'rescued': 'rescue',
+    'error': 'error',
+    'deleted': 'deleted',
+    'soft-delete': 'soft_deleted',
+    'shelved': 'shelved',
+    'shelved_offloaded': 'shelved_offloaded',
+}
 
+VM_STATE_POWER_STATE = {
+    'active': 'running',
+    'building': 'running',
+    'paused': 'paused',
+    'suspended': 'suspended',
+    'stopped': 'shutdown',
+    'deleted': 'shutdown',
+    'shelved': 'shutdown',
+    'shelved_offloaded': 'shutdown',
+}
+
+
+def _apply_instance_traits(evt, objmap):
+    for trait_field, prop_names in INSTANCE_TRAITMAP:
+        if trait_field in evt:
+            value = evt[trait_field]
+            for prop_name in prop_names:
                 # Store server status in lowercase
                 if prop_name == 'serverStatus':
-                    value = value.lower()
-
-                setattr(objmap, prop_name, value)
+                    setattr(objmap, prop_name, value.lower())
+                else:
+                    setattr(objmap, prop_name, value)
 
-    for prop_name in ['title', 'hostName']:
-        setattr(objmap, prop_name, instance_name(evt))
+    name = instance_name(evt)
+    objmap.title = name
+    objmap.hostName = name
 
     # special case for publicIps / privateIps
     if 'trait_fixed_ips' in evt:
         try:
-            fixed_ips = ast.literal_eval(evt['trait_fixed_ips'])
+            fixed_ips = parse_trait_literal(evt['trait_fixed_ips'])
             public_ips = set()
             private_ips = set()
             # Assume: Fixed_ips are private, floating_ips are external/public:
@@ -247,78 +357,50 @@ def _apply_instance_traits(evt, objmap):
 
     if 'trait_state' in evt:
         # Note: 'state' is actually the VM state, not the server's status.
-        objmap.vmState = evt['trait_state'].lower()
-
-        # Possible vm state (vmState) values can be found in
-        # nova.objects.fields.InstanceState
-
-        # The vm state, in combination with the task state
-        # (which unfortunately is not exposed as a trait by the default
-        # event_definitions.yaml), is used to compute the vm's status (serverStatus
-        # in our model) by nova.api.openstack.common.status_from_state()
-
-        # Because the task state is unknown, we use the default state value
-        # for each VM state value, which is what would be used if there
-        # was no recognized task state.
-
-        objmap.serverStatus = {
-            'active': 'active',
-            'building': 'build',
-            'stopped': 'shutoff',
-            'resized': 'verify_resize',
-            'paused': 'paused',
-            'suspended': 'suspended',
-            'rescued': 'rescue',
-            'error': 'error',
-            'deleted': 'deleted',
-            'soft-delete': 'soft_deleted',
-            'shelved': 'shelved',
-            'shelved_offloaded': 'shelved_offloaded',
-        }.get(evt['trait_state'].lower(), 'unknown')
-
-        powerState = {
-            'active': 'running',
-            'building': 'running',
-            'paused': 'paused',
-            'suspended': 'suspended',
-            'stopped': 'shutdown',
-            'deleted': 'shutdown',
-            'shelved': 'shutdown',
-            'shelved_offloaded': 'shutdown',
-        }.get(evt['trait_state'].lower(), None)
+        vm_state = evt['trait_state'].lower()
+        objmap.vmState = vm_state
+        objmap.serverStatus = VM_STATE_SERVER_STATUS.get(vm_state, 'unknown')
+
+        powerState = VM_STATE_POWER_STATE.get(vm_state)
         if powerState:
             objmap.powerState = powerState
 
 
+_CINDER_TRAITMAP = {
+    'status': ['status'],
+    'display_name': ['title'],
+    'availability_zone': ['avzone'],
+    'created_at': ['created_at'],
+    'volume_id': ['volumeId'],
+    'resource_id': ['volumeId'],
+    'host': ['host'],
+    'type': ['volume_type'],
+    'size': ['size'],
+}
+VOLUME_TRAITMAP = compile_traitmap(_CINDER_TRAITMAP)
+
+# volume snapshot events do not not have these, so don't try to apply them even
+# if they are found.
+VOLSNAPSHOT_TRAITMAP = compile_traitmap(dict(
+    (trait, prop_names) for trait, prop_names in _CINDER_TRAITMAP.iteritems()
+    if trait not in ('volume_id', 'availability_zone', 'host', 'type')))
+
+
 def _apply_cinder_traits(evt, objmap):
-    traitmap = {
-        'status': ['status'],
-        'display_name': ['title'],
-        'availability_zone': ['avzone'],
-        'created_at': ['created_at'],
-        'volume_id': ['volumeId'],
-        'resource_id': ['volumeId'],
-        'host': ['host'],
-        'type': ['volume_type'],
-        'size': ['size'],
-    }
     if 'VolSnapshot' in objmap.modname:
-        # volume snapshot events do not not have these, so don't try to apply them even
-        # if they are found.
-        traitmap.pop('volume_id', None)
-        traitmap.pop('availability_zone', None)
-        traitmap.pop('host', None)
-        traitmap.pop('type', None)
-
-    for trait in traitmap:
-        for prop_name in traitmap[trait]:
-            trait_field = 'trait_' + trait
-            if trait_field in evt:
-                value = evt.get(trait_field)
+        traitmap = VOLSNAPSHOT_TRAITMAP
+    else:
+        traitmap = VOLUME_TRAITMAP
+
+    for trait_field, prop_names in traitmap:
+        if trait_field in evt:
+            value = evt[trait_field]
+            for prop_name in prop_names:
                 # awkward!
                 if prop_name == 'status':
-                    value = value.upper()
-                setattr(objmap, prop_name, value)
+                    setattr(objmap, prop_name, value.upper())
+                else:
+                    setattr(objmap, prop_name, value)
 
 
 def instance_objmap(evt):
@@ -339,8 +421,7 @@ def neutron_objmap(evt, Name):
                  id_function.
     """
     module = 'ZenPacks.zenoss.OpenStackInfrastructure.' + Name
-    id_func = eval(Name.lower() + '_id')
-    _id = id_func(evt)
+    _id = ID_FUNCTIONS[Name](evt)
 
     return addUpdateDirective(ObjectMap(
         modname=module,
@@ -356,8 +437,7 @@ def cinder_objmap(evt, Name):
     """ Create an object map of type Name. Name must be proper module name.
     """
     module = 'ZenPacks.zenoss.OpenStackInfrastructure.' + Name
-    id_func = eval(Name.lower() + '_id')
-    _id = id_func(evt)
+    _id = ID_FUNCTIONS[Name](evt)
 
     return addUpdateDirective(ObjectMap(
         modname=module,
@@ -540,6 +620,18 @@ def instance_unrescue(evt):
 # FloatingIp
 # -----------------------------------------------------------------------------
 
+FLOATINGIP_TRAITMAP = compile_traitmap({
+    'fixed_ip_address': ['fixed_ip_address'],
+    'floating_ip_address': ['floating_ip_address'],
+    'id': ['floatingipId'],
+    'resource_id': ['floatingipId'],
+    'status': ['status'],
+    # See: _apply_neutron_traits: set_tenant
+    # _apply_trait_rel:  set_network, set_port, set_router,
+    # set_network(floating_network_id)
+})
+
+
 def floatingip_create(evt):
     objmap = floatingip_update(evt)
     if objmap:
@@ -553,19 +645,8 @@ def floatingip_update(evt):
         LOG.info("Unable to identify floatingip component from event: %s" % evt)
         return None
 
-    traitmap = {
-        'fixed_ip_address': ['fixed_ip_address'],
-        'floating_ip_address': ['floating_ip_address'],
-        'id': ['floatingipId'],
-        'resource_id': ['floatingipId'],
-        'status': ['status'],
-        # See: _apply_neutron_traits: set_tenant
-        # _apply_trait_rel:  set_network, set_port, set_router,
-        # set_network(floating_network_id)
-    }
-
     objmap = neutron_objmap(evt, "FloatingIp")
-    _apply_neutron_traits(evt, objmap, traitmap)
+    _apply_neutron_traits(evt, objmap, FLOATINGIP_TRAITMAP)
 
     _apply_trait_rel(evt, objmap, 'trait_floating_network_id', 'network')
     _apply_trait_rel(evt, objmap, 'trait_router_id', 'router')
@@ -586,6 +667,18 @@ def floatingip_delete_end(evt):
 # Network Event Functions
 # -----------------------------------------------------------------------------
 
+NETWORK_TRAITMAP = compile_traitmap({
+    'admin_state_up': ['admin_state_up'],
+    'id': ['netId'],
+    'resource_id': ['netId'],
+    'name': ['title'],
+    'provider_network_type': ['netType'],
+    'router_external': ['netExternal'],
+    'status': ['netStatus'],
+    # See: _apply_neutron_traits: set_tenant
+})
+
+
 def network_create(evt):
     objmap = network_update(evt)
     if objmap:
@@ -599,19 +692,8 @@ def network_update(evt):
         LOG.info("Unable to identify network component from event: %s" % evt)
         return None
 
-    traitmap = {
-        'admin_state_up': ['admin_state_up'],
-        'id': ['netId'],
-        'resource_id': ['netId'],
-        'name': ['title'],
-        'provider_network_type': ['netType'],
-        'router_external': ['netExternal'],
-        'status': ['netStatus'],
-        # See: _apply_neutron_traits: set_tenant
-    }
-
     objmap = neutron_objmap(evt, "Network")
-    _apply_neutron_traits(evt, objmap, traitmap)
+    _apply_neutron_traits(evt, objmap, NETWORK_TRAITMAP)
     return objmap
 
 
@@ -628,6 +710,19 @@ def network_delete_end(evt):
 # Port Event Functions
 # -----------------------------------------------------------------------------
 
+PORT_TRAITMAP = compile_traitmap({
+    'admin_state_up': ['admin_state_up'],
+    'binding_vif_type': ['vif_type'],
+    'device_owner': ['device_owner'],
+    'id': ['portId'],
+    'resource_id': ['portId'],
+    'mac_address': ['mac_address'],
+    'name': ['title'],
+    'status': ['status'],
+    # See: _apply_neutron_traits: set_tenant, set_network
+})
+
+
 def port_create(evt):
     objmap = port_update(evt)
     if objmap:
@@ -641,20 +736,8 @@ def port_update(evt):
         LOG.info("Unable to identify port component from event: %s" % evt)
         return None
 
-    traitmap = {
-        'admin_state_up': ['admin_state_up'],
-        'binding_vif_type': ['vif_type'],
-        'device_owner': ['device_owner'],
-        'id': ['portId'],
-        'resource_id': ['portId'],
-        'mac_address': ['mac_address'],
-        'name': ['title'],
-        'status': ['status'],
-        # See: _apply_neutron_traits: set_tenant, set_network
-    }
-
     objmap = neutron_objmap(evt, "Port")
-    _apply_neutron_traits(evt, objmap, traitmap)
+    _apply_neutron_traits(evt, objmap, PORT_TRAITMAP)
     _apply_trait_rel(evt, objmap, 'trait_network_id', 'network')
 
     if 'trait_device_id' in evt and 'trait_device_owner' in evt:
@@ -664,7 +747,7 @@ def port_update(evt):
 
     # get subnets and fixed_ips
     if 'trait_fixed_ips' in evt:
-        port_fips = ast.literal_eval(evt['trait_fixed_ips'])
+        port_fips = parse_trait_literal(evt['trait_fixed_ips'])
         _subnets = get_subnets_from_fixedips(port_fips)
         port_subnets = [prepId('subnet-{}'.format(x)) for x in _subnets]
         port_fixedips = get_port_fixedips(port_fips)
@@ -683,6 +766,18 @@ def port_delete_end(evt):
 # Router Event Functions
 # -----------------------------------------------------------------------------
 
+ROUTER_TRAITMAP = compile_traitmap({
+    'admin_state_up': ['admin_state_up'],
+    'id': ['routerId'],
+    'resource_id': ['routerId'],
+    'routes': ['routes'],
+    'status': ['status'],
+    'name': ['title'],
+    # See: _apply_router_gateway_info:
+    # (gateways, set_subnets, set_network)
+})
+
+
 def router_create(evt):
     objmap = router_update(evt)
     if objmap:
@@ -696,19 +791,8 @@ def router_update(evt):
         LOG.info("Unable to identify router component from event: %s" % evt)
         return None
 
-    traitmap = {
-        'admin_state_up': ['admin_state_up'],
-        'id': ['routerId'],
-        'resource_id': ['routerId'],
-        'routes': ['routes'],
-        'status': ['status'],
-        'name': ['title'],
-        # See: _apply_router_gateway_info:
-        # (gateways, set_subnets, set_network)
-    }
-
     objmap = neutron_objmap(evt, "Router")
-    _apply_neutron_traits(evt, objmap, traitmap)
+    _apply_neutron_traits(evt, objmap, ROUTER_TRAITMAP)
     _apply_router_gateway_info(evt, objmap)
     return objmap
 
@@ -722,6 +806,17 @@ def router_delete_end(evt):
 # Subnet Event Functions
 # -----------------------------------------------------------------------------
 
+SUBNET_TRAITMAP = compile_traitmap({
+    'cidr': ['cidr'],
+    'gateway_ip': ['gateway_ip'],
+    'id': ['subnetId'],
+    'name': ['title'],
+    'network_id': ['subnetId'],
+    # See: _apply_dns_info(): dns_nameservers
+    # _apply_neutron_traits: set_tenant, set_network,
+})
+
+
 def subnet_create(evt):
     objmap = subnet_update(evt)
     if objmap:
@@ -735,19 +830,9 @@ def subnet_update(evt):
         LOG.info("Unable to identify subnet component from event: %s" % evt)
         return None
 
-    traitmap = {
-        'cidr': ['cidr'],
-        'gateway_ip': ['gateway_ip'],
-        'id': ['subnetId'],
-        'name': ['title'],
-        'network_id': ['subnetId'],
-        # See: _apply_dns_info(): dns_nameservers
-        # _apply_neutron_traits: set_tenant, set_network,
-    }
-
     objmap = neutron_objmap(evt, "Subnet")
     _apply_dns_info(evt, objmap)
-    _apply_neutron_traits(evt, objmap, traitmap)
+    _apply_neutron_traits(evt, objmap, SUBNET_TRAITMAP)
     _apply_trait_rel(evt, objmap, 'trait_network_id', 'network')
     return objmap
 
@@ -836,6 +921,19 @@ def volsnapshot_delete_end(evt):
     return objmap
 
 
+# The id function for each component type (by module name) that
+# neutron_objmap and cinder_objmap create objmaps for.
+ID_FUNCTIONS = {
+    'FloatingIp': floatingip_id,
+    'Network': network_id,
+    'Port': port_id,
+    'Router': router_id,
+    'Subnet': subnet_id,
+    'Volume': volume_id,
+    'VolSnapshot': volsnapshot_id,
+}
+
+
 # For each event type, associate it with the appropriate mapper function.
 # A mapper function is expected to take an event and return one or more objmaps.
 # it may also modify the event, for instance by add missing information
@@ -935,28 +1033,62 @@ MAPPERS = {
 }
 
 
+# Event type prefixes, and the function used to identify the affected
+# component for events of that type.
+COMPONENT_ID_PREFIXES = (
+    ('compute.instance', instance_id),
+    ('floatingip', floatingip_id),
+    ('network', network_id),
+    ('port', port_id),
+    ('router', router_id),
+    ('subnet', subnet_id),
+    ('volume', volume_id),
+    ('snapshot', volsnapshot_id),
+)
+
+# (mapper function, id function) for each event type that has been seen,
+# so that the prefixes above only have to be checked once per event type.
+_EVENT_DISPATCH = {}
+_EVENT_DISPATCH_SIZE = 1000
+
+
+def event_dispatch(event_type):
+    # given an event type, return a tuple of the mapper function and
+    # component id function for it (either of which may be None)
+
+    try:
+        return _EVENT_DISPATCH[event_type]
+    except KeyError:
+        pass
+
+    idfunc = None
+    if event_type:
+        for prefix, func in COMPONENT_ID_PREFIXES:
+            if event_type.startswith(prefix):
+                idfunc = func
+                break
+
+    dispatch = (MAPPERS.get(event_type), idfunc)
+
+    with _CACHE_LOCK:
+        if len(_EVENT_DISPATCH) >= _EVENT_DISPATCH_SIZE:
+            _EVENT_DISPATCH.clear()
+        _EVENT_DISPATCH[event_type] = dispatch
+
+    return dispatch
+
+
 def event_is_mapped(evt):
-    return evt.get('openstack_event_type') in MAPPERS
+    return event_dispatch(evt.get('openstack_event_type'))[0] is not None
 
 
 def event_component_id(evt):
     # given an event (evt), return the affected zenoss component,
     # if possible, or None if it can not be identified.
 
-    identifiers = {
-        'compute.instance': instance_id,
-        'floatingip': floatingip_id,
-        'network': network_id,
-        'port': port_id,
-        'router': router_id,
-        'subnet': subnet_id,
-        'volume': volume_id,
-        'snapshot': volsnapshot_id
-    }
-
-    for prefix, idfunc in identifiers.iteritems():
-        if evt['openstack_event_type'].startswith(prefix):
-            return idfunc(evt)
+    idfunc = event_dispatch(evt['openstack_event_type'])[1]
+    if idfunc:
+        return idfunc(evt)
 
 
 def map_event(evt):
@@ -966,9 +1098,6 @@ def map_event(evt):
     # and one "trait_<trait name>" for all each of the traits in the ceilometer
     # event.
 
-    event_type = evt.get('openstack_event_type')
-
-    if event_type and event_type in MAPPERS:
-        return MAPPERS[event_type](evt)
-
-
+    mapper = event_dispatch(evt.get('openstack_event_type'))[0]
+    if mapper:
+        return mapper(evt)
@@ -0,0 +1,296 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2026, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+"""Durable, append-only journal.
+
+Holds a queue of records (any picklable objects) on disk, so that they
+survive a restart of the process which queued them.
+
+"""
+
+import cPickle
+import errno
+import logging
+import mmap
+import os
+import re
+import shutil
+import struct
+import zlib
+
+log = logging.getLogger('zen.OpenStack.journal')
+
+# Each record is written as its length and CRC32, followed by its pickle.
+HEADER = struct.Struct('<II')
+
+SEGMENT_NAME = '%010d.seg'
+SEGMENT_RE = re.compile(r'^(\d{10})\.seg$')
+POSITION_NAME = 'position'
+
+
+def read_records(buf, offset):
+    """
+    Yield (data, end offset) for each record in buf (a segment's contents)
+    from offset, stopping at the end of the buffer, or at the first record
+    which is incomplete or fails its checksum.
+    """
+
+    size = len(buf)
+    while offset + HEADER.size <= size:
+        length, crc = HEADER.unpack_from(buf, offset)
+        start = offset + HEADER.size
+        end = start + length
+        if end > size:
+            return
+
+        data = buf[start:end]
+        if zlib.crc32(data) & 0xffffffff != crc:
+            return
+
+        yield data, end
+        offset = end
+
+
+class Journal(object):
+    """
+    A queue of records, stored in `directory` as a series of segment files
+    of up to `segment_size` bytes each, which are appended to and then read
+    back in order.  Segments are memory-mapped when they are read.
+
+    The position of the next record to be read is kept in a separate file,
+    and segments are deleted once every record in them has been read, so
+    the journal only takes up as much space as its unread records (up to
+    `max_size` bytes, if set).
+
+    Records are checksummed.  A record which was only partly written, say
+    because the process was killed part way through appending it, is
+    discarded, along with anything after it in its segment.
+    """
+
+    def __init__(self, directory, segment_size=64 * 1024 * 1024, max_size=None):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.max_size = max_size
+
+        try:
+            os.makedirs(directory)
+        except OSError, e:
+            if e.errno != errno.EEXIST:
+                raise
+
+        self.segments = sorted(
+            int(match.group(1)) for match in (
+                SEGMENT_RE.match(name) for name in os.listdir(directory))
+            if match)
+
+        self.read_segment, self.read_offset = self._load_position()
+
+        # Remove any segments which have already been read completely.
+        while self.segments and self.segments[0] < self.read_segment:
+            os.remove(self._path(self.segments.pop(0)))
+        if not self.segments or self.segments[0] != self.read_segment:
+            self.read_offset = 0
+
+        self.length = 0
+        self.size = 0
+        for number in self.segments:
+            offset = self.read_offset if number == self.read_segment else 0
+            count, end, file_size = self._scan(number, offset)
+
+            if end < file_size:
+                if number == self.segments[-1]:
+                    log.warning("Discarding %d bytes of incomplete records from %s",
+                                file_size - end, self._path(number))
+                    with open(self._path(number), 'r+b') as f:
+                        f.truncate(end)
+                else:
+                    log.warning("Discarding %d bytes of corrupted records from %s",
+                                file_size - end, self._path(number))
+
+            self.length += count
+            self.size += end - offset
+
+        if self.segments:
+            self.read_segment = self.segments[0]
+            self._open_writer(self.segments[-1])
+        else:
+            self._new_segment()
+
+    def __len__(self):
+        return self.length
+
+    def _path(self, number):
+        return os.path.join(self.directory, SEGMENT_NAME % number)
+
+    def _load_position(self):
+        try:
+            with open(os.path.join(self.directory, POSITION_NAME)) as f:
+                segment, offset = f.read().split()
+                return int(segment), int(offset)
+        except (IOError, ValueError):
+            return 0, 0
+
+    def _save_position(self):
+        path = os.path.join(self.directory, POSITION_NAME)
+        with open(path + '.tmp', 'w') as f:
+            f.write('%d %d\n' % (self.read_segment, self.read_offset))
+        os.rename(path + '.tmp', path)
+
+    def _scan(self, number, offset):
+        # Return the number of valid records in a segment from offset, the
+        # offset at which they end, and the size of the segment.
+        with open(self._path(number), 'rb') as f:
+            file_size = os.fstat(f.fileno()).st_size
+            if file_size <= offset:
+                return 0, file_size, file_size
+
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                count, end = 0, offset
+                for data, end in read_records(buf, offset):
+                    count += 1
+                return count, end, file_size
+            finally:
+                buf.close()
+
+    def _open_writer(self, number):
+        self.write_segment = number
+        self.writer = open(self._path(number), 'ab')
+        self.write_offset = os.path.getsize(self._path(number))
+
+    def _new_segment(self):
+        number = self.segments[-1] + 1 if self.segments else self.read_segment + 1
+        self.segments.append(number)
+        if len(self.segments) == 1:
+            self.read_segment, self.read_offset = number, 0
+        self._open_writer(number)
+
+    def full(self):
+        return bool(self.max_size) and self.size >= self.max_size
+
+    def append(self, record):
+        # Returns False if the journal is full.
+        if self.full():
+            return False
+
+        data = cPickle.dumps(record, cPickle.HIGHEST_PROTOCOL)
+        if self.write_offset and self.write_offset + HEADER.size + len(data) > self.segment_size:
+            self.writer.close()
+            self._new_segment()
+
+        self.writer.write(HEADER.pack(len(data), zlib.crc32(data) & 0xffffffff))
+        self.writer.write(data)
+        self.write_offset += HEADER.size + len(data)
+        self.length += 1
+        self.size += HEADER.size + len(data)
+        return True
+
+    def prepend(self, records):
+        """
+        Write records ahead of every unread record, so that they are the
+        next to be read.  The records are not subject to max_size.
+
+        The current read segment is rewritten, as the records followed by
+        its unread records.
+        """
+
+        if not records:
+            return
+
+        self.writer.flush()
+        number = self.read_segment
+        path = self._path(number)
+
+        size = 0
+        with open(path + '.tmp', 'wb') as f:
+            for record in records:
+                data = cPickle.dumps(record, cPickle.HIGHEST_PROTOCOL)
+                f.write(HEADER.pack(len(data), zlib.crc32(data) & 0xffffffff))
+                f.write(data)
+                size += HEADER.size + len(data)
+
+            with open(path, 'rb') as old:
+                old.seek(self.read_offset)
+                shutil.copyfileobj(old, f)
+
+            f.flush()
+            os.fsync(f.fileno())
+
+        # Should the process be killed before the segment is replaced,
+        # its records are read again, rather than being skipped over.
+        self.read_offset = 0
+        self._save_position()
+        os.rename(path + '.tmp', path)
+
+        if number == self.write_segment:
+            self.writer.close()
+            self._open_writer(number)
+
+        self.length += len(records)
+        self.size += size
+
+    def popbatch(self, size):
+        """
+        Remove and return (up to) the first size records.
+        """
+
+        records = []
+        if not self.length:
+            return records
+
+        self.writer.flush()
+        while len(records) < size and self.length > len(records):
+            number = self.read_segment
+            start = self.read_offset
+
+            with open(self._path(number), 'rb') as f:
+                file_size = os.fstat(f.fileno()).st_size
+                if start < file_size:
+                    buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                    try:
+                        for data, end in read_records(buf, start):
+                            records.append(cPickle.loads(data))
+                            self.read_offset = end
+                            if len(records) >= size:
+                                break
+                    finally:
+                        buf.close()
+
+            self.size -= self.read_offset - start
+            if number == self.write_segment:
+                break
+
+            if len(records) < size or self.read_offset >= file_size:
+                # This segment has been read completely (or the rest of it
+                # is unreadable), so is no longer needed.
+                os.remove(self._path(number))
+                self.segments.pop(0)
+                self.read_segment, self.read_offset = self.segments[0], 0
+
+        self.length -= len(records)
+        if not self.length and self.write_offset:
+            # Everything has been read, so start a new segment and remove
+            # the current one, rather than letting it grow.
+            self.writer.close()
+            self._new_segment()
+            self.read_segment, self.read_offset = self.write_segment, 0
+            os.remove(self._path(self.segments.pop(0)))
+            self.size = 0
+
+        self._save_position()
+        return records
+
+    def flush(self):
+        self.writer.flush()
+
+    def close(self):
+        self.writer.flush()
+        os.fsync(self.writer.fileno())
+        self.writer.close()
+        self._save_position()
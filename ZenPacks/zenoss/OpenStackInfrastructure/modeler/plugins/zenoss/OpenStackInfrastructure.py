@@ -22,9 +22,10 @@ import itertools
 import json
 import os
 import re
+import time
 from urlparse import urlparse
 
-from twisted.internet.defer import inlineCallbacks, returnValue
+from twisted.internet.defer import DeferredList, inlineCallbacks, returnValue
 from twisted.internet.error import ConnectionRefusedError, TimeoutError
 
 from Products.DataCollector.plugins.CollectorPlugin import PythonPlugin
@@ -90,6 +91,18 @@ def getHostOrgComponent(host_id, results):
     return results.get('process_region_id')
 
 
+def gather(deferreds):
+    """
+    Return a Deferred which fires with a list of the results of deferreds,
+    in order, once they have all succeeded, or fails as soon as any of them
+    does, with its failure.
+    """
+    d = DeferredList(list(deferreds), fireOnOneErrback=True, consumeErrors=True)
+    d.addCallback(lambda results: [result for success, result in results])
+    d.addErrback(lambda failure: failure.value.subFailure)
+    return d
+
+
 def getServiceZoneNameId(region_name, service):
     """Get zone from service.
 
@@ -1341,6 +1354,7 @@ class OpenStackInfrastructure(PythonPlugin):
 
         LOG.debug("api_call: %s", debug_string)
 
+        start = time.time()
         try:
             result = yield method(**kwargs)
 
@@ -1403,6 +1417,20 @@ class OpenStackInfrastructure(PythonPlugin):
             else:
                 returnValue(result)
 
+        finally:
+            LOG.debug("api_call: %s took %.3f seconds", debug_string, time.time() - start)
+
+    @inlineCallbacks
+    def api_call_or_single(self, description, method, single_method, key):
+        result = yield self.api_call(method, key)
+
+        # Retry as single in case where we don't use administrator account.
+        if not result:
+            LOG.debug("API returned no data for %s: Re-trying as single tenant.", description)
+            result = yield self.api_call(single_method, key)
+
+        returnValue(result)
+
     @inlineCallbacks
     def collect(self, device, unused):
 
@@ -1430,121 +1458,44 @@ class OpenStackInfrastructure(PythonPlugin):
         neutron = NeutronClient(session_manager=sm)
         cinder = CinderClient(session_manager=sm)
 
+        start = time.time()
         results = {}
-        results['nova_url'] = yield self.api_call(nova.get_url, None)
-        results['tenants'] = yield self.api_call(keystone.tenants, 'tenants')
-        results['flavors'] = yield self.api_call(nova.flavors, 'flavors', is_public=True)
 
-        private_flavors = yield self.api_call(nova.flavors, 'flavors', is_public=False)
-        for flavor in private_flavors:
-            if flavor not in results['flavors']:
-                results['flavors'].append(flavor)
-
-        results['images'] = yield self.api_call(nova.images, 'images')
-        results['hypervisors'] = yield self.api_call(nova.hypervisorservers, 'hypervisors', hypervisor_match='%')
-        results['hypervisors_detailed'] = yield self.api_call(nova.hypervisorsdetailed, 'hypervisors')
-
-        # Get hypervisor details for each individual hypervisor
-        results['hypervisor_details'] = {}
-        for hypervisor in results['hypervisors']:
-            hypervisor_detail_id = yield self.api_call(nova.hypervisor_detail_id,
-                                                       'hypervisor',
-                                                       hypervisor_id=hypervisor['id'])
-            hypervisor_id = prepId("hypervisor-{0}".format(hypervisor['id']))
-            results['hypervisor_details'][hypervisor_id] = hypervisor_detail_id
-
-        results['servers'] = yield self.api_call(nova.servers, 'servers')
-        # Retry as single in case where we don't use administrator account.
-        if not results['servers']:
-            LOG.debug("API returned no data for 'servers': Re-trying as single tenant.")
-            results['servers'] = yield self.api_call(nova.servers_single, 'servers')
-        results['services'] = yield self.api_call(nova.services, 'services')
-        results['agents'] = yield self.api_call(neutron.agents, 'agents')
-
-        # ---------------------------------------------------------------------
-        # Insert the l3_agents -> (routers, networks, subnets, gateways) data
-        # ---------------------------------------------------------------------
-        for _agent in results['agents']:
-            _agent['l3_agent_routers'] = []
-            _routers = set()
-            _subnets = set()
-            _gateways = set()
-            _networks = set()
-
-            if _agent['agent_type'].lower() == 'l3 agent':
-                try:
-                    router_data = yield self.api_call(neutron.agent_l3_routers, None, agent_id=str(_agent['id']))
-                except Exception, e:
-                    LOG.warning("Unable to determine neutron URL for " +
-                                "l3 router agent discovery: %s" % e)
-                    continue
-
-                for r in router_data['routers']:
-                    _routers.add(r.get('id'))
-                    (net, snets, gws) = \
-                        getNetSubnetsGws_from_GwInfo(r['external_gateway_info'])
-                    if net: _networks.add(net)
-                    _subnets = _subnets.union(snets)
-                    _gateways = _gateways.union(gws)
-
-                _agent['l3_agent_networks'] = list(_networks)
-                _agent['l3_agent_subnets'] = list(_subnets)
-                _agent['l3_agent_gateways'] = list(_gateways)  # Not used yet
-                _agent['l3_agent_routers'] = list(_routers)
-
-        # ---------------------------------------------------------------------
-        # Insert the DHCP agents-subnets info
-        # ---------------------------------------------------------------------
-        for _agent in results['agents']:
-            _agent['dhcp_agent_subnets'] = []
-            _subnets = []
-            _networks = []
-
-            if _agent['agent_type'].lower() == 'dhcp agent':
-                try:
-                    dhcp_data = yield self.api_call(neutron.agent_dhcp_networks, None, agent_id=str(_agent['id']))
-                except Exception, e:
-                    LOG.warning("Unable to determine neutron URL for " +
-                                "dhcp agent discovery: %s" % e)
-                    continue
-
-                for network in dhcp_data['networks']:
-                    _networks.append(network.get('id'))
-                    for subnet in network['subnets']:
-                        _subnets.append(subnet)
-
-                _agent['dhcp_agent_subnets'] = _subnets
-                _agent['dhcp_agent_networks'] = _networks
-
-        results['networks'] = yield self.api_call(neutron.networks, 'networks')
-        results['subnets'] = yield self.api_call(neutron.subnets, 'subnets')
-        results['routers'] = yield self.api_call(neutron.routers, 'routers')
-        results['ports'] = yield self.api_call(neutron.ports, 'ports')
-        results['floatingips'] = yield self.api_call(neutron.floatingips, 'floatingips')
-        results['cinder_url'] = yield self.api_call(cinder.get_url, None)
-        results['volumes'] = yield self.api_call(cinder.volumes, 'volumes')
-        # Retry as single in case where we don't use administrator account.
-        if not results['volumes']:
-            LOG.debug("API returned no data for 'volumes': Re-trying as single tenant.")
-            results['volumes'] = yield self.api_call(cinder.volumes_single, 'volumes')
-
-        results['volumetypes'] = yield self.api_call(cinder.volumetypes, 'volume_types')
-        results['volsnapshots'] = yield self.api_call(cinder.volumesnapshots, 'snapshots')
-        # Retry as single in case where we don't use administrator account.
-        if not results['volsnapshots']:
-            LOG.debug("API returned no data for Volume Snapshots: Re-trying as single tenant.")
-            results['volsnapshots'] = yield self.api_call(cinder.volumesnapshots_single, 'snapshots')
-        results['cinder_services'] = yield self.api_call(cinder.services, 'services')
-        results['volume_pools'] = yield self.api_call(cinder.pools, 'pools')
+        # The session authenticates on its first call, so that is made on
+        # its own.  The rest are made in parallel, other than those which
+        # depend on the results of others, up to the number of concurrent
+        # requests that the session allows (MAX_PARALLEL).
+        results['nova_url'] = yield self.api_call(nova.get_url, None)
 
-        results['quotas'] = []
-        for tenant in results['tenants']:
-            quota_set = yield self.api_call(cinder.quotas, 'quota_set',
-                                            tenant=tenant['id'],
-                                            usage=False)
-            # Skip quota_sets that are empty (and possibly [] instead of {})
-            if quota_set:
-                results['quotas'].append(quota_set)
+        calls = [
+            ('images', self.api_call(nova.images, 'images')),
+            ('hypervisors_detailed', self.api_call(nova.hypervisorsdetailed, 'hypervisors')),
+            ('servers', self.api_call_or_single("'servers'", nova.servers, nova.servers_single, 'servers')),
+            ('services', self.api_call(nova.services, 'services')),
+            ('networks', self.api_call(neutron.networks, 'networks')),
+            ('subnets', self.api_call(neutron.subnets, 'subnets')),
+            ('routers', self.api_call(neutron.routers, 'routers')),
+            ('ports', self.api_call(neutron.ports, 'ports')),
+            ('floatingips', self.api_call(neutron.floatingips, 'floatingips')),
+            ('cinder_url', self.api_call(cinder.get_url, None)),
+            ('volumes', self.api_call_or_single("'volumes'", cinder.volumes, cinder.volumes_single, 'volumes')),
+            ('volumetypes', self.api_call(cinder.volumetypes, 'volume_types')),
+            ('volsnapshots', self.api_call_or_single("Volume Snapshots", cinder.volumesnapshots, cinder.volumesnapshots_single, 'snapshots')),
+            ('cinder_services', self.api_call(cinder.services, 'services')),
+            ('volume_pools', self.api_call(cinder.pools, 'pools')),
+        ]
+
+        values = yield gather([d for name, d in calls] + [
+            self.collect_tenants(keystone, cinder, results),
+            self.collect_flavors(nova, results),
+            self.collect_hypervisors(nova, results),
+            self.collect_agents(neutron, results),
+        ])
+
+        for (name, d), value in zip(calls, values):
+            results[name] = value
+
+        LOG.debug("collect: API calls took %.3f seconds", time.time() - start)
 
         results['zOpenStackNovaApiHosts'], host_errors = filter_FQDNs(device.zOpenStackNovaApiHosts)
         if host_errors:
@@ -1578,6 +1529,113 @@ class OpenStackInfrastructure(PythonPlugin):
 
         returnValue(results)
 
+    @inlineCallbacks
+    def collect_tenants(self, keystone, cinder, results):
+        results['tenants'] = yield self.api_call(keystone.tenants, 'tenants')
+
+        quota_sets = yield gather(
+            self.api_call(cinder.quotas, 'quota_set', tenant=tenant['id'], usage=False)
+            for tenant in results['tenants'])
+
+        # Skip quota_sets that are empty (and possibly [] instead of {})
+        results['quotas'] = [quota_set for quota_set in quota_sets if quota_set]
+
+    @inlineCallbacks
+    def collect_flavors(self, nova, results):
+        flavors, private_flavors = yield gather([
+            self.api_call(nova.flavors, 'flavors', is_public=True),
+            self.api_call(nova.flavors, 'flavors', is_public=False)])
+
+        results['flavors'] = flavors
+        for flavor in private_flavors:
+            if flavor not in results['flavors']:
+                results['flavors'].append(flavor)
+
+    @inlineCallbacks
+    def collect_hypervisors(self, nova, results):
+        results['hypervisors'] = yield self.api_call(nova.hypervisorservers, 'hypervisors', hypervisor_match='%')
+
+        # Get hypervisor details for each individual hypervisor
+        hypervisor_details = yield gather(
+            self.api_call(nova.hypervisor_detail_id,
+                          'hypervisor',
+                          hypervisor_id=hypervisor['id'])
+            for hypervisor in results['hypervisors'])
+
+        results['hypervisor_details'] = {}
+        for hypervisor, hypervisor_detail_id in zip(results['hypervisors'], hypervisor_details):
+            hypervisor_id = prepId("hypervisor-{0}".format(hypervisor['id']))
+            results['hypervisor_details'][hypervisor_id] = hypervisor_detail_id
+
+    @inlineCallbacks
+    def collect_agents(self, neutron, results):
+        results['agents'] = yield self.api_call(neutron.agents, 'agents')
+
+        yield gather(itertools.chain(
+            (self.collect_l3_agent(neutron, _agent) for _agent in results['agents']),
+            (self.collect_dhcp_agent(neutron, _agent) for _agent in results['agents'])))
+
+    @inlineCallbacks
+    def collect_l3_agent(self, neutron, _agent):
+        # ---------------------------------------------------------------------
+        # Insert the l3_agents -> (routers, networks, subnets, gateways) data
+        # ---------------------------------------------------------------------
+        _agent['l3_agent_routers'] = []
+        _routers = set()
+        _subnets = set()
+        _gateways = set()
+        _networks = set()
+
+        if _agent['agent_type'].lower() != 'l3 agent':
+            return
+
+        try:
+            router_data = yield self.api_call(neutron.agent_l3_routers, None, agent_id=str(_agent['id']))
+        except Exception, e:
+            LOG.warning("Unable to determine neutron URL for " +
+                        "l3 router agent discovery: %s" % e)
+            return
+
+        for r in router_data['routers']:
+            _routers.add(r.get('id'))
+            (net, snets, gws) = \
+                getNetSubnetsGws_from_GwInfo(r['external_gateway_info'])
+            if net: _networks.add(net)
+            _subnets = _subnets.union(snets)
+            _gateways = _gateways.union(gws)
+
+        _agent['l3_agent_networks'] = list(_networks)
+        _agent['l3_agent_subnets'] = list(_subnets)
+        _agent['l3_agent_gateways'] = list(_gateways)  # Not used yet
+        _agent['l3_agent_routers'] = list(_routers)
+
+    @inlineCallbacks
+    def collect_dhcp_agent(self, neutron, _agent):
+        # ---------------------------------------------------------------------
+        # Insert the DHCP agents-subnets info
+        # ---------------------------------------------------------------------
+        _agent['dhcp_agent_subnets'] = []
+        _subnets = []
+        _networks = []
+
+        if _agent['agent_type'].lower() != 'dhcp agent':
+            return
+
+        try:
+            dhcp_data = yield self.api_call(neutron.agent_dhcp_networks, None, agent_id=str(_agent['id']))
+        except Exception, e:
+            LOG.warning("Unable to determine neutron URL for " +
+                        "dhcp agent discovery: %s" % e)
+            return
+
+        for network in dhcp_data['networks']:
+            _networks.append(network.get('id'))
+            for subnet in network['subnets']:
+                _subnets.append(subnet)
+
+        _agent['dhcp_agent_subnets'] = _subnets
+        _agent['dhcp_agent_networks'] = _networks
+
     @inlineCallbacks
     def preprocess_hosts(self, device, results):
         # spin through the collected data, pre-processing all the fields
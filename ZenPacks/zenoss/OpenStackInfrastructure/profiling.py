@@ -0,0 +1,142 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2026, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+"""On-demand profiling support.
+
+Profiles the reactor thread of the running process for a number of
+seconds, so that performance problems can be investigated under real
+load without restarting it.
+
+"""
+
+import cProfile
+from collections import defaultdict
+import logging
+import os
+import pstats
+from StringIO import StringIO
+import sys
+import threading
+import time
+
+from twisted.internet import reactor, task, threads
+
+log = logging.getLogger('zen.OpenStack.profiling')
+
+MAX_SECONDS = 300
+SORT_KEYS = ('cumulative', 'time', 'calls')
+
+
+class ProfilerBusy(Exception):
+    """ Raised when a profile is requested while another is running. """
+
+
+class Profiler(object):
+    """
+    Runs one profile of the reactor thread at a time, either with
+    cProfile (profile()) or by sampling its stack (sample()).
+
+    Both must be called from the reactor thread, and return a Deferred
+    which fires with the results, as text, after the given number of
+    seconds.
+    """
+
+    def __init__(self):
+        self.running = False
+
+    def _start(self, seconds):
+        if self.running:
+            raise ProfilerBusy("A profile is already running")
+        if not 0 < seconds <= MAX_SECONDS:
+            raise ValueError("seconds must be between 1 and %d" % MAX_SECONDS)
+
+        log.info("Profiling reactor thread for %d seconds", seconds)
+        self.running = True
+
+    def _finish(self, result):
+        self.running = False
+        return result
+
+    def profile(self, seconds, sort='cumulative', limit=100):
+        """
+        Profile the reactor thread with cProfile, returning pstats output
+        for the `limit` most expensive functions, by `sort`.
+        """
+
+        if sort not in SORT_KEYS:
+            raise ValueError("sort must be one of %s" % ", ".join(SORT_KEYS))
+        self._start(seconds)
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+        d = task.deferLater(reactor, seconds, profiler.disable)
+        d.addCallback(lambda _: format_stats(profiler, sort, limit))
+        d.addBoth(self._finish)
+        return d
+
+    def sample(self, seconds, interval=0.005):
+        """
+        Sample the reactor thread's stack every `interval` seconds, from
+        another thread, returning the collapsed stacks (see sample_stacks).
+
+        Unlike profile(), this does not slow down the reactor thread.
+        """
+
+        self._start(seconds)
+
+        thread_id = threading.current_thread().ident
+        d = threads.deferToThread(sample_stacks, thread_id, seconds, interval)
+        d.addBoth(self._finish)
+        return d
+
+
+def format_stats(profiler, sort, limit):
+    output = StringIO()
+    stats = pstats.Stats(profiler, stream=output)
+    stats.sort_stats(sort).print_stats(limit)
+    return output.getvalue()
+
+
+def frame_name(frame):
+    code = frame.f_code
+    return "%s (%s:%d)" % (
+        code.co_name, os.path.basename(code.co_filename), code.co_firstlineno)
+
+
+def collapse_stack(frame):
+    # Return the stack ending in frame as a single line, outermost call first.
+    names = []
+    while frame is not None:
+        names.append(frame_name(frame))
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+def sample_stacks(thread_id, seconds, interval):
+    """
+    Sample the stack of the specified thread every `interval` seconds for
+    `seconds`, and return the number of times each stack was seen, in the
+    collapsed format read by flamegraph.pl:
+
+        main (zenopenstack.py:2347);run (base.py:1280);... 12
+    """
+
+    stacks = defaultdict(int)
+    end = time.time() + seconds
+
+    while time.time() < end:
+        frame = sys._current_frames().get(thread_id)
+        if frame is not None:
+            stacks[collapse_stack(frame)] += 1
+        del frame
+        time.sleep(interval)
+
+    return "".join(
+        "%s %d\n" % (stack, count) for stack, count in sorted(stacks.iteritems()))
@@ -10,11 +10,18 @@
 import logging
 log = logging.getLogger('zen.OpenStack.services.OpenStackConfig')
 
+from collections import namedtuple
+from itertools import chain
+from operator import itemgetter
+import time
+import uuid
+
 from twisted.spread import pb
 
-from Products.ZenCollector.services.config import CollectorConfigService
-from Products.ZenRRD.zencommand import DataPointConfig
+from Acquisition import aq_base
 
+from Products.ZenCollector.services.config import CollectorConfigService
+from Products.ZenHub.PBDaemon import translateError
 from ZenPacks.zenoss.OpenStackInfrastructure.Endpoint import Endpoint
 from ZenPacks.zenoss.OpenStackInfrastructure.datasources.PerfAMQPDataSource import PerfAMQPDataSource
 
@@ -28,12 +35,345 @@ class OpenStackDataSourceConfig(pb.Copyable, pb.RemoteCopy):
     resourceId = None
     meter = None
 
+    # The component's rrdPath and metric metadata, which are the same for
+    # each of its datapoints.
+    rrdPath = None
+    metadata = None
+
     def __init__(self):
+        # As sent, each datapoint's index in the datapoint_table of the
+        # config (or delta) that the datasource came with.  Replaced by
+        # the DataPointSkeletons themselves by resolve_datapoints().
         self.points = []
 
 
+class OpenStackConfigDelta(pb.Copyable, pb.RemoteCopy):
+    """
+    The changes to a device's config since the version identified by a
+    token, as returned by OpenStackConfig.remote_getDatasourceChanges.
+
+    components lists the ids of the components which have been added or
+    changed, and datasources holds all of their datasources.  If full is
+    set, the token could not be used, and datasources holds every one of
+    the device's datasources instead.  Their points refer to entries in
+    datapoint_table, which holds just the entries they refer to.
+    thresholds is always complete.
+    """
+    device = None
+    token = None
+    full = False
+    components = None
+    removed = None
+    datasources = None
+    datapoint_table = None
+    thresholds = None
+
+    def __init__(self):
+        self.components = []
+        self.removed = []
+        self.datasources = []
+        self.datapoint_table = {}
+        self.thresholds = []
+
+
+ComponentConfig = namedtuple(
+    'ComponentConfig', ['signature', 'version', 'datasources', 'thresholds'])
+
+
+class DeviceConfigCache(object):
+    """
+    The datasource and threshold configs of each of a device's components,
+    as last built by OpenStackConfig, along with a signature of what each
+    was built from, so that they are only rebuilt when that changes (or
+    when the context which they were all built in, such as the device's
+    zProperties, does).  The
+    datapoints of the datasources refer to entries in the cache's
+    DataPointTable, which are released when the datasources are replaced
+    or removed.
+
+    The device's config has a version, which is incremented whenever any
+    of its components is added, changed or removed.  Each component records
+    the version in which it last changed, and removed components are
+    remembered (up to max_removed of them), so that the changes since a
+    version can be returned.  Versions are passed to collectors as tokens,
+    which include a random generation, so that a token issued by another
+    instance of the cache is not mistaken for one of this cache's.
+    """
+
+    max_removed = 10000
+
+    def __init__(self):
+        self.generation = uuid.uuid4().hex[:12]
+        self.version = 0
+        self.components = {}
+        self.removed = {}
+        self.context = None
+        self.datapoints = DataPointTable()
+
+        # Removals before this version have been forgotten.
+        self.oldest = 0
+
+    @property
+    def token(self):
+        return '%s:%d' % (self.generation, self.version)
+
+    def version_of(self, token):
+        # Return the version identified by token, or None if it was not
+        # issued by this cache, or is too old to be compared with.
+        try:
+            generation, version = token.split(':')
+            version = int(version)
+        except (AttributeError, ValueError):
+            return None
+
+        if generation != self.generation or not self.oldest <= version <= self.version:
+            return None
+        return version
+
+    def update(self, components, signature, build, context=None):
+        """
+        Bring the cache up to date with components (a dict of the device's
+        components by id), calling build(component) for the (datasources,
+        thresholds) of each one which is new, or whose signature(component)
+        has changed.  If context differs from that of the last update,
+        every component is rebuilt.  Returns the number of components
+        added, changed or removed.
+        """
+
+        version = self.version + 1
+        changed = 0
+        rebuild = context != self.context
+        self.context = context
+
+        for component_id, component in components.iteritems():
+            component_signature = signature(component)
+            entry = self.components.get(component_id)
+            if entry is not None and entry.signature == component_signature and not rebuild:
+                continue
+
+            datasources, thresholds = build(component)
+            self.components[component_id] = ComponentConfig(
+                component_signature, version, datasources, thresholds)
+            self.removed.pop(component_id, None)
+            if entry is not None:
+                # (after the build, so that datapoints which the new
+                # datasources still use are not removed from the table)
+                self.release(entry)
+            changed += 1
+
+        for component_id in set(self.components) - set(components):
+            self.release(self.components.pop(component_id))
+            self.removed[component_id] = version
+            changed += 1
+
+        if changed:
+            self.version = version
+            self.prune()
+
+        return changed
+
+    def release(self, entry):
+        for datasource in entry.datasources:
+            self.datapoints.release(datasource.points)
+
+    def prune(self):
+        if len(self.removed) <= self.max_removed:
+            return
+
+        removed = sorted(self.removed.iteritems(), key=itemgetter(1))
+        forgotten = removed[:len(removed) - self.max_removed // 2]
+        for component_id, version in forgotten:
+            del self.removed[component_id]
+        self.oldest = forgotten[-1][1]
+
+    def datasources(self, component_ids=None):
+        if component_ids is None:
+            component_ids = sorted(self.components)
+        return list(chain.from_iterable(
+            self.components[component_id].datasources for component_id in component_ids))
+
+    def thresholds(self):
+        return list(chain.from_iterable(
+            self.components[component_id].thresholds for component_id in sorted(self.components)))
+
+    def changes_since(self, version):
+        # Return the ids of the components changed and removed since version.
+        changed = sorted(
+            component_id for component_id, entry in self.components.iteritems()
+            if entry.version > version)
+        removed = sorted(
+            component_id for component_id, removed_version in self.removed.iteritems()
+            if removed_version > version)
+        return changed, removed
+
+
+def serial(obj):
+    # The id of the last transaction to change obj.  It is loaded first,
+    # since a ghost (say, one invalidated by another transaction) may
+    # still have the serial from before the change.
+    obj = aq_base(obj)
+    activate = getattr(obj, '_p_activate', None)
+    if activate is not None:
+        activate()
+    return getattr(obj, '_p_serial', None)
+
+
+def zproperty_values(device):
+    # The (id, value) of every zProperty of device, including those it
+    # acquires from its device classes, which thresholds (and datasources)
+    # may refer to.
+    return tuple(device.zenPropertyItems())
+
+
+# The parts of a datasource (and its datapoints) config which come from its
+# template, rather than from the component it is bound to.
+DataSourceSkeleton = namedtuple(
+    'DataSourceSkeleton', ['template', 'datasource', 'meter', 'points'])
+DataPointSkeleton = namedtuple(
+    'DataPointSkeleton', ['id', 'dpName', 'rrdType', 'rrdCreateCommand', 'rrdMin', 'rrdMax'])
+
+
+class TemplateCache(object):
+    """
+    What OpenStackConfig needs from each template, looked up once per
+    template (by path) for the lifetime of the cache, which should be no
+    longer than one config build.
+    """
+
+    def __init__(self, collector):
+        self.collector = collector
+        self.signatures = {}
+        self.skeletons = {}
+
+    def __len__(self):
+        return len(set(self.signatures) | set(self.skeletons))
+
+    def signature(self, template):
+        # The template's path, and the serials of it and its datasources,
+        # datapoints and thresholds.
+        key = template.getPrimaryId()
+        signature = self.signatures.get(key)
+        if signature is None:
+            objects = [template]
+            for ds in template.getRRDDataSources():
+                objects.append(ds)
+                objects.extend(ds.datapoints())
+            objects.extend(template.thresholds())
+
+            signature = self.signatures[key] = (
+                key, tuple(serial(obj) for obj in objects))
+
+        return signature
+
+    def datasources(self, template):
+        # A DataSourceSkeleton for each of the template's enabled
+        # PerfAMQPDataSources.
+        key = template.getPrimaryId()
+        skeletons = self.skeletons.get(key)
+        if skeletons is None:
+            skeletons = self.skeletons[key] = [
+                DataSourceSkeleton(
+                    template=template.id,
+                    datasource=ds.titleOrId(),
+                    meter=ds.meter,
+                    points=[
+                        self.datapoint(dp)
+                        for dp in ds.datapoints()])
+                for ds in template.getRRDDataSources()
+                if ds.enabled and isinstance(ds, PerfAMQPDataSource)]
+
+        return skeletons
+
+    def datapoint(self, dp):
+        rrdCreateCommand = dp.getRRDCreateCommand(self.collector)
+        if isinstance(rrdCreateCommand, list):
+            # (so that the skeleton can be used as a DataPointTable key)
+            rrdCreateCommand = tuple(rrdCreateCommand)
+
+        return DataPointSkeleton(
+            id=dp.id,
+            dpName=dp.name(),
+            rrdType=dp.rrdtype,
+            rrdCreateCommand=rrdCreateCommand,
+            rrdMin=dp.rrdmin,
+            rrdMax=dp.rrdmax)
+
+
+class DataPointTable(object):
+    """
+    The distinct DataPointSkeletons of a device's datasources, each with an
+    index, by which datasource configs refer to them rather than each
+    carrying its own copy.  The entries which a config's datasources refer
+    to are sent (as plain tuples, by index) along with them, and read back
+    with resolve_datapoints().
+
+    Each skeleton is counted once for every datapoint which refers to it,
+    and removed when the last of them is released, its index then being
+    free for reuse.  So an index is only valid for as long as the
+    datasource config holding it is cached.
+    """
+
+    def __init__(self):
+        self.skeletons = []
+        self.counts = []
+        self.indexes = {}
+        self.free = []
+
+    def __len__(self):
+        return len(self.indexes)
+
+    def index(self, skeleton):
+        # Return the index of skeleton, adding a reference to it.
+        index = self.indexes.get(skeleton)
+        if index is None:
+            if self.free:
+                index = self.free.pop()
+                self.skeletons[index] = skeleton
+            else:
+                index = len(self.skeletons)
+                self.skeletons.append(skeleton)
+                self.counts.append(0)
+            self.indexes[skeleton] = index
+
+        self.counts[index] += 1
+        return index
+
+    def release(self, indexes):
+        # Remove a reference to each of indexes (as returned by index()).
+        for index in indexes:
+            self.counts[index] -= 1
+            if not self.counts[index]:
+                del self.indexes[self.skeletons[index]]
+                self.skeletons[index] = None
+                self.free.append(index)
+
+    def table(self, datasources):
+        # The entries which datasources refer to, by index.
+        indexes = set(chain.from_iterable(ds.points for ds in datasources))
+        return dict((index, tuple(self.skeletons[index])) for index in indexes)
+
+
+def resolve_datapoints(datasources, datapoint_table):
+    """
+    Replace the indexes in the points of each of datasources with the
+    DataPointSkeletons in datapoint_table (the table sent with them) that
+    they refer to.  Each skeleton is shared by every datasource using it.
+    """
+
+    skeletons = dict(
+        (index, DataPointSkeleton._make(dp)) for index, dp in datapoint_table.iteritems())
+    for datasource in datasources:
+        datasource.points = tuple(skeletons[i] for i in datasource.points)
+
+
 class OpenStackConfig(CollectorConfigService):
 
+    def __init__(self, dmd, instance):
+        CollectorConfigService.__init__(self, dmd, instance)
+
+        # DeviceConfigCache by device id
+        self.config_cache = {}
+
     def _filterDevice(self, device):
         return (
             isinstance(device, Endpoint) and
@@ -44,60 +384,127 @@ class OpenStackConfig(CollectorConfigService):
         collector = device.getPerformanceServer()
 
         proxy = CollectorConfigService._createDeviceProxy(self, device)
-        proxy.datasources = []
-        proxy.thresholds = []
         proxy.zOpenStackProcessEventTypes = device.zOpenStackProcessEventTypes
         proxy.zOpenStackIncrementalShortLivedSeconds = device.zOpenStackIncrementalShortLivedSeconds
         proxy.zOpenStackIncrementalBlackListSeconds = device.zOpenStackIncrementalBlackListSeconds
         proxy.zOpenStackIncrementalConsolidateSeconds = device.zOpenStackIncrementalConsolidateSeconds
 
-        for component in device.getMonitoredComponents():
-            proxy.datasources += list(
-                self.component_datasources(component, collector))
+        self.prune()
 
-            proxy.thresholds += component.getThresholdInstances(
-                PerfAMQPDataSource.sourcetype)
+        cache = self.update_cache(device, collector)
+        proxy.datasources = cache.datasources()
+        proxy.datapoint_table = cache.datapoints.table(proxy.datasources)
+        proxy.thresholds = cache.thresholds()
+        proxy.config_token = cache.token
 
         return proxy
 
-    def component_datasources(self, component, collector):
-        for template in component.getRRDTemplates():
+    @translateError
+    def remote_getDatasourceChanges(self, device_id, token):
+        """
+        Return an OpenStackConfigDelta of the changes to the device's
+        datasources since the config identified by token (the config_token
+        of the device's config, or the token of a previous delta), or None
+        if the device is not monitored by this collector.
+        """
 
-            # Get all enabled datasources that are PerfAMQPDataSources
-            datasources = [
-                ds for ds in template.getRRDDataSources()
-                if ds.enabled and isinstance(ds, PerfAMQPDataSource)]
+        device = self.dmd.Devices.findDeviceByIdExact(device_id)
+        if device is None or not self._filterDevice(device):
+            self.config_cache.pop(device_id, None)
+            return None
+
+        cache = self.update_cache(device, device.getPerformanceServer())
 
-            device = component.device()
+        delta = OpenStackConfigDelta()
+        delta.device = device_id
+        delta.token = cache.token
+        delta.thresholds = cache.thresholds()
 
-            for ds in datasources:
-                datapoints = []
+        version = cache.version_of(token)
+        if version is None:
+            delta.full = True
+            delta.components = sorted(cache.components)
+            delta.datasources = cache.datasources()
+        else:
+            delta.components, delta.removed = cache.changes_since(version)
+            delta.datasources = cache.datasources(delta.components)
+        delta.datapoint_table = cache.datapoints.table(delta.datasources)
 
-                for dp in ds.datapoints():
-                    dp_config = DataPointConfig()
-                    dp_config.id = dp.id
-                    dp_config.dpName = dp.name()
-                    dp_config.component = component.id
-                    dp_config.rrdPath = '/'.join((component.rrdPath(), dp.name()))
-                    dp_config.rrdType = dp.rrdtype
-                    dp_config.rrdCreateCommand = dp.getRRDCreateCommand(collector)
-                    dp_config.rrdMin = dp.rrdmin
-                    dp_config.rrdMax = dp.rrdmax
+        return delta
 
-                    # MetricMixin.getMetricMetadata() added in Zenoss 5.
-                    if hasattr(component, 'getMetricMetadata'):
-                        dp_config.metadata = component.getMetricMetadata()
+    def prune(self):
+        # Forget the caches of devices which have been deleted, or are no
+        # longer monitored by this collector.
+        for device_id in list(self.config_cache):
+            device = self.dmd.Devices.findDeviceByIdExact(device_id)
+            if device is None or not self._filterDevice(device):
+                del self.config_cache[device_id]
 
-                    datapoints.append(dp_config)
+    def update_cache(self, device, collector):
+        cache = self.config_cache.get(device.id)
+        if cache is None:
+            cache = self.config_cache[device.id] = DeviceConfigCache()
 
+        # Most components share a handful of templates, so what is needed
+        # from each template is only looked up once per update.
+        template_cache = TemplateCache(collector)
+
+        start = time.time()
+        changed = cache.update(
+            dict((component.id, component) for component in device.getMonitoredComponents()),
+            lambda component: self.component_signature(component, collector, template_cache),
+            lambda component: (
+                list(self.component_datasources(
+                    component, collector, template_cache, cache.datapoints)),
+                component.getThresholdInstances(PerfAMQPDataSource.sourcetype)),
+            context=(serial(collector), zproperty_values(device)))
+
+        log.debug("%s: %d of %d components changed (%d templates, version %d, %.3f seconds)",
+                  device.id, changed, len(cache.components), len(template_cache),
+                  cache.version, time.time() - start)
+        return cache
+
+    def component_signature(self, component, collector, template_cache=None):
+        # Return a value which changes whenever any of the things that a
+        # component's datasource configs are built from, and which are
+        # particular to it, does: the component itself (which its rrdPath
+        # and metric metadata are derived from) and its templates (and their
+        # datasources, datapoints and thresholds).  Only serials are read,
+        # so this is cheap enough to do for every component on every update.
+        # (The collector and zProperties are the update's context.)
+        if template_cache is None:
+            template_cache = TemplateCache(collector)
+
+        return (
+            serial(component),
+            tuple(template_cache.signature(template) for template in component.getRRDTemplates()))
+
+    def component_datasources(self, component, collector, template_cache=None, datapoint_table=None):
+        if template_cache is None:
+            template_cache = TemplateCache(collector)
+        if datapoint_table is None:
+            datapoint_table = DataPointTable()
+
+        device = component.device()
+        rrdPath = component.rrdPath()
+
+        # MetricMixin.getMetricMetadata() added in Zenoss 5.
+        metadata = None
+        if hasattr(component, 'getMetricMetadata'):
+            metadata = component.getMetricMetadata()
+
+        for template in component.getRRDTemplates():
+            for ds in template_cache.datasources(template):
                 ds_config = OpenStackDataSourceConfig()
                 ds_config.device = device.id
                 ds_config.component = component.id
                 ds_config.component_meta_type = component.meta_type
-                ds_config.template = template.id
-                ds_config.datasource = ds.titleOrId()
-                ds_config.points = datapoints
+                ds_config.template = ds.template
+                ds_config.datasource = ds.datasource
+                ds_config.points = [datapoint_table.index(dp) for dp in ds.points]
                 ds_config.meter = ds.meter
                 ds_config.resourceId = component.resourceId
+                ds_config.rrdPath = rrdPath
+                ds_config.metadata = metadata
 
                 yield ds_config
@@ -0,0 +1,359 @@
+#!/usr/bin/env python
+
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2026, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+from mock import Mock
+
+from Products.ZenTestCase.BaseTestCase import BaseTestCase
+
+from ZenPacks.zenoss.OpenStackInfrastructure.datasources.PerfAMQPDataSource import PerfAMQPDataSource
+from ZenPacks.zenoss.OpenStackInfrastructure.services.OpenStackConfig import (
+    DataPointSkeleton,
+    DataPointTable,
+    DeviceConfigCache,
+    OpenStackConfig,
+    OpenStackDataSourceConfig,
+    TemplateCache,
+    resolve_datapoints,
+    serial
+)
+
+
+def skeleton(dp_id):
+    return DataPointSkeleton(dp_id, '%s_%s' % (dp_id, dp_id), 'GAUGE', None, 0, None)
+
+
+class TestDeviceConfigCache(BaseTestCase):
+
+    def afterSetUp(self):
+        super(TestDeviceConfigCache, self).afterSetUp()
+        self.cache = DeviceConfigCache()
+        self.built = []
+
+    def update(self, components, points=('cpu',)):
+        # components maps each component id to its signature, and each
+        # component has a datasource with the given datapoints.
+        def build(component_id):
+            self.built.append(component_id)
+            ds = OpenStackDataSourceConfig()
+            ds.component = component_id
+            ds.points = [self.cache.datapoints.index(skeleton(dp_id)) for dp_id in points]
+            return [ds], ['%s-threshold' % component_id]
+
+        self.built = []
+        return self.cache.update(
+            dict((component_id, component_id) for component_id in components),
+            lambda component_id: components[component_id],
+            build)
+
+    def components(self, datasources):
+        return [ds.component for ds in datasources]
+
+    def test_update(self):
+        self.assertEquals(self.update({'a': 1, 'b': 1}), 2)
+        self.assertEquals(sorted(self.built), ['a', 'b'])
+        self.assertEquals(self.components(self.cache.datasources()), ['a', 'b'])
+        self.assertEquals(self.cache.thresholds(), ['a-threshold', 'b-threshold'])
+
+        version = self.cache.version
+        self.assertEquals(self.update({'a': 1, 'b': 1}), 0)
+        self.assertEquals(self.built, [])
+        self.assertEquals(self.cache.version, version)
+
+        self.assertEquals(self.update({'a': 2, 'c': 1}), 3)
+        self.assertEquals(sorted(self.built), ['a', 'c'])
+        self.assertEquals(self.components(self.cache.datasources()), ['a', 'c'])
+
+    def test_datapoints(self):
+        self.update({'a': 1, 'b': 1}, points=('cpu', 'mem'))
+        self.assertEquals(len(self.cache.datapoints), 2)
+
+        # a datapoint is kept for as long as any component uses it
+        self.update({'a': 2, 'b': 1}, points=('cpu', 'disk'))
+        self.assertEquals(len(self.cache.datapoints), 3)
+        self.update({'a': 2}, points=('cpu', 'disk'))
+        self.assertEquals(len(self.cache.datapoints), 2)
+
+        table = self.cache.datapoints.table(self.cache.datasources())
+        self.assertEquals(
+            sorted(dp[0] for dp in table.values()), ['cpu', 'disk'])
+
+        # and the index of one which is no longer used is reused
+        self.update({'c': 1}, points=('net',))
+        self.assertEquals(len(self.cache.datapoints), 1)
+        self.assertEquals(len(self.cache.datapoints.skeletons), 3)
+
+    def test_changes_since(self):
+        self.update({'a': 1, 'b': 1, 'c': 1})
+        token = self.cache.token
+
+        self.update({'a': 2, 'b': 1, 'd': 1})
+        version = self.cache.version_of(token)
+        self.assertEquals(self.cache.changes_since(version), (['a', 'd'], ['c']))
+        self.assertEquals(self.cache.changes_since(self.cache.version), ([], []))
+
+    def test_context(self):
+        self.update({'a': 1, 'b': 1})
+        self.update({'a': 1, 'b': 1})
+        self.assertEquals(self.built, [])
+
+        # a change to the context rebuilds every component
+        self.assertEquals(self.cache.update(
+            {'a': 'a', 'b': 'b'}, lambda component_id: 1, lambda component_id: ([], []),
+            context='changed'), 2)
+
+    def test_tokens(self):
+        self.update({'a': 1})
+        self.assertEquals(self.cache.version_of(self.cache.token), self.cache.version)
+
+        # issued by another cache (say, before zenhub was restarted)
+        self.assertEquals(self.cache.version_of(DeviceConfigCache().token), None)
+        self.assertEquals(self.cache.version_of('garbage'), None)
+        self.assertEquals(self.cache.version_of(None), None)
+
+    def test_prune(self):
+        self.cache.max_removed = 4
+        self.update(dict((str(i), 1) for i in range(10)))
+        token = self.cache.token
+
+        for i in range(10):
+            self.update(dict((str(j), 1) for j in range(i + 1, 10)))
+        self.assertTrue(len(self.cache.removed) <= 4)
+
+        # too old to tell what has been removed since
+        self.assertEquals(self.cache.version_of(token), None)
+
+
+class TestTemplateCache(BaseTestCase):
+
+    def template(self, path):
+        dp = Mock(id='cpu', rrdtype='GAUGE', rrdmin=0, rrdmax=None)
+        dp.name.return_value = 'cpu_cpu'
+        dp.getRRDCreateCommand.return_value = 'RRA:AVERAGE:0.5:1:600'
+
+        ds = Mock(spec=PerfAMQPDataSource, enabled=True, meter='cpu')
+        ds.titleOrId.return_value = 'cpu'
+        ds.datapoints.return_value = [dp]
+
+        disabled = Mock(spec=PerfAMQPDataSource, enabled=False)
+        disabled.datapoints.return_value = []
+
+        template = Mock(id=path.split('/')[-1])
+        template.getPrimaryId.return_value = path
+        template.getRRDDataSources.return_value = [ds, disabled]
+        template.thresholds.return_value = []
+        return template
+
+    def test_datasources(self):
+        collector = Mock()
+        cache = TemplateCache(collector)
+        template = self.template('/zport/dmd/Devices/OpenStack/rrdTemplates/Instance')
+
+        for i in range(100):
+            datasources = cache.datasources(template)
+            cache.signature(template)
+
+        self.assertEquals(len(cache), 1)
+        self.assertEquals(template.getRRDDataSources.call_count, 2)
+
+        self.assertEquals(len(datasources), 1)
+        ds = datasources[0]
+        self.assertEquals((ds.template, ds.datasource, ds.meter), ('Instance', 'cpu', 'cpu'))
+        self.assertEquals(
+            ds.points[0],
+            ('cpu', 'cpu_cpu', 'GAUGE', 'RRA:AVERAGE:0.5:1:600', 0, None))
+
+        cache.datasources(self.template('/zport/dmd/Devices/OpenStack/rrdTemplates/Vnic'))
+        self.assertEquals(len(cache), 2)
+
+
+class TestSignatures(BaseTestCase):
+
+    def afterSetUp(self):
+        super(TestSignatures, self).afterSetUp()
+        self.service = OpenStackConfig(Mock(), 'localhost')
+
+    def component(self, template):
+        component = Mock(id='instance1', _p_serial='1', resourceId='instance1')
+        component.rrdPath.return_value = 'Devices/os/instance1'
+        component.getRRDTemplates.return_value = [template]
+        component.getMetricMetadata.return_value = {'contextUUID': 'abc'}
+        component.getThresholdInstances.return_value = []
+        component.device().id = 'os'
+        component.device().zenPropertyItems.return_value = [('zOpenStackNovaApiHosts', [])]
+        return component
+
+    def signature(self, component):
+        return self.service.component_signature(component, Mock(_p_serial='1'))
+
+    def test_ghost(self):
+        obj = Mock(_p_serial='1')
+
+        def activate():
+            obj._p_serial = '2'
+        obj._p_activate.side_effect = activate
+
+        # loaded before its serial is read
+        self.assertEquals(serial(obj), '2')
+
+    def test_template_changed(self):
+        template = TestTemplateCache('test_datasources').template('/zport/dmd/Devices/OpenStack/rrdTemplates/Instance')
+        ds = template.getRRDDataSources.return_value[0]
+        ds._p_serial = '1'
+        component = self.component(template)
+        signature = self.signature(component)
+        self.assertEquals(self.signature(component), signature)
+
+        ds._p_serial = '2'
+        self.assertNotEquals(self.signature(component), signature)
+
+    def test_unchanged(self):
+        template = TestTemplateCache('test_datasources').template('/zport/dmd/Devices/OpenStack/rrdTemplates/Instance')
+        component = self.component(template)
+        signature = self.signature(component)
+        self.assertEquals(self.signature(component), signature)
+
+        # only serials are read, not the metric metadata or zProperties
+        self.assertFalse(component.getMetricMetadata.called)
+        self.assertFalse(component.rrdPath.called)
+        self.assertFalse(component.device().zenPropertyItems.called)
+
+        component._p_serial = '2'
+        self.assertNotEquals(self.signature(component), signature)
+
+    def test_zproperties_changed(self):
+        template = TestTemplateCache('test_datasources').template('/zport/dmd/Devices/OpenStack/rrdTemplates/Instance')
+        component = self.component(template)
+        device = component.device()
+        device.getMonitoredComponents.return_value = [component]
+        collector = Mock(_p_serial='1')
+
+        cache = self.service.update_cache(device, collector)
+        version = cache.version
+        self.service.update_cache(device, collector)
+        self.assertEquals(cache.version, version)
+        self.assertEquals(component.getMetricMetadata.call_count, 1)
+
+        # every component is rebuilt
+        device.zenPropertyItems.return_value = [('zOpenStackNovaApiHosts', ['10.0.0.1'])]
+        self.service.update_cache(device, collector)
+        self.assertEquals(cache.version, version + 1)
+        self.assertEquals(component.getMetricMetadata.call_count, 2)
+
+        collector._p_serial = '2'
+        self.service.update_cache(device, collector)
+        self.assertEquals(cache.version, version + 2)
+
+    def test_delta_datapoints(self):
+        device = Mock(id='os')
+        self.service.dmd.Devices.findDeviceByIdExact.return_value = device
+        self.service._filterDevice = lambda device: True
+        components = {'a': 1, 'b': 1}
+        points = {'a': ['cpu'], 'b': ['mem']}
+
+        def update_cache(device, collector):
+            cache = self.service.config_cache.setdefault(device.id, DeviceConfigCache())
+            cache.update(
+                dict((component_id, component_id) for component_id in components),
+                components.get,
+                lambda component_id: (
+                    [self.datasource(cache, component_id, points[component_id])], []))
+            return cache
+        self.service.update_cache = update_cache
+
+        delta = self.service.remote_getDatasourceChanges('os', None)
+        self.assertTrue(delta.full)
+        self.assertEquals(sorted(dp[0] for dp in delta.datapoint_table.values()), ['cpu', 'mem'])
+
+        # only the datapoints of the changed components are sent
+        components['b'] = 2
+        points['b'] = ['disk']
+        delta = self.service.remote_getDatasourceChanges('os', delta.token)
+        self.assertEquals(delta.components, ['b'])
+        self.assertEquals([dp[0] for dp in delta.datapoint_table.values()], ['disk'])
+
+        resolve_datapoints(delta.datasources, delta.datapoint_table)
+        self.assertEquals(delta.datasources[0].points, (skeleton('disk'),))
+
+    def datasource(self, cache, component_id, points):
+        ds = OpenStackDataSourceConfig()
+        ds.component = component_id
+        ds.points = [cache.datapoints.index(skeleton(dp_id)) for dp_id in points]
+        return ds
+
+    def test_prune(self):
+        devices = dict((device_id, Mock(id=device_id)) for device_id in ('a', 'b', 'c'))
+        self.service.dmd.Devices.findDeviceByIdExact.side_effect = devices.get
+        self.service._filterDevice = lambda device: device.id != 'c'
+        for device_id in ('a', 'b', 'c'):
+            self.service.config_cache[device_id] = DeviceConfigCache()
+
+        del devices['b']
+        self.service.prune()
+        self.assertEquals(self.service.config_cache.keys(), ['a'])
+
+
+class TestDataPointTable(BaseTestCase):
+
+    def test_resolve(self):
+        cpu = DataPointSkeleton('cpu', 'cpu_cpu', 'GAUGE', ('RRA:AVERAGE:0.5:1:600',), 0, None)
+        mem = DataPointSkeleton('mem', 'mem_mem', 'GAUGE', ('RRA:AVERAGE:0.5:1:600',), 0, None)
+
+        table = DataPointTable()
+        datasources = []
+        for points in ([cpu], [cpu, mem], [mem]):
+            ds = OpenStackDataSourceConfig()
+            ds.points = [table.index(dp) for dp in points]
+            datasources.append(ds)
+
+        self.assertEquals(len(table), 2)
+        self.assertEquals([ds.points for ds in datasources], [[0], [0, 1], [1]])
+
+        # as sent over PB
+        datapoint_table = table.table(datasources)
+        self.assertEquals(type(datapoint_table[0]), tuple)
+        self.assertEquals(table.table(datasources[2:]).keys(), [1])
+
+        resolve_datapoints(datasources, datapoint_table)
+        self.assertEquals([ds.points for ds in datasources], [(cpu,), (cpu, mem), (mem,)])
+        self.assertTrue(datasources[0].points[0] is datasources[1].points[0])
+
+    def test_release(self):
+        table = DataPointTable()
+        cpu, mem = skeleton('cpu'), skeleton('mem')
+        self.assertEquals(table.index(cpu), 0)
+        self.assertEquals(table.index(cpu), 0)
+        self.assertEquals(table.index(mem), 1)
+
+        table.release([0])
+        self.assertEquals(len(table), 2)
+        table.release([0])
+        self.assertEquals(len(table), 1)
+
+        # a freed index is reused
+        self.assertEquals(table.index(skeleton('disk')), 0)
+        self.assertEquals(table.index(cpu), 2)
+        self.assertEquals(table.table([Mock(points=[0, 1])]), {0: tuple(skeleton('disk')), 1: tuple(mem)})
+
+
+def test_suite():
+    from unittest import TestSuite, makeSuite
+    suite = TestSuite()
+    suite.addTest(makeSuite(TestDeviceConfigCache))
+    suite.addTest(makeSuite(TestTemplateCache))
+    suite.addTest(makeSuite(TestSignatures))
+    suite.addTest(makeSuite(TestDataPointTable))
+    return suite
+
+
+if __name__ == "__main__":
+    from zope.testrunner.runner import Runner
+    runner = Runner(found_suites=[test_suite()])
+    runner.run()
@@ -22,6 +22,7 @@ import logging
 logging.basicConfig(level=logging.ERROR)
 log = logging.getLogger('zen.OpenStack')
 
+from mock import patch
 from zExceptions import NotFound
 from Products.ZenUtils.Utils import monkeypatch
 from Products.DataCollector.ApplyDataMap import ApplyDataMap
@@ -32,7 +33,16 @@ from ZenPacks.zenoss.OpenStackInfrastructure.datamaps import ConsolidatingObject
 from Products.ZenUtils.Utils import unused
 unused(Globals)
 
-from ZenPacks.zenoss.OpenStackInfrastructure.events import map_event, event_component_id
+from ZenPacks.zenoss.OpenStackInfrastructure import events
+from ZenPacks.zenoss.OpenStackInfrastructure.events import (
+    map_event,
+    event_component_id,
+    event_dispatch,
+    event_is_mapped,
+    instance_id,
+    parse_trait_literal,
+    volume_id
+)
 from ZenPacks.zenoss.ZenPackLib import zenpacklib
 # Required before zenpacklib.TestCase can be used.
 zenpacklib.enableTesting()
@@ -846,6 +856,51 @@ class TestEventMappings(zenpacklib.TestCase):
         self.assertEquals(component_id['volume.update.end'], 'volume-test')
         self.assertEquals(component_id['volume.update.start'], 'volume-test')
 
+    def test_event_dispatch(self):
+        self.assertEquals(
+            event_dispatch('compute.instance.create.end'),
+            (events.MAPPERS['compute.instance.create.end'], instance_id))
+
+        # the result for each event type is only worked out once
+        self.assertTrue(
+            event_dispatch('compute.instance.create.end') is
+            event_dispatch('compute.instance.create.end'))
+
+        # event types with a component, but no mapper, or neither
+        self.assertEquals(event_dispatch('volume.exists'), (None, volume_id))
+        self.assertEquals(event_dispatch('identity.authenticate'), (None, None))
+        self.assertEquals(event_dispatch(None), (None, None))
+        self.assertFalse(event_is_mapped({'openstack_event_type': 'volume.exists'}))
+        self.assertFalse(event_is_mapped({}))
+        self.assertTrue(event_is_mapped({'openstack_event_type': 'compute.instance.create.end'}))
+
+        # the cache is bounded
+        with patch.object(events, '_EVENT_DISPATCH_SIZE', 3):
+            for i in range(10):
+                self.assertEquals(event_dispatch('volume.test%d' % i), (None, volume_id))
+            self.assertTrue(len(events._EVENT_DISPATCH) <= 3)
+
+    def test_parse_trait_literal(self):
+        fixed_ips = [{u'address': u'172.24.4.229', u'floating_ips': []}]
+
+        # Both JSON and python representations are accepted.
+        self.assertEquals(parse_trait_literal(json.dumps(fixed_ips)), fixed_ips)
+        self.assertEquals(parse_trait_literal(str(fixed_ips)), fixed_ips)
+
+        # As with ast.literal_eval, anything other than a string is rejected,
+        # as are JSON literals other than lists and dicts.
+        self.assertRaises(ValueError, parse_trait_literal, fixed_ips)
+        self.assertRaises(ValueError, parse_trait_literal, "__import__('os')")
+        self.assertRaises(ValueError, parse_trait_literal, "true")
+        self.assertRaises(ValueError, parse_trait_literal, "null")
+        self.assertEquals(parse_trait_literal("True"), True)
+
+        # A cached value is not changed by modifying what was returned.
+        parsed = parse_trait_literal(str(fixed_ips))
+        parsed[0]['floating_ips'].append(u'10.0.0.1')
+        parsed.append({})
+        self.assertEquals(parse_trait_literal(str(fixed_ips)), fixed_ips)
+
 
 @monkeypatch('Products.DataCollector.ApplyDataMap.ApplyDataMap')
 def logChange(self, device, compname, eventClass, msg):
@@ -0,0 +1,303 @@
+#!/usr/bin/env python
+
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2026, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+import shutil
+from StringIO import StringIO
+import tempfile
+
+from metrology import Metrology
+from mock import Mock, patch
+
+from Products.ZenTestCase.BaseTestCase import BaseTestCase
+
+from ZenPacks.zenoss.OpenStackInfrastructure import zenopenstack
+from ZenPacks.zenoss.OpenStackInfrastructure.journal import Journal
+from ZenPacks.zenoss.OpenStackInfrastructure.tests.test_registry import config, datasource
+from ZenPacks.zenoss.OpenStackInfrastructure.tests.test_webserver import Request, post, samples, site
+from ZenPacks.zenoss.OpenStackInfrastructure.zenopenstack import (
+    LATENCY_TIMERS,
+    CeilometerV1Samples,
+    DeviceQueues,
+    HTTPDebugLogBuffer,
+    Health,
+    Registry,
+    health_snapshot,
+    prometheus_labels,
+    prometheus_name,
+    prometheus_text,
+    prometheus_value
+)
+
+
+class TestHealthSnapshot(BaseTestCase):
+
+    def afterSetUp(self):
+        super(TestHealthSnapshot, self).afterSetUp()
+        self.directory = tempfile.mkdtemp()
+
+        self.queue = DeviceQueues('metrics', limit=4)
+        self.patchers = [
+            patch.object(zenopenstack, 'METRIC_QUEUE', self.queue),
+            patch.object(zenopenstack, 'EVENT_QUEUE', DeviceQueues('events')),
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+
+    def beforeTearDown(self):
+        for patcher in self.patchers:
+            patcher.stop()
+        shutil.rmtree(self.directory)
+        super(TestHealthSnapshot, self).beforeTearDown()
+
+    def test_journaled(self):
+        self.queue.use_journal(Journal(self.directory))
+        for i in range(10):
+            self.queue.append(i, 'os')
+        self.queue.replaying = True
+
+        # each item is counted once, either in memory or in the journal
+        queues = health_snapshot()['queues']
+        self.assertEquals(queues['metrics']['length'], 4)
+        self.assertEquals(queues['metrics']['journaled'], 6)
+        self.assertEquals(queues['events']['journaled'], 0)
+
+        text = prometheus_text(health_snapshot())
+        self.assertTrue('zenopenstack_queue_length{queue="metrics"} 4.0\n' in text)
+        self.assertTrue('zenopenstack_queue_journaled{queue="metrics"} 6.0\n' in text)
+
+
+class TestPrometheusText(BaseTestCase):
+
+    def snapshot(self):
+        rates = {'1m_rate': 1.0, '5m_rate': 2.0, '15m_rate': 3.0, 'mean_rate': 2.0}
+        return {
+            'queues': {
+                'metrics': {'length': 5, 'limit': 100, 'journaled': 0, 'rejected': 1, 'dropped': 2},
+            },
+            'map_queues': {'os': {'held': 3}},
+            'tasks': {
+                'zenopenstack-perf': {'runs': 4, 'slices': 6, 'slice_time': 0.5, 'max_slice_time': 0.25},
+            },
+            'devices': {
+                'os': dict(
+                    ((kind, dict(rates, count=10))
+                     for kind in ('samples', 'events', 'samples_throttled', 'events_throttled')),
+                    queued={'metrics': 5, 'events': 0}),
+            },
+            'reactor': {'stalls': 1, 'stall_time': 1.5, 'max_stall_time': 1.5, 'recent_stalls': []},
+            'metrics': {
+                'zenopenstack.metrics.write_time': dict(
+                    rates, count=4, mean=0.5, median=0.5,
+                    **{'95th_percentile': 0.75, '99th_percentile': 1.0}),
+                'http.requests': dict(rates, count=7),
+                'zenopenstack.gauge': {'value': 12},
+            },
+        }
+
+    def test_helpers(self):
+        self.assertEquals(prometheus_name('http.POST.ceilometer.v1.requests'), 'http_POST_ceilometer_v1_requests')
+        self.assertEquals(prometheus_name('10.0.0.1.requests'), '_10_0_0_1_requests')
+
+        self.assertEquals(prometheus_value(3), '3.0')
+        self.assertEquals(prometheus_value(float('nan')), 'NaN')
+        self.assertEquals(prometheus_value(float('-inf')), '-Inf')
+
+        self.assertEquals(prometheus_labels(), '')
+        self.assertEquals(prometheus_labels(b='x"y', a='1'), '{a="1",b="x\\"y"}')
+
+    def test_text(self):
+        lines = prometheus_text(self.snapshot()).splitlines()
+        for line in (
+                '# TYPE zenopenstack_queue_length gauge',
+                'zenopenstack_queue_length{queue="metrics"} 5.0',
+                '# TYPE zenopenstack_queue_dropped_total counter',
+                'zenopenstack_queue_dropped_total{queue="metrics"} 2.0',
+                'zenopenstack_map_queue_held{device="os"} 3.0',
+                'zenopenstack_task_max_slice_seconds{task="zenopenstack-perf"} 0.25',
+                'zenopenstack_reactor_stalls_total 1.0',
+                'zenopenstack_device_queue_length{device="os",queue="metrics"} 5.0',
+                'zenopenstack_device_samples_rate{device="os",window="5m"} 2.0',
+                '# TYPE zenopenstack_metrics_write_time summary',
+                'zenopenstack_metrics_write_time{quantile="0.95"} 0.75',
+                'zenopenstack_metrics_write_time_sum 2.0',
+                'zenopenstack_metrics_write_time_count 4.0',
+                'zenopenstack_metrics_write_time_rate{window="1m"} 1.0',
+                '# TYPE http_requests_total counter',
+                'http_requests_total 7.0',
+                '# TYPE zenopenstack_gauge gauge',
+                'zenopenstack_gauge 12.0'):
+            self.assertTrue(line in lines, line)
+
+        # every sample follows the TYPE line for its metric
+        metric = None
+        for line in lines:
+            if line.startswith('# TYPE '):
+                metric = line.split()[2]
+            else:
+                self.assertTrue(line.startswith(metric), line)
+
+
+class TestHTTPDebugLogBuffer(BaseTestCase):
+
+    client_id = ('10.0.0.1', '/ceilometer/v1/samples/os')
+
+    def request(self, buffer, code=200, body='[]'):
+        request = Mock(
+            code=code, code_message='OK', method='POST', uri=self.client_id[1],
+            content=StringIO(body))
+        request.getClientIP.return_value = self.client_id[0]
+        request._zaction = buffer.new_actions()
+        return request
+
+    def test_sample_rate(self):
+        buffer = HTTPDebugLogBuffer(sample_rate=0.5)
+        random = Mock()
+        with patch.object(zenopenstack, 'random', random):
+            random.random.return_value = 0.7
+            buffer.store_request(self.request(buffer), 'ok')
+            self.assertEquals(len(buffer.get_requests(self.client_id)), 0)
+
+            # errors are always stored
+            buffer.store_request(self.request(buffer, code=500), 'error')
+            self.assertEquals(len(buffer.get_requests(self.client_id)), 1)
+
+            random.random.return_value = 0.3
+            buffer.store_request(self.request(buffer), 'ok')
+            self.assertEquals(len(buffer.get_requests(self.client_id)), 2)
+
+    def test_truncate(self):
+        buffer = HTTPDebugLogBuffer(max_body=10)
+        buffer.store_request(self.request(buffer, body='x' * 100), 'y' * 20)
+
+        request = buffer.get_most_recent_request(self.client_id)
+        self.assertEquals(request['request_body'], 'x' * 10)
+        self.assertEquals(request['request_body_size'], 100)
+        self.assertEquals(request['response_body'], 'y' * 10)
+        self.assertEquals(request['response_body_size'], 20)
+
+    def test_cache_size(self):
+        buffer = HTTPDebugLogBuffer(cache_size=3)
+        for i in range(5):
+            buffer.store_request(self.request(buffer, body=str(i)), '')
+        self.assertEquals(
+            [request['request_body'] for request in buffer.get_requests(self.client_id)],
+            ['2', '3', '4'])
+
+    def test_actions(self):
+        buffer = HTTPDebugLogBuffer()
+        request = self.request(buffer)
+        for i in range(3):
+            request._zaction['metrics'].append(('cpu', i))
+        request._zaction['events'].append({'summary': 'event'})
+        buffer.store_request(request, '')
+
+        # only the number of each type of action is kept
+        actions = buffer.get_most_recent_request(self.client_id)['zenoss_actions']
+        self.assertEquals(actions, {'metrics': 3, 'maps': 0, 'events': 1, 'dropped': 0})
+
+        buffer = HTTPDebugLogBuffer(full_actions=True)
+        request = self.request(buffer)
+        request._zaction['metrics'].append(('cpu', 0))
+        buffer.store_request(request, '')
+        actions = buffer.get_most_recent_request(self.client_id)['zenoss_actions']
+        self.assertEquals(actions['metrics'], [('cpu', 0)])
+
+    def test_meters(self):
+        buffer = HTTPDebugLogBuffer()
+        meters = buffer.get_meters('post', self.client_id[1], self.client_id[0])
+        requests, errors, metrics = (
+            meters.client_requests.count, meters.client_errors.count, meters.metrics.count)
+
+        for code in (200, 500):
+            request = self.request(buffer, code=code)
+            request._zaction['metrics'].append(('cpu', 0))
+            buffer.store_request(request, '')
+
+        # each request's meters are looked up once, and then reused
+        self.assertTrue(buffer.get_meters('post', self.client_id[1], self.client_id[0]) is meters)
+        self.assertEquals(len(buffer.meters), 1)
+        self.assertEquals(meters.client_requests.count, requests + 2)
+        self.assertEquals(meters.client_errors.count, errors + 1)
+        self.assertEquals(meters.metrics.count, metrics + 2)
+        self.assertTrue(meters.metrics is Metrology.meter(
+            'zenopenstack.ceilometer.v1.samples.os.10.0.0.1.metrics'))
+
+        # but not shared with other clients
+        self.assertFalse(buffer.get_meters('post', self.client_id[1], '10.0.0.2') is meters)
+
+
+class TestLatencyTimers(BaseTestCase):
+
+    def afterSetUp(self):
+        super(TestLatencyTimers, self).afterSetUp()
+
+        self.registry = Registry()
+        self.registry.set_config('os', config([datasource('a')]))
+        self.queue = DeviceQueues('metrics')
+        self.patchers = [
+            patch.object(zenopenstack, 'REGISTRY', self.registry),
+            patch.object(zenopenstack, 'METRIC_QUEUE', self.queue),
+            patch.object(zenopenstack, 'EVENT_QUEUE', DeviceQueues('events')),
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+
+    def beforeTearDown(self):
+        for patcher in self.patchers:
+            patcher.stop()
+        super(TestLatencyTimers, self).beforeTearDown()
+
+    def test_health_page(self):
+        resource = Health()
+        resource.site = site()
+        body = resource.render_GET(Request([]))
+
+        # one row per timer, under the Latency heading
+        latency = body[body.index('<b>Latency</b>'):]
+        for name, description in LATENCY_TIMERS:
+            self.assertTrue('<td>%s</td>' % description in latency, description)
+
+    def test_samples(self):
+        timers = dict(
+            (name, Metrology.timer('zenopenstack.samples.%s' % name))
+            for name in ('decode_time', 'resolve_time'))
+        counts = dict((name, timer.count) for name, timer in timers.iteritems())
+
+        resource = CeilometerV1Samples(self.queue)
+        resource.site = site()
+        post(resource, samples(3))
+
+        # each timer is updated once per request, not per sample
+        for name, timer in timers.iteritems():
+            self.assertEquals(timer.count, counts[name] + 1, name)
+
+        metrics = health_snapshot()['metrics']
+        self.assertEquals(
+            metrics['zenopenstack.samples.resolve_time']['count'], timers['resolve_time'].count)
+        self.assertTrue(
+            'zenopenstack_samples_resolve_time_count %.1f' % timers['resolve_time'].count
+            in prometheus_text(health_snapshot()).splitlines())
+
+
+def test_suite():
+    from unittest import TestSuite, makeSuite
+    suite = TestSuite()
+    suite.addTest(makeSuite(TestHealthSnapshot))
+    suite.addTest(makeSuite(TestPrometheusText))
+    suite.addTest(makeSuite(TestHTTPDebugLogBuffer))
+    suite.addTest(makeSuite(TestLatencyTimers))
+    return suite
+
+
+if __name__ == "__main__":
+    from zope.testrunner.runner import Runner
+    runner = Runner(found_suites=[test_suite()])
+    runner.run()
@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2026, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+import cPickle
+import os
+import shutil
+import tempfile
+import zlib
+
+from Products.ZenTestCase.BaseTestCase import BaseTestCase
+
+from ZenPacks.zenoss.OpenStackInfrastructure.journal import HEADER, Journal, read_records
+
+
+def record(data):
+    return HEADER.pack(len(data), zlib.crc32(data) & 0xffffffff) + data
+
+
+class TestJournal(BaseTestCase):
+
+    def afterSetUp(self):
+        super(TestJournal, self).afterSetUp()
+        self.directory = tempfile.mkdtemp()
+
+    def beforeTearDown(self):
+        shutil.rmtree(self.directory)
+        super(TestJournal, self).beforeTearDown()
+
+    def segments(self):
+        return sorted(n for n in os.listdir(self.directory) if n.endswith('.seg'))
+
+    def per_segment(self):
+        # The number of (small integer) records in each full segment.
+        size = os.path.getsize(os.path.join(self.directory, self.segments()[0]))
+        return size / len(record(cPickle.dumps(0, cPickle.HIGHEST_PROTOCOL)))
+
+    def test_order(self):
+        journal = Journal(self.directory, segment_size=100)
+        records = [('dev%d' % (i % 3), ('path/%d' % i, float(i), 1000.0 + i)) for i in range(50)]
+        for record in records:
+            self.assertTrue(journal.append(record))
+        self.assertEquals(len(journal), 50)
+        self.assertTrue(len(self.segments()) > 1)
+
+        self.assertEquals(journal.popbatch(7), records[:7])
+        self.assertEquals(journal.popbatch(40), records[7:47])
+        self.assertEquals(journal.popbatch(40), records[47:])
+        self.assertEquals(journal.popbatch(40), [])
+        self.assertEquals(len(journal), 0)
+
+        # read segments are removed
+        self.assertEquals(len(self.segments()), 1)
+
+    def test_reopen(self):
+        journal = Journal(self.directory, segment_size=100)
+        for i in range(20):
+            journal.append(i)
+        self.assertEquals(journal.popbatch(5), range(5))
+        journal.close()
+
+        journal = Journal(self.directory, segment_size=100)
+        self.assertEquals(len(journal), 15)
+        journal.append(20)
+        self.assertEquals(journal.popbatch(100), range(5, 21))
+
+    def test_prepend(self):
+        journal = Journal(self.directory, segment_size=100)
+        for i in range(20):
+            journal.append(i)
+        self.assertEquals(journal.popbatch(3), range(3))
+
+        journal.prepend(['a', 'b'])
+        self.assertEquals(len(journal), 19)
+        journal.append(20)
+        journal.close()
+
+        journal = Journal(self.directory, segment_size=100)
+        self.assertEquals(len(journal), 20)
+        self.assertEquals(journal.popbatch(100), ['a', 'b'] + range(3, 21))
+
+        # with everything read
+        journal.prepend(['c'])
+        journal.append(21)
+        self.assertEquals(journal.popbatch(100), ['c', 21])
+
+    def test_incomplete_record(self):
+        journal = Journal(self.directory)
+        for i in range(3):
+            journal.append({'i': i})
+        journal.close()
+
+        # as if the process was killed part way through an append
+        path = os.path.join(self.directory, self.segments()[-1])
+        with open(path, 'ab') as f:
+            f.write('\x40\x00\x00\x00garbage')
+
+        journal = Journal(self.directory)
+        self.assertEquals(len(journal), 3)
+        journal.append({'i': 3})
+        self.assertEquals(journal.popbatch(10), [{'i': i} for i in range(4)])
+
+    def test_read_records(self):
+        buf = record('a') + record('bb') + record('ccc')
+        self.assertEquals(
+            list(read_records(buf, 0)),
+            [('a', 9), ('bb', 19), ('ccc', 30)])
+        self.assertEquals(list(read_records(buf, 9)), [('bb', 19), ('ccc', 30)])
+
+        # stops at a record which fails its checksum, or is incomplete
+        corrupted = buf[:17] + 'x' + buf[18:]
+        self.assertEquals(list(read_records(corrupted, 0)), [('a', 9)])
+        self.assertEquals(list(read_records(buf[:-1], 0)), [('a', 9), ('bb', 19)])
+
+    def test_corrupted_record(self):
+        journal = Journal(self.directory, segment_size=100)
+        for i in range(20):
+            journal.append(i)
+        journal.close()
+        segments = self.segments()
+        self.assertTrue(len(segments) > 2)
+
+        # flip a byte in the second record of the first segment
+        path = os.path.join(self.directory, segments[0])
+        per_segment = self.per_segment()
+        with open(path, 'rb') as f:
+            contents = f.read()
+        offset = len(contents) / per_segment + HEADER.size
+        with open(path, 'wb') as f:
+            f.write(contents[:offset] + chr(ord(contents[offset]) ^ 0xff) + contents[offset + 1:])
+
+        # the rest of that segment is discarded, but not the later segments
+        journal = Journal(self.directory, segment_size=100)
+        self.assertEquals(len(journal), 20 - per_segment + 1)
+        self.assertEquals(journal.popbatch(100), [0] + range(per_segment, 20))
+
+    def test_segments_removed(self):
+        journal = Journal(self.directory, segment_size=100)
+        for i in range(20):
+            journal.append(i)
+        segments = self.segments()
+        self.assertTrue(len(segments) > 2)
+        per_segment = self.per_segment()
+
+        # each segment is removed once all of its records have been read
+        self.assertEquals(journal.popbatch(per_segment - 1), range(per_segment - 1))
+        self.assertEquals(self.segments(), segments)
+        self.assertEquals(journal.popbatch(1), [per_segment - 1])
+        journal.popbatch(1)
+        self.assertEquals(self.segments(), segments[1:])
+
+        # and a segment which holds nothing unread is replaced, rather than
+        # growing indefinitely
+        journal.popbatch(100)
+        self.assertEquals(len(journal), 0)
+        self.assertEquals(journal.size, 0)
+        self.assertEquals(len(self.segments()), 1)
+        self.assertFalse(self.segments()[0] in segments)
+
+    def test_max_size(self):
+        journal = Journal(self.directory, max_size=100)
+        appended = 0
+        while journal.append('x' * 10):
+            appended += 1
+        self.assertTrue(0 < appended < 10)
+
+        journal.popbatch(appended)
+        self.assertFalse(journal.full())
+        self.assertEquals(journal.size, 0)
+        self.assertTrue(journal.append('x' * 10))
+
+        # prepended records are kept even if they take it over max_size
+        journal.prepend(['y' * 10] * 10)
+        self.assertTrue(journal.full())
+        self.assertFalse(journal.append('x' * 10))
+        self.assertEquals(journal.popbatch(100), ['y' * 10] * 10 + ['x' * 10])
+
+
+def test_suite():
+    from unittest import TestSuite, makeSuite
+    suite = TestSuite()
+    suite.addTest(makeSuite(TestJournal))
+    return suite
+
+
+if __name__ == "__main__":
+    from zope.testrunner.runner import Runner
+    runner = Runner(found_suites=[test_suite()])
+    runner.run()
@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+
+###########################################################################
+#
+# This program is part of Zenoss Core, an open source monitoring platform.
+# Copyright (C) 2026, Zenoss Inc.
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License version 2 or (at your
+# option) any later version as published by the Free Software Foundation.
+#
+# For complete information please visit: http://www.zenoss.com/oss/
+#
+###########################################################################
+
+from mock import Mock, patch
+
+from twisted.internet import defer
+from twisted.web.http_headers import Headers
+
+from Products.ZenTestCase.BaseTestCase import BaseTestCase
+
+from ZenPacks.zenoss.OpenStackInfrastructure.apiclients import session
+from ZenPacks.zenoss.OpenStackInfrastructure.apiclients.session import SessionManager
+from ZenPacks.zenoss.OpenStackInfrastructure.modeler.plugins.zenoss.OpenStackInfrastructure import (
+    OpenStackInfrastructure as OpenStackInfrastructureModeler,
+    gather
+)
+
+
+class FakeAgent(object):
+    # Records requests, which are completed by the test.
+
+    def __init__(self):
+        self.requests = []
+        self.max_outstanding = 0
+
+    def request(self, method, url, headers=None, bodyProducer=None):
+        d = defer.Deferred()
+        self.requests.append(d)
+        self.max_outstanding = max(self.max_outstanding, len(self.requests))
+        return d
+
+    def complete(self):
+        self.requests.pop(0).callback(Mock(code=200))
+
+
+class FakeClient(object):
+    # Stands in for one of the API clients, returning canned results.
+
+    def __init__(self, results):
+        self.results = results
+
+    def servers(self):
+        return defer.succeed(self.results['servers'])
+
+    def servers_single(self):
+        return defer.succeed(self.results['servers_single'])
+
+
+class TestSessionParallelism(BaseTestCase):
+
+    def afterSetUp(self):
+        super(TestSessionParallelism, self).afterSetUp()
+        self.agent = FakeAgent()
+        self.patchers = [
+            patch.object(session, 'MAX_PARALLEL', 3),
+            patch.object(session, 'add_timeout', lambda d, timeout: d),
+            patch.object(session, 'readBody', lambda response: defer.succeed('{}')),
+            patch.object(SessionManager, 'agent', lambda self, scheme='http': self.test_agent),
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+
+        self.session = SessionManager(
+            'admin', 'password', 'http://keystone.test-parallel:5000/v3',
+            'admin', 'default', 'default', 'RegionOne')
+        self.session.test_agent = self.agent
+
+    def beforeTearDown(self):
+        for patcher in self.patchers:
+            patcher.stop()
+        super(TestSessionParallelism, self).beforeTearDown()
+
+    def test_max_parallel(self):
+        results = []
+        for i in range(10):
+            self.session.GET_request(
+                'http://nova.test:8774/v2.1/servers/%d' % i, headers=Headers()
+            ).addCallback(results.append)
+
+        # requests beyond MAX_PARALLEL wait for an earlier one to complete
+        self.assertEquals(len(self.agent.requests), 3)
+        while self.agent.requests:
+            self.agent.complete()
+
+        self.assertEquals(len(results), 10)
+        self.assertEquals(self.agent.max_outstanding, 3)
+
+
+class TestGather(BaseTestCase):
+
+    def test_results(self):
+        d1, d2 = defer.Deferred(), defer.Deferred()
+        results = []
+        gather([d1, d2]).addCallback(results.append)
+        d2.callback(2)
+        d1.callback(1)
+        self.assertEquals(results, [[1, 2]])
+
+    def test_failure(self):
+        d1, d2 = defer.Deferred(), defer.Deferred()
+        failures = []
+        gather([d1, d2]).addErrback(failures.append)
+
+        # fails as soon as any call does, without waiting for the others
+        d2.errback(ValueError('failed'))
+        self.assertEquals(len(failures), 1)
+        self.assertTrue(failures[0].check(ValueError))
+        d1.callback(1)
+
+
+class TestApiCallOrSingle(BaseTestCase):
+
+    def api_call_or_single(self, results):
+        modeler = OpenStackInfrastructureModeler()
+        modeler.api_client_logs = None
+        client = FakeClient(results)
+        values = []
+        modeler.api_call_or_single(
+            "'servers'", client.servers, client.servers_single, 'servers'
+        ).addCallback(values.append)
+        return values[0]
+
+    def test_all(self):
+        self.assertEquals(
+            self.api_call_or_single({
+                'servers': {'servers': [{'id': 'a'}, {'id': 'b'}]},
+                'servers_single': {'servers': [{'id': 'a'}]}}),
+            [{'id': 'a'}, {'id': 'b'}])
+
+    def test_single(self):
+        # a user who is not an administrator sees no servers from the
+        # all-tenants call, so the single tenant call is made
+        self.assertEquals(
+            self.api_call_or_single({
+                'servers': {'servers': []},
+                'servers_single': {'servers': [{'id': 'a'}]}}),
+            [{'id': 'a'}])
+
+
+def test_suite():
+    from unittest import TestSuite, makeSuite
+    suite = TestSuite()
+    suite.addTest(makeSuite(TestSessionParallelism))
+    suite.addTest(makeSuite(TestGather))
+    suite.addTest(makeSuite(TestApiCallOrSingle))
+    return suite
+
+
+if __name__ == "__main__":
+    from zope.testrunner.runner import Runner
+    runner = Runner(found_suites=[test_suite()])
+    runner.run()
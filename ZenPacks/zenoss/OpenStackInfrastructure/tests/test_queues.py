@@ -0,0 +1,379 @@
+#!/usr/bin/env python
+
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2026, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+from collections import defaultdict
+import shutil
+import tempfile
+
+from metrology import Metrology
+from mock import Mock, patch
+from twisted.internet import task
+
+from Products.ZenTestCase.BaseTestCase import BaseTestCase
+
+from ZenPacks.zenoss.OpenStackInfrastructure import zenopenstack
+from ZenPacks.zenoss.OpenStackInfrastructure.journal import Journal
+from ZenPacks.zenoss.OpenStackInfrastructure.tests.test_registry import config, datasource
+from ZenPacks.zenoss.OpenStackInfrastructure.zenopenstack import (
+    BoundedQueue,
+    ColumnarMetricQueue,
+    DeviceQueues,
+    QueueJournals,
+    Registry,
+    TaskSplitter
+)
+
+
+class TestBoundedQueue(BaseTestCase):
+
+    def test_limit(self):
+        queue = BoundedQueue('test', limit=3)
+        dropped = Metrology.meter('zenopenstack.test.dropped').count
+
+        for i in range(5):
+            self.assertEquals(queue.append(i), i < 3)
+        self.assertTrue(queue.full())
+        self.assertEquals(list(queue), [0, 1, 2])
+        self.assertEquals(Metrology.meter('zenopenstack.test.dropped').count, dropped + 2)
+
+        self.assertEquals(queue.popbatch(2), [0, 1])
+        self.assertFalse(queue.full())
+        self.assertTrue(queue.append(3))
+        self.assertEquals(queue.popbatch(10), [2, 3])
+        self.assertEquals(queue.popbatch(10), [])
+
+    def test_unbounded(self):
+        queue = BoundedQueue('test')
+        for i in range(1000):
+            self.assertTrue(queue.append(i))
+        self.assertFalse(queue.full())
+        self.assertEquals(len(queue), 1000)
+
+
+class TestDeviceQueues(BaseTestCase):
+
+    def test_limit(self):
+        queue = DeviceQueues('test', limit=4)
+        for i in range(3):
+            self.assertTrue(queue.append(i, 'dev1'))
+        self.assertTrue(queue.append('a', 'dev2'))
+
+        # the limit applies to all devices together
+        self.assertTrue(queue.full())
+        self.assertFalse(queue.append(3, 'dev1'))
+        self.assertFalse(queue.append('b', 'dev3'))
+        self.assertEquals(len(queue), 4)
+
+        queue.popbatch(2)
+        self.assertFalse(queue.full())
+        self.assertTrue(queue.append('b', 'dev3'))
+
+    def test_device_share(self):
+        queue = DeviceQueues('test', limit=10, device_share=0.3)
+        for i in range(5):
+            self.assertEquals(queue.append(i, 'dev1'), i < 3)
+        self.assertTrue(queue.full('dev1'))
+        self.assertFalse(queue.full('dev2'))
+        self.assertTrue(queue.append('a', 'dev2'))
+        self.assertEquals(queue.device_length('dev1'), 3)
+        self.assertEquals(queue.device_length('dev2'), 1)
+
+    def test_fair(self):
+        queue = DeviceQueues('test')
+        for i in range(10):
+            queue.append(('dev1', i), 'dev1')
+        for i in range(2):
+            queue.append(('dev2', i), 'dev2')
+        for i in range(4):
+            queue.append(('dev3', i), 'dev3')
+
+        # each device gets an equal share of a batch, and the shares of
+        # devices without enough items go to the others
+        batch = queue.popbatch(9)
+        self.assertEquals(len(batch), 9)
+        self.assertEquals(sorted(batch), sorted(
+            [('dev1', i) for i in range(4)] + [('dev2', i) for i in range(2)] +
+            [('dev3', i) for i in range(3)]))
+        self.assertEquals(len(queue), 7)
+
+        # devices take turns at the front of the line
+        self.assertEquals(queue.popleft(), ('dev3', 3))
+        self.assertEquals(queue.popleft(), ('dev1', 4))
+        self.assertEquals(queue.popbatch(10), [('dev1', i) for i in range(5, 10)])
+        self.assertEquals(len(queue), 0)
+        self.assertEquals(queue.queues, {})
+
+
+class TestColumnarMetricQueue(BaseTestCase):
+
+    def afterSetUp(self):
+        super(TestColumnarMetricQueue, self).afterSetUp()
+        self.registry = Registry()
+        self.registry.set_config('os', config([datasource('a'), datasource('b')]))
+        self.queue = DeviceQueues(
+            'test', factory=lambda name: ColumnarMetricQueue(name, self.registry))
+
+    def datapoint(self, resourceId):
+        return self.registry.get_datapoints('os', resourceId, 'cpu')[0]
+
+    def test_queue(self):
+        a, b = self.datapoint('a'), self.datapoint('b')
+        queue = ColumnarMetricQueue('test', self.registry, limit=3)
+        self.assertTrue(queue.append((a, 1, 100)))
+        self.assertTrue(queue.append((b, '2.5', 101.5)))
+        self.assertTrue(queue.append((a, 3, 102)))
+        self.assertTrue(queue.full())
+        self.assertFalse(queue.append((b, 4, 103)))
+
+        # values and timestamps are stored as floats
+        self.assertEquals(queue.popleft(), (a, 1.0, 100.0))
+        self.assertEquals(len(queue), 2)
+        self.assertEquals(queue.popbatch(10), [(b, 2.5, 101.5), (a, 3.0, 102.0)])
+        self.assertEquals(len(queue), 0)
+        self.assertRaises(IndexError, queue.popleft)
+
+    def test_compact(self):
+        a = self.datapoint('a')
+        queue = ColumnarMetricQueue('test', self.registry)
+        queue.compact_size = 4
+        for i in range(10):
+            queue.append((a, i, 100.0 + i))
+
+        self.assertEquals([value for dp, value, timestamp in queue.popbatch(3)], [0.0, 1.0, 2.0])
+        self.assertEquals(queue.head, 3)
+
+        # consumed entries are removed once they are over half of the arrays
+        queue.popbatch(2)
+        self.assertEquals(queue.head, 0)
+        self.assertEquals(len(queue.values), 5)
+        self.assertEquals([value for dp, value, timestamp in queue.popbatch(10)], [5.0, 6.0, 7.0, 8.0, 9.0])
+        self.assertEquals(len(queue.values), 0)
+
+    def test_removed_datapoint(self):
+        a, b = self.datapoint('a'), self.datapoint('b')
+        for i in range(3):
+            self.queue.append((a, i, 100.0 + i), 'os')
+            self.queue.append((b, i, 100.0 + i), 'os')
+
+        # b is removed, and its index reused by c
+        self.registry.set_config('os', config([datasource('a')]))
+        self.registry.set_config('os', config([datasource('a'), datasource('c')]))
+        c = self.datapoint('c')
+        self.assertEquals(c.index, b.index)
+        self.queue.append((c, 9, 200.0), 'os')
+
+        # b's entries are discarded, rather than being taken as c's
+        self.assertEquals(self.queue.popbatch(3), [(a, 0.0, 100.0), (a, 1.0, 101.0), (a, 2.0, 102.0)])
+        self.assertEquals(self.queue.popbatch(3), [(c, 9.0, 200.0)])
+        self.assertEquals(len(self.queue), 0)
+
+
+class TestDeviceQueuesJournal(BaseTestCase):
+
+    def afterSetUp(self):
+        super(TestDeviceQueuesJournal, self).afterSetUp()
+        self.directory = tempfile.mkdtemp()
+
+    def beforeTearDown(self):
+        shutil.rmtree(self.directory)
+        super(TestDeviceQueuesJournal, self).beforeTearDown()
+
+    def queue(self, limit=4):
+        queue = DeviceQueues('test', limit=limit)
+        queue.use_journal(Journal(self.directory, segment_size=100))
+        return queue
+
+    def restart(self, queue):
+        # As at shutdown, then startup.
+        queue.spill()
+        queue.journal.close()
+
+        queue = self.queue(queue.limit)
+        queue.replaying = True
+        return queue
+
+    def drain(self, queue):
+        items = []
+        while len(queue):
+            items.extend(queue.popbatch(3))
+        return items
+
+    def test_overflow(self):
+        queue = self.queue()
+        for i in range(8):
+            self.assertTrue(queue.append(i, 'dev1'))
+        self.assertEquals(queue.length, 4)
+        self.assertEquals(len(queue.journal), 4)
+
+        queue.replaying = True
+        self.assertEquals(self.drain(queue), range(8))
+
+    def test_spill(self):
+        queue = self.queue()
+        for i in range(8):
+            queue.append(i, 'dev1')
+
+        queue = self.restart(queue)
+        self.assertEquals(len(queue.journal), 8)
+        self.assertEquals(self.drain(queue), range(8))
+
+    def test_spill_while_replaying(self):
+        queue = self.queue()
+        for i in range(8):
+            queue.append(i, 'dev1')
+
+        queue = self.restart(queue)
+        self.assertEquals(queue.popbatch(1), [0])
+
+        # items received after the restart follow those from before it
+        for i in range(8, 12):
+            queue.append(i, 'dev1')
+        queue.append('a', 'dev2')
+
+        queue = self.restart(queue)
+        items = self.drain(queue)
+        self.assertEquals([i for i in items if i != 'a'], range(1, 12))
+        self.assertTrue('a' in items)
+
+
+class TestQueueJournals(BaseTestCase):
+
+    # each device's (one) monitored resource
+    resources = {'dev1': 'a', 'dev2': 'b'}
+
+    def afterSetUp(self):
+        super(TestQueueJournals, self).afterSetUp()
+        self.directory = tempfile.mkdtemp()
+        self.clock = task.Clock()
+        self.patchers = []
+        self.start()
+
+    def beforeTearDown(self):
+        self.stop()
+        shutil.rmtree(self.directory)
+        super(TestQueueJournals, self).beforeTearDown()
+
+    def start(self):
+        # As at startup, before any configs have been loaded.
+        self.registry = Registry()
+        self.metrics = DeviceQueues('metrics', limit=2)
+        self.vnics = defaultdict(lambda: dict(potential=dict(), modeled=set()))
+        self.journals = QueueJournals()
+
+        collector = Mock()
+        collector._updateConfig.side_effect = lambda cfg: self.registry.set_config(cfg.configId, cfg)
+        self.patchers = [
+            patch.object(zenopenstack, 'REGISTRY', self.registry),
+            patch.object(zenopenstack, 'METRIC_QUEUE', self.metrics),
+            patch.object(zenopenstack, 'EVENT_QUEUE', DeviceQueues('events')),
+            patch.object(zenopenstack, 'MAP_QUEUE', defaultdict(zenopenstack.ConsolidatingObjectMapQueue)),
+            patch.object(zenopenstack, 'VNICS', self.vnics),
+            patch.object(zenopenstack, 'JOURNALS', self.journals),
+            patch.object(zenopenstack, 'reactor', Mock(callLater=self.clock.callLater)),
+            patch.object(zenopenstack, 'task', Mock()),
+            patch.object(zenopenstack.zope.component, 'getUtility', lambda interface: collector),
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+
+        self.journals.open(self.directory, 1024, None)
+
+    def stop(self):
+        for patcher in self.patchers:
+            patcher.stop()
+        self.patchers = []
+
+    def restart(self):
+        self.journals.close()
+        self.stop()
+        self.start()
+
+    def load(self, *device_ids):
+        configs = []
+        for device_id in device_ids:
+            cfg = config([datasource(self.resources[device_id])])
+            cfg.configId = device_id
+            configs.append(cfg)
+        TaskSplitter().splitConfiguration(configs)
+
+    def append(self, device_id, values):
+        dp = self.registry.get_datapoints(device_id, self.resources[device_id], 'cpu')[0]
+        for value in values:
+            self.metrics.append((dp, value, 1000.0 + value), device_id)
+
+    def drain(self):
+        items = []
+        while len(self.metrics):
+            items.extend(self.metrics.popbatch(3))
+        return [(dp.rrdPath.split('/')[2], value) for dp, value, timestamp in items]
+
+    def test_batches(self):
+        self.load('dev1', 'dev2')
+        self.append('dev1', range(4))
+        self.append('dev2', range(4))
+        self.vnics['dev2']['potential']['tap0'] = 1000.0
+
+        # after a restart, the configs are loaded in two batches
+        self.restart()
+        self.load('dev1')
+        self.assertEquals(self.drain(), [('server-a', float(i)) for i in range(4)])
+        self.assertEquals(dict(self.vnics), {})
+
+        # dev2's metrics and vnics were held until its config was loaded
+        self.load('dev2')
+        self.assertEquals(self.drain(), [('server-b', float(i)) for i in range(4)])
+        self.assertEquals(self.vnics['dev2']['potential'], {'tap0': 1000.0})
+
+    def test_restart_while_held(self):
+        self.load('dev1', 'dev2')
+        self.append('dev2', range(4))
+
+        self.restart()
+        self.load('dev1')
+        self.drain()
+
+        self.restart()
+        self.load('dev1', 'dev2')
+        self.assertEquals(self.drain(), [('server-b', float(i)) for i in range(4)])
+
+    def test_hold_timeout(self):
+        self.load('dev1', 'dev2')
+        self.append('dev2', range(4))
+        self.vnics['dev2']['potential']['tap0'] = 1000.0
+
+        # dev2 has been deleted
+        self.restart()
+        self.load('dev1')
+        self.drain()
+        self.clock.advance(QueueJournals.hold_timeout)
+        self.assertEquals(dict(self.metrics.held), {})
+
+        self.restart()
+        self.load('dev1', 'dev2')
+        self.assertEquals(self.drain(), [])
+        self.assertEquals(dict(self.vnics), {})
+
+
+def test_suite():
+    from unittest import TestSuite, makeSuite
+    suite = TestSuite()
+    suite.addTest(makeSuite(TestBoundedQueue))
+    suite.addTest(makeSuite(TestDeviceQueues))
+    suite.addTest(makeSuite(TestColumnarMetricQueue))
+    suite.addTest(makeSuite(TestDeviceQueuesJournal))
+    suite.addTest(makeSuite(TestQueueJournals))
+    return suite
+
+
+if __name__ == "__main__":
+    from zope.testrunner.runner import Runner
+    runner = Runner(found_suites=[test_suite()])
+    runner.run()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2026, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+from mock import Mock
+
+from Products.ZenTestCase.BaseTestCase import BaseTestCase
+
+from ZenPacks.zenoss.OpenStackInfrastructure.services.OpenStackConfig import (
+    DataPointSkeleton,
+    OpenStackDataSourceConfig
+)
+from ZenPacks.zenoss.OpenStackInfrastructure.zenopenstack import PublishRecord, Registry
+
+
+def datasource(resourceId, meter='cpu', points=('cpu',), metadata=None):
+    ds = OpenStackDataSourceConfig()
+    ds.device = 'os'
+    ds.component = 'server-%s' % resourceId
+    ds.component_meta_type = 'OpenStackInfrastructureInstance'
+    ds.resourceId = resourceId
+    ds.meter = meter
+    ds.rrdPath = 'Devices/os/server-%s' % resourceId
+    ds.metadata = metadata
+    ds.points = tuple(
+        DataPointSkeleton(dp, '%s_%s' % (meter, dp), 'GAUGE', None, 0, None)
+        for dp in points)
+    return ds
+
+
+def config(datasources, event_types=()):
+    return Mock(zOpenStackProcessEventTypes=list(event_types), datasources=datasources)
+
+
+class TestRegistry(BaseTestCase):
+
+    def afterSetUp(self):
+        super(TestRegistry, self).afterSetUp()
+        self.registry = Registry()
+
+    def test_unchanged(self):
+        self.registry.set_config('os', config([datasource('a'), datasource('b')], ['compute.*']))
+        configs = self.registry.configs['os']
+        resource_bytype = self.registry.resource_bytype['os']
+        event_types = self.registry.event_types['os']
+
+        self.registry.set_config('os', config([datasource('a'), datasource('b')], ['compute.*']))
+        self.assertTrue(self.registry.configs['os']['a'] is configs['a'])
+        self.assertTrue(self.registry.configs['os']['b'] is configs['b'])
+        self.assertTrue(self.registry.resource_bytype['os'] is resource_bytype)
+        self.assertTrue(self.registry.event_types['os'] is event_types)
+
+    def test_changed(self):
+        self.registry.set_config('os', config([
+            datasource('a'),
+            datasource('b', metadata={'contextUUID': '1'}),
+            datasource('c')]))
+        a = self.registry.get_datapoints('os', 'a', 'cpu')
+        b = self.registry.get_datapoints('os', 'b', 'cpu')
+
+        self.registry.set_config('os', config([
+            datasource('a'),
+            datasource('b', metadata={'contextUUID': '2'}),
+            datasource('d', points=('cpu', 'mem'))], ['compute.*']))
+
+        # a is unchanged, b's metadata has changed, c removed and d added
+        self.assertTrue(self.registry.get_datapoints('os', 'a', 'cpu') is a)
+        new_b = self.registry.get_datapoints('os', 'b', 'cpu')
+        self.assertFalse(new_b is b)
+        self.assertEquals(new_b[0].metadata, {'contextUUID': '2'})
+        self.assertEquals(new_b[0].index, b[0].index)
+        self.assertEquals(self.registry.get_datapoints('os', 'c', 'cpu'), ())
+        self.assertEquals(
+            [dp.rrdPath for dp in self.registry.get_datapoints('os', 'd', 'cpu')],
+            ['Devices/os/server-d/cpu_cpu', 'Devices/os/server-d/cpu_mem'])
+
+        self.assertEquals(
+            self.registry.device_resource_ids('os', 'OpenStackInfrastructureInstance'),
+            set(['a', 'b', 'd']))
+        self.assertTrue('compute.instance.exists' in self.registry.device_event_types('os'))
+
+    def test_component_changed(self):
+        self.registry.set_config('os', config([datasource('a')]))
+        ds = datasource('a')
+        ds.component = 'server-renamed'
+        self.registry.set_config('os', config([ds]))
+        self.assertEquals(self.registry.get_component_id('os', 'a'), 'server-renamed')
+
+    def test_datapoint_table(self):
+        self.registry.set_config('os', config([datasource('a'), datasource('b')]))
+        a = self.registry.get_datapoints('os', 'a', 'cpu')[0]
+        self.assertEquals(self.registry.get_datapoint(a.index), a)
+        self.assertEquals(self.registry.find_datapoint('Devices/os/server-a/cpu_cpu'), a)
+
+        # as instances come and go, their indexes are reused (once the
+        # config which replaces theirs is in place)
+        for i in range(20):
+            self.registry.set_config('os', config([datasource('a'), datasource(str(i))]))
+            self.assertTrue(self.registry.get_datapoints('os', 'a', 'cpu')[0] is a)
+        self.assertEquals(len(self.registry.datapoint_table), 3)
+        self.assertEquals(self.registry.find_datapoint('Devices/os/server-b/cpu_cpu'), None)
+
+        generation = self.registry.datapoint_generation[a.index]
+        self.registry.remove_device('os')
+        self.assertEquals(self.registry.datapoint_generation[a.index], generation + 1)
+        self.assertEquals(self.registry.datapoint_table, [None, None, None])
+        self.assertEquals(len(self.registry.free_indexes), 3)
+        self.assertEquals(self.registry.find_datapoint('Devices/os/server-a/cpu_cpu'), None)
+
+
+class TestPublishRecord(BaseTestCase):
+
+    def test_copied(self):
+        registry = Registry()
+        registry.set_config('os', config([datasource('a', metadata={'contextUUID': '1'})]))
+        record = registry.get_datapoints('os', 'a', 'cpu')[0]
+
+        self.assertTrue(isinstance(record, PublishRecord))
+        self.assertEquals(
+            (record.rrdPath, record.dpName, record.rrdType, record.rrdCreateCommand,
+             record.rrdMin, record.rrdMax, record.metadata),
+            ('Devices/os/server-a/cpu_cpu', 'cpu_cpu', 'GAUGE', None, 0, None, {'contextUUID': '1'}))
+        self.assertTrue(registry.datapoint_table[record.index] is record)
+
+        # records are slotted, since there is one for every datapoint
+        self.assertFalse(hasattr(record, '__dict__'))
+
+    def test_matches(self):
+        dp = DataPointSkeleton('cpu', 'cpu_cpu', 'GAUGE', None, 0, None)
+        record = PublishRecord('Devices/os/server-a/cpu_cpu', dp, {'contextUUID': '1'})
+        self.assertTrue(record.matches('Devices/os/server-a/cpu_cpu', dp, {'contextUUID': '1'}))
+
+        self.assertFalse(record.matches('Devices/os/server-b/cpu_cpu', dp, {'contextUUID': '1'}))
+        self.assertFalse(record.matches('Devices/os/server-a/cpu_cpu', dp, {'contextUUID': '2'}))
+        self.assertFalse(record.matches('Devices/os/server-a/cpu_cpu', dp))
+        for field, value in (('dpName', 'cpu_x'), ('rrdType', 'DERIVE'),
+                             ('rrdCreateCommand', ('RRA:AVERAGE:0.5:1:600',)),
+                             ('rrdMin', None), ('rrdMax', 100)):
+            self.assertFalse(record.matches(
+                'Devices/os/server-a/cpu_cpu', dp._replace(**{field: value}), {'contextUUID': '1'}))
+
+
+def test_suite():
+    from unittest import TestSuite, makeSuite
+    suite = TestSuite()
+    suite.addTest(makeSuite(TestRegistry))
+    suite.addTest(makeSuite(TestPublishRecord))
+    return suite
+
+
+if __name__ == "__main__":
+    from zope.testrunner.runner import Runner
+    runner = Runner(found_suites=[test_suite()])
+    runner.run()
@@ -0,0 +1,448 @@
+#!/usr/bin/env python
+
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2026, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+import optparse
+import threading
+
+from mock import Mock, patch
+from twisted.internet import defer, task
+
+from Products.ZenCollector.interfaces import ICollector, IDataService
+from Products.ZenTestCase.BaseTestCase import BaseTestCase
+
+from ZenPacks.zenoss.OpenStackInfrastructure import zenopenstack
+from ZenPacks.zenoss.OpenStackInfrastructure.tests.test_registry import config, datasource
+from ZenPacks.zenoss.OpenStackInfrastructure.zenopenstack import (
+    DeviceQueues,
+    DrainScheduler,
+    OpenStackEventTask,
+    OpenStackPerfTask,
+    OpenStackVnicTask,
+    Preferences,
+    Registry,
+    StallDetector,
+    TimeSlicer,
+    TimeSliceStats
+)
+
+
+def preferences(**options):
+    # The zenopenstack options used by its tasks.
+    defaults = dict(timeslice=60000, publishbatchsize=3, publishconcurrency=2)
+    defaults.update(options)
+    return Mock(options=Mock(**defaults))
+
+
+class TestOpenStackPerfTask(BaseTestCase):
+
+    def afterSetUp(self):
+        super(TestOpenStackPerfTask, self).afterSetUp()
+
+        self.registry = Registry()
+        self.registry.set_config('os', config([datasource('a')]))
+        self.queue = DeviceQueues('metrics')
+
+        # writes which have been started, and not yet completed
+        self.writes = []
+        self.dataService = Mock()
+        self.dataService.writeMetricWithMetadata.side_effect = self.write
+
+        utilities = {IDataService: self.dataService}
+        self.patchers = [
+            patch.object(zenopenstack, 'METRIC_QUEUE', self.queue),
+            patch.object(zenopenstack.zope.component, 'queryUtility',
+                         lambda interface, name='': utilities.get(interface, preferences())),
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+
+        self.task = OpenStackPerfTask('zenopenstack-perf', 'zenopenstack-perf')
+
+    def beforeTearDown(self):
+        for patcher in self.patchers:
+            patcher.stop()
+        super(TestOpenStackPerfTask, self).beforeTearDown()
+
+    def write(self, dpName, value, rrdType, **kwargs):
+        d = defer.Deferred()
+        self.writes.append((value, d))
+        return d
+
+    def complete(self, failed=()):
+        # Complete the oldest write, and return its value.
+        value, d = self.writes.pop(0)
+        if value in failed:
+            d.errback(Exception('write failed'))
+        else:
+            d.callback(None)
+        return value
+
+    def enqueue(self, count):
+        dp = self.registry.get_datapoints('os', 'a', 'cpu')[0]
+        for i in range(count):
+            self.queue.append((dp, float(i), 1000.0 + i), 'os')
+
+    def test_concurrency(self):
+        self.enqueue(7)
+        finished = []
+        self.task.doTask().addCallback(finished.append)
+        self.assertEquals(len(self.writes), 2)
+
+        written = []
+        while self.writes:
+            # no more than publishconcurrency writes are outstanding
+            self.assertTrue(len(self.writes) <= 2)
+            written.append(self.complete())
+
+        self.assertEquals(written, [float(i) for i in range(7)])
+        self.assertEquals(len(self.queue), 0)
+        self.assertEquals(finished, [None])
+
+    def test_write(self):
+        # the datapoint's details are written from its PublishRecord
+        self.enqueue(1)
+        self.task.doTask()
+        self.complete()
+        args, kwargs = self.dataService.writeMetricWithMetadata.call_args
+        self.assertEquals(args, ('cpu_cpu', 0.0, 'GAUGE'))
+        self.assertEquals(
+            kwargs, dict(timestamp=1000.0, min=0, max=None, metadata=None))
+
+    def test_overlapping_runs(self):
+        self.enqueue(3)
+        runs = self.task.stats.runs
+        finished = []
+        self.task.doTask().addCallback(finished.append)
+
+        # a run which starts while the previous one is in progress does nothing
+        self.assertTrue(self.task.doTask().called)
+        self.assertEquals(len(self.writes), 2)
+
+        while self.writes:
+            self.complete()
+        self.assertEquals(finished, [None])
+        self.assertEquals(self.task.stats.runs, runs + 1)
+
+    def test_failed_write(self):
+        self.enqueue(5)
+        finished = []
+        self.task.doTask().addCallback(finished.append)
+
+        # a failed write does not stop the rest being written
+        written = []
+        while self.writes:
+            written.append(self.complete(failed=(1.0,)))
+
+        self.assertEquals(written, [float(i) for i in range(5)])
+        self.assertEquals(finished, [None])
+
+
+class TestDrainScheduler(BaseTestCase):
+
+    def afterSetUp(self):
+        super(TestDrainScheduler, self).afterSetUp()
+        self.clock = task.Clock()
+        self.patcher = patch.object(zenopenstack, 'reactor', self.clock)
+        self.patcher.start()
+
+        self.queue = DeviceQueues('metrics')
+        self.task = Mock()
+        self.task.doTask.return_value = defer.succeed(None)
+        self.scheduler = DrainScheduler()
+        self.scheduler.register(self.queue, self.task, threshold=10, max_age=5)
+
+    def beforeTearDown(self):
+        self.patcher.stop()
+        super(TestDrainScheduler, self).beforeTearDown()
+
+    def fill(self, count):
+        for i in range(count):
+            self.queue.append(i, 'os')
+            self.scheduler.notify(self.queue)
+
+    def test_threshold(self):
+        self.fill(10)
+        self.clock.advance(0)
+        self.assertEquals(self.task.doTask.call_count, 1)
+
+    def test_max_age(self):
+        self.fill(3)
+        self.clock.advance(4)
+        self.assertEquals(self.task.doTask.call_count, 0)
+
+        # notifications are coalesced into one drain
+        self.clock.advance(1)
+        self.assertEquals(self.task.doTask.call_count, 1)
+
+    def test_threshold_after_max_age(self):
+        # a pending drain is brought forward once the threshold is reached
+        self.fill(3)
+        self.clock.advance(1)
+        self.fill(7)
+        self.clock.advance(0)
+        self.assertEquals(self.task.doTask.call_count, 1)
+
+        self.clock.advance(10)
+        self.assertEquals(self.task.doTask.call_count, 1)
+
+    def test_empty(self):
+        self.fill(3)
+        self.queue.popbatch(3)
+        self.clock.advance(5)
+        self.assertEquals(self.task.doTask.call_count, 0)
+
+    def test_unregistered(self):
+        scheduler = DrainScheduler()
+        scheduler.register(self.queue, self.task, threshold=0, max_age=0)
+        self.queue.append(0, 'os')
+        scheduler.notify(self.queue)
+        self.assertEquals(self.clock.getDelayedCalls(), [])
+
+
+class TestOpenStackVnicTask(BaseTestCase):
+
+    instanceUUID = '95223d22-d3af-4b06-a91c-81114d557bd1'
+
+    def afterSetUp(self):
+        super(TestOpenStackVnicTask, self).afterSetUp()
+
+        self.registry = Registry()
+        self.registry.set_config('os', config([datasource(self.instanceUUID)]))
+        self.patchers = [
+            patch.object(zenopenstack, 'REGISTRY', self.registry),
+            patch.object(zenopenstack.zope.component, 'queryUtility',
+                         lambda interface, name='': preferences()),
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+
+        self.task = OpenStackVnicTask('zenopenstack-vnic', 'zenopenstack-vnic')
+
+    def beforeTearDown(self):
+        for patcher in self.patchers:
+            patcher.stop()
+        super(TestOpenStackVnicTask, self).beforeTearDown()
+
+    def test_find_vnic(self):
+        self.assertEquals(
+            self.task.find_vnic('os', 'instance-00000001-%s-tap908bc571-0d' % self.instanceUUID),
+            (self.instanceUUID, 'server-%s' % self.instanceUUID, 'tap908bc571-0d'))
+
+        # an instance name which looks like a UUID, but isn't a known instance
+        self.assertEquals(
+            self.task.find_vnic(
+                'os', 'vm-00000000-0000-0000-0000-000000000000-%s-tap0' % self.instanceUUID),
+            (self.instanceUUID, 'server-%s' % self.instanceUUID, 'tap0'))
+
+    def test_uppercase(self):
+        self.assertEquals(
+            self.task.find_vnic('os', 'instance-00000001-%s-tap0' % self.instanceUUID.upper()),
+            (self.instanceUUID, 'server-%s' % self.instanceUUID, 'tap0'))
+
+    def test_overlapping(self):
+        # UUID-shaped names either side of the instance's UUID, each sharing
+        # the hyphen which separates it from the UUID
+        other = '00000000-0000-0000-0000-000000000000'
+        resourceId = 'vm-%s-%s-%s-tap0' % (other, self.instanceUUID.upper(), other)
+        self.assertEquals(
+            self.task.find_vnic('os', resourceId),
+            (self.instanceUUID, 'server-%s' % self.instanceUUID, '%s-tap0' % other))
+
+    def test_unknown_instance(self):
+        self.assertEquals(
+            self.task.find_vnic('os', 'instance-00000002-00000000-0000-0000-0000-000000000000-tap0'),
+            None)
+        self.assertEquals(
+            self.task.find_vnic('other', 'instance-00000001-%s-tap0' % self.instanceUUID),
+            None)
+        self.assertEquals(self.task.find_vnic('os', 'instance-00000001-tap0'), None)
+
+        # the UUID must be followed by the vNIC name
+        self.assertEquals(self.task.find_vnic('os', 'instance-00000001-%s' % self.instanceUUID), None)
+
+
+class TestOpenStackEventTask(BaseTestCase):
+
+    def afterSetUp(self):
+        super(TestOpenStackEventTask, self).afterSetUp()
+
+        self.queue = DeviceQueues('events')
+        self.collector = Mock()
+        utilities = {ICollector: self.collector}
+        self.patchers = [
+            patch.object(zenopenstack, 'EVENT_QUEUE', self.queue),
+            patch.object(zenopenstack.zope.component, 'queryUtility',
+                         lambda interface, name='': utilities.get(interface, preferences())),
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+
+        self.task = OpenStackEventTask('zenopenstack-events', 'zenopenstack-events')
+
+    def beforeTearDown(self):
+        for patcher in self.patchers:
+            patcher.stop()
+        super(TestOpenStackEventTask, self).beforeTearDown()
+
+    def test_send(self):
+        for i in range(3):
+            self.queue.append({'summary': str(i)}, 'os')
+
+        # sendEvent may return a deferred, or not
+        self.collector.sendEvent.side_effect = [defer.succeed(None), None, defer.succeed(None)]
+        finished = []
+        self.task.doTask().addCallback(finished.append)
+
+        self.assertEquals(finished, [None])
+        self.assertEquals(
+            [args[0]['summary'] for args, kwargs in self.collector.sendEvent.call_args_list],
+            ['0', '1', '2'])
+        self.assertEquals(len(self.queue), 0)
+
+
+class TestTimeSlicer(BaseTestCase):
+
+    def afterSetUp(self):
+        super(TestTimeSlicer, self).afterSetUp()
+        self.now = 1000.0
+        self.clock = task.Clock()
+        self.patchers = [
+            patch.object(zenopenstack, 'reactor', self.clock),
+            patch.object(zenopenstack, 'time', Mock(time=lambda: self.now)),
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+
+        self.stats = TimeSliceStats('zenopenstack-test')
+        self.slicer = TimeSlicer(self.stats, 0.5)
+
+    def beforeTearDown(self):
+        for patcher in self.patchers:
+            patcher.stop()
+        super(TestTimeSlicer, self).beforeTearDown()
+
+    def test_expired(self):
+        self.now += 0.25
+        self.assertFalse(self.slicer.expired())
+        self.now += 0.25
+        self.assertTrue(self.slicer.expired())
+
+    def test_pause(self):
+        self.now += 0.5
+        d = self.slicer.pause()
+        self.assertFalse(d.called)
+        self.assertEquals(self.stats.slices, 1)
+
+        # the budget starts again once the reactor has had its turn
+        self.now += 1
+        self.clock.advance(0)
+        self.assertTrue(d.called)
+        self.assertFalse(self.slicer.expired())
+
+    def test_wait(self):
+        # time spent waiting on a deferred is not counted
+        self.now += 0.25
+        d = defer.Deferred()
+        waited = []
+        self.slicer.wait(d).addCallback(waited.append)
+        self.now += 10
+        d.callback('result')
+        self.assertEquals(waited, ['result'])
+        self.assertFalse(self.slicer.expired())
+
+        # nor is a deferred which has already fired, or a value which is
+        # not a deferred at all
+        self.assertTrue(self.slicer.wait(defer.succeed(None)).called)
+        self.assertEquals(self.slicer.wait(None), None)
+        self.slicer.finish()
+        self.assertEquals(self.stats.slices, 2)
+        self.assertEquals(self.stats.total_time, 0.25)
+        self.assertEquals(self.stats.max_time, 0.25)
+
+
+class TestStallDetector(BaseTestCase):
+
+    def afterSetUp(self):
+        super(TestStallDetector, self).afterSetUp()
+        self.now = 1000.0
+        self.patcher = patch.object(zenopenstack, 'time', Mock(time=lambda: self.now))
+        self.patcher.start()
+
+        # As started with a threshold of a second, but without the
+        # LoopingCall or watchdog thread, which the test runs itself.
+        self.detector = StallDetector()
+        self.detector.threshold = 1.0
+        self.detector.interval = 0.1
+        self.detector.last_tick = self.now
+        self.detector.reactor_thread = threading.current_thread().ident
+
+    def beforeTearDown(self):
+        self.patcher.stop()
+        super(TestStallDetector, self).beforeTearDown()
+
+    def watch(self):
+        # Run one check of the watchdog thread.
+        self.detector.stopped = Mock()
+        self.detector.stopped.wait.side_effect = [False, True]
+        self.detector.watch()
+
+    def test_disabled_by_default(self):
+        parser = optparse.OptionParser()
+        Preferences().buildOptions(parser)
+        options, args = parser.parse_args([])
+        self.assertEquals(options.stallthreshold, 0)
+
+    def test_not_stalled(self):
+        for i in range(3):
+            self.now += 0.15
+            self.watch()
+            self.detector.tick()
+
+        self.assertEquals(self.detector.stalls, 0)
+        self.assertEquals(self.detector.captured, None)
+
+    def test_stall(self):
+        # the watchdog captures the stack of the blocked reactor thread
+        self.now += 2.1
+        self.watch()
+        self.assertTrue('test_stall' in self.detector.captured[1])
+
+        # and once the reactor runs again, the stall is counted with it
+        self.detector.tick()
+        self.assertEquals(self.detector.stalls, 1)
+        self.assertAlmostEquals(self.detector.max_stall, 2.0)
+        self.assertTrue('test_stall' in self.detector.recent[0]['stack'])
+        self.assertEquals(self.detector.captured, None)
+
+        # after which, it is cleared
+        self.now += 0.1
+        self.watch()
+        self.detector.tick()
+        self.assertEquals(self.detector.stalls, 1)
+        self.assertEquals(self.detector.captured, None)
+
+
+def test_suite():
+    from unittest import TestSuite, makeSuite
+    suite = TestSuite()
+    suite.addTest(makeSuite(TestOpenStackPerfTask))
+    suite.addTest(makeSuite(TestDrainScheduler))
+    suite.addTest(makeSuite(TestOpenStackVnicTask))
+    suite.addTest(makeSuite(TestOpenStackEventTask))
+    suite.addTest(makeSuite(TestTimeSlicer))
+    suite.addTest(makeSuite(TestStallDetector))
+    return suite
+
+
+if __name__ == "__main__":
+    from zope.testrunner.runner import Runner
+    runner = Runner(found_suites=[test_suite()])
+    runner.run()
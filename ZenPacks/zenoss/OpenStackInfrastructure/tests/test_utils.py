@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2026, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+import json
+from StringIO import StringIO
+
+from Products.ZenTestCase.BaseTestCase import BaseTestCase
+
+from ZenPacks.zenoss.OpenStackInfrastructure.utils import (
+    EventTypeFilter,
+    iter_json_array,
+    JSONStreamError,
+    TokenBucket
+)
+
+
+class TestIterJsonArray(BaseTestCase):
+
+    def decode(self, body, chunk_size=3):
+        return list(iter_json_array(StringIO(body), chunk_size=chunk_size))
+
+    def test_matches_json_loads(self):
+        data = [
+            {"resource_id": "r1", "name": "cpu_util", "volume": 12.5,
+             "metadata": {"tags": ["a", "b,]"]}},
+            12345678,
+            "string",
+            None,
+            []
+        ]
+        for body in (json.dumps(data), json.dumps(data, indent=4)):
+            for chunk_size in (1, 2, 7, 65536):
+                self.assertEquals(self.decode(body, chunk_size), data)
+
+    def test_numbers(self):
+        # Numbers which are split across chunks, and may look complete
+        # before the rest of them has been read.
+        for body in ('[1.5e10]', '[15000000000.0]', '[1.5, 2]', '[-0.25E-3 , 7]', '[12345678901234567890]'):
+            for chunk_size in range(1, len(body) + 1):
+                self.assertEquals(self.decode(body, chunk_size), json.loads(body))
+
+    def test_empty_array(self):
+        self.assertEquals(self.decode(" [ ] "), [])
+
+    def test_invalid(self):
+        for body in ("", "{}", "[1,", "[1 2]", "[1,]", "[1] x", '[{"a": }]'):
+            self.assertRaises(JSONStreamError, self.decode, body)
+
+    def test_elements_before_error(self):
+        # Elements preceding a syntax error are returned before it is raised.
+        decoded = []
+        try:
+            for element in iter_json_array(StringIO('[1, 2, oops]')):
+                decoded.append(element)
+        except JSONStreamError:
+            pass
+        self.assertEquals(decoded, [1, 2])
+
+
+class TestEventTypeFilter(BaseTestCase):
+
+    def test_names(self):
+        event_types = EventTypeFilter(['compute.instance.create.error', ''])
+        self.assertTrue('compute.instance.create.error' in event_types)
+        self.assertFalse('compute.instance.create.end' in event_types)
+        self.assertFalse(None in event_types)
+        self.assertEquals(len(event_types), 1)
+
+    def test_patterns(self):
+        event_types = EventTypeFilter(['compute.instance.*', 'volume.*.end'])
+        self.assertTrue('compute.instance.create.end' in event_types)
+        self.assertTrue('compute.instance.power_off.start' in event_types)
+        self.assertTrue('volume.create.end' in event_types)
+        self.assertFalse('volume.create.start' in event_types)
+        self.assertFalse('compute.metrics.update' in event_types)
+
+        # cached results are the same
+        self.assertTrue('compute.instance.create.end' in event_types)
+        self.assertFalse('volume.create.start' in event_types)
+
+    def test_globs(self):
+        event_types = EventTypeFilter([' port.create.end ', 'router.?pdate.end', 'volume.[ad]*.end'])
+        self.assertEquals(list(event_types), ['port.create.end', 'router.?pdate.end', 'volume.[ad]*.end'])
+        self.assertTrue('port.create.end' in event_types)
+        self.assertTrue('router.update.end' in event_types)
+        self.assertTrue('volume.attach.end' in event_types)
+        self.assertTrue('volume.detach.end' in event_types)
+        self.assertFalse('volume.create.end' in event_types)
+
+        # patterns match the whole event type, and dots are not wildcards
+        self.assertFalse('router.update.end.x' in event_types)
+        self.assertFalse('routerxupdate.end' in event_types)
+
+    def test_cache_size(self):
+        event_types = EventTypeFilter(['compute.instance.*'])
+        event_types.cache_size = 10
+        for i in range(100):
+            self.assertTrue('compute.instance.test%d' % i in event_types)
+            self.assertFalse('volume.test%d' % i in event_types)
+            self.assertTrue(len(event_types._cache) <= 10)
+
+    def test_empty(self):
+        for event_types in (EventTypeFilter(), EventTypeFilter(None)):
+            self.assertFalse('compute.instance.create.error' in event_types)
+            self.assertEquals(len(event_types), 0)
+
+
+class TestTokenBucket(BaseTestCase):
+
+    def test_rate(self):
+        now = [1000.0]
+        bucket = TokenBucket(10, 50, clock=lambda: now[0])
+
+        # a full burst is allowed, and more is taken on credit
+        self.assertTrue(bucket.allowed())
+        bucket.take(80)
+        self.assertFalse(bucket.allowed())
+        self.assertEquals(bucket.wait_time(), 3.0)
+
+        now[0] += 3.5
+        self.assertTrue(bucket.allowed())
+        self.assertEquals(bucket.wait_time(), 0.0)
+
+        # never refills beyond the burst size
+        now[0] += 3600
+        bucket.take(50)
+        self.assertFalse(bucket.allowed())
+
+    def test_debt(self):
+        now = [1000.0]
+        bucket = TokenBucket(10, 50, clock=lambda: now[0])
+
+        # each take adds to the debt, however far into it the bucket is
+        for i in range(4):
+            bucket.take(30)
+        self.assertEquals(bucket.tokens, -70.0)
+        self.assertEquals(bucket.wait_time(), 7.0)
+
+        # which is paid off at the bucket's rate
+        now[0] += 2.5
+        self.assertFalse(bucket.allowed())
+        self.assertEquals(bucket.wait_time(), 4.5)
+
+        now[0] += 4.5
+        self.assertFalse(bucket.allowed())
+        self.assertEquals(bucket.wait_time(), 0.0)
+
+        now[0] += 0.1
+        self.assertTrue(bucket.allowed())
+
+
+def test_suite():
+    from unittest import TestSuite, makeSuite
+    suite = TestSuite()
+    suite.addTest(makeSuite(TestIterJsonArray))
+    suite.addTest(makeSuite(TestEventTypeFilter))
+    suite.addTest(makeSuite(TestTokenBucket))
+    return suite
+
+
+if __name__ == "__main__":
+    from zope.testrunner.runner import Runner
+    runner = Runner(found_suites=[test_suite()])
+    runner.run()
@@ -0,0 +1,306 @@
+#!/usr/bin/env python
+
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2026, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+from collections import defaultdict
+import json
+from StringIO import StringIO
+
+from mock import Mock, patch
+from twisted.internet import defer
+from twisted.web.server import NOT_DONE_YET
+from twisted.web.test.requesthelper import DummyRequest
+
+from Products.ZenTestCase.BaseTestCase import BaseTestCase
+
+from ZenPacks.zenoss.OpenStackInfrastructure import zenopenstack
+from ZenPacks.zenoss.OpenStackInfrastructure.profiling import MAX_SECONDS, Profiler
+from ZenPacks.zenoss.OpenStackInfrastructure.tests.test_registry import config, datasource
+from ZenPacks.zenoss.OpenStackInfrastructure.zenopenstack import (
+    CeilometerV1Samples,
+    DeviceQueues,
+    HTTPDebugLogBuffer,
+    Health,
+    IngestWorkers,
+    Registry
+)
+
+
+def site(**options):
+    # The zenopenstack site, with the options used by its resources.
+    defaults = dict(
+        streamingjson=False, devicesamplerate=0, deviceeventrate=0,
+        deviceburstseconds=10, retryafter=30)
+    defaults.update(options)
+    return Mock(options=Mock(**defaults), ingest_workers=None, request_buffer=HTTPDebugLogBuffer())
+
+
+class Request(DummyRequest):
+    # A DummyRequest with the credentials and response code of a real one.
+
+    code = 200
+    code_message = 'OK'
+
+    def __init__(self, postpath, user='', password=''):
+        DummyRequest.__init__(self, postpath)
+        self.user = user
+        self.password = password
+
+    def getUser(self):
+        return self.user
+
+    def getPassword(self):
+        return self.password
+
+    def setResponseCode(self, code, message=None):
+        DummyRequest.setResponseCode(self, code, message)
+        self.code = code
+
+
+def post(resource, payload, device_id='os'):
+    # POST payload (as JSON) to resource, returning the request and the
+    # response body.
+    request = Request([device_id])
+    request.method = 'POST'
+    request.uri = '/ceilometer/v1/samples/%s' % device_id
+    request.requestHeaders.setRawHeaders('content-type', ['application/json'])
+    request.content = StringIO(json.dumps(payload))
+    request._zaction = resource.site.request_buffer.new_actions()
+    return request, resource.render_POST(request)
+
+
+def samples(count, resourceId='a'):
+    return [
+        dict(resource_id=resourceId, name='cpu', volume=float(i),
+             timestamp='2026-01-01T00:00:%02d' % i)
+        for i in range(count)]
+
+
+class TestCeilometerV1Samples(BaseTestCase):
+
+    def afterSetUp(self):
+        super(TestCeilometerV1Samples, self).afterSetUp()
+
+        self.registry = Registry()
+        self.registry.set_config('os', config([datasource('a')]))
+        self.patchers = [
+            patch.object(zenopenstack, 'REGISTRY', self.registry),
+            patch.object(zenopenstack, 'DEVICE_LIMITS', defaultdict(dict)),
+            patch.object(zenopenstack, 'DEVICE_RATES', defaultdict(zenopenstack.DEVICE_RATES.default_factory)),
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+
+        self.queue = DeviceQueues('metrics')
+        self.queue.limit = 2
+        self.resource = CeilometerV1Samples(self.queue)
+        self.resource.site = site()
+
+    def beforeTearDown(self):
+        for patcher in self.patchers:
+            patcher.stop()
+        super(TestCeilometerV1Samples, self).beforeTearDown()
+
+    def test_accepted(self):
+        request, body = post(self.resource, samples(2))
+        self.assertEquals(body, b"")
+        self.assertEquals(len(self.queue), 2)
+        self.assertEquals(len(request._zaction['metrics']), 2)
+
+    def test_partially_accepted(self):
+        # the queue fills part way through the request; the rest of it is
+        # dropped, rather than the whole request being resent
+        request, body = post(self.resource, samples(3))
+        self.assertEquals(body, b"")
+        self.assertEquals(request.responseCode, None)
+        self.assertEquals(len(self.queue), 2)
+        self.assertEquals(len(request._zaction['dropped']), 1)
+
+    def test_queue_full(self):
+        post(self.resource, samples(2))
+        request, body = post(self.resource, samples(1))
+        self.assertEquals(request.responseCode, 503)
+        self.assertEquals(request.responseHeaders.getRawHeaders('retry-after'), ['30'])
+        self.assertEquals(len(request._zaction['dropped']), 0)
+
+    def test_throttled(self):
+        self.queue.limit = 100
+        self.resource.site = site(devicesamplerate=2, deviceburstseconds=2)
+        throttled = zenopenstack.DEVICE_RATES['os']['samples_throttled']
+
+        # a request is accepted while the device has any of its burst left,
+        # and all of its samples are taken from it
+        request, body = post(self.resource, samples(9))
+        self.assertEquals(len(self.queue), 9)
+
+        limit = zenopenstack.DEVICE_LIMITS['os']['samples']
+        now = [limit.updated]
+        limit.clock = lambda: now[0]
+
+        # the next is refused until the debt has been paid off
+        request, body = post(self.resource, samples(1))
+        self.assertEquals(request.responseCode, 429)
+        self.assertEquals(request.responseHeaders.getRawHeaders('retry-after'), ['3'])
+        self.assertEquals(throttled.count, 1)
+        self.assertEquals(len(self.queue), 9)
+
+        # and asked to retry after at least a second, rather than at once
+        now[0] += 2.5
+        request, body = post(self.resource, samples(1))
+        self.assertEquals(request.responseCode, 429)
+        self.assertEquals(request.responseHeaders.getRawHeaders('retry-after'), ['1'])
+        self.assertEquals(throttled.count, 2)
+
+        now[0] += 0.5
+        request, body = post(self.resource, samples(1))
+        self.assertEquals(request.responseCode, None)
+        self.assertEquals(len(self.queue), 10)
+
+    def test_unknown_device(self):
+        request, body = post(self.resource, samples(1), device_id='other')
+        self.assertEquals(request.responseCode, 404)
+        self.assertEquals(len(self.queue), 0)
+
+
+class TestIngestWorkers(BaseTestCase):
+
+    def afterSetUp(self):
+        super(TestIngestWorkers, self).afterSetUp()
+
+        self.registry = Registry()
+        self.registry.set_config('os', config([datasource('a')]))
+
+        # payloads being decoded "in a worker thread", which the test
+        # completes itself
+        self.decoding = []
+        self.patchers = [
+            patch.object(zenopenstack, 'REGISTRY', self.registry),
+            patch.object(zenopenstack.threads, 'deferToThreadPool', self.deferToThreadPool),
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+
+        self.queue = DeviceQueues('metrics')
+        self.resource = CeilometerV1Samples(self.queue)
+        self.resource.site = site()
+        self.workers = self.resource.site.ingest_workers = IngestWorkers(2, 1, 30)
+
+    def beforeTearDown(self):
+        for patcher in self.patchers:
+            patcher.stop()
+        super(TestIngestWorkers, self).beforeTearDown()
+
+    def deferToThreadPool(self, reactor, pool, f):
+        d = defer.Deferred()
+        self.decoding.append((f, d))
+        return d
+
+    def decode(self):
+        f, d = self.decoding.pop(0)
+        d.callback(f())
+
+    def test_decoded(self):
+        request, body = post(self.resource, samples(3))
+        self.assertEquals(body, NOT_DONE_YET)
+        self.assertEquals(self.workers.pending, 1)
+        self.assertEquals(len(self.queue), 0)
+
+        # the decoded samples are stored, and the request finished, back in
+        # the reactor thread
+        self.decode()
+        self.assertEquals(self.workers.pending, 0)
+        self.assertEquals(len(self.queue), 3)
+        self.assertEquals(request.written, [b""])
+        self.assertEquals(request.finished, 1)
+
+    def test_saturated(self):
+        # every thread is busy, and the backlog is full
+        for i in range(3):
+            self.assertFalse(self.workers.saturated())
+            post(self.resource, samples(1))
+        self.assertTrue(self.workers.saturated())
+
+        request, body = post(self.resource, samples(1))
+        self.assertEquals(request.code, 503)
+        self.assertEquals(request.responseHeaders.getRawHeaders('retry-after'), ['30'])
+        self.assertEquals(len(self.decoding), 3)
+
+        # until one of them completes
+        self.decode()
+        self.assertFalse(self.workers.saturated())
+        request, body = post(self.resource, samples(1))
+        self.assertEquals(body, NOT_DONE_YET)
+
+
+class TestProfile(BaseTestCase):
+
+    def afterSetUp(self):
+        super(TestProfile, self).afterSetUp()
+        self.resource = Health()
+        self.resource.site = site(profile_username='zenoss', profile_password='secret')
+        self.resource.site.profiler = Profiler()
+
+    def profile(self, user='zenoss', password='secret', **args):
+        request = Request(['profile'], user, password)
+        request.uri = '/health/profile'
+        request.args = dict((name, [str(value)]) for name, value in args.iteritems())
+        return request, self.resource.render_profile(request)
+
+    def test_disabled(self):
+        # unless a password is set
+        self.resource.site.options.profile_password = ''
+        request, body = self.profile(password='')
+        self.assertEquals(request.code, 404)
+
+    def test_unauthorized(self):
+        for user, password in (('zenoss', 'wrong'), ('other', 'secret'), ('', '')):
+            request, body = self.profile(user, password)
+            self.assertEquals(request.code, 401)
+            self.assertEquals(
+                request.responseHeaders.getRawHeaders('www-authenticate'),
+                ['Basic realm="zenopenstack"'])
+        self.assertFalse(self.resource.site.profiler.running)
+
+    def test_busy(self):
+        self.resource.site.profiler.running = True
+        request, body = self.profile(seconds=1)
+        self.assertEquals(request.code, 409)
+
+    def test_max_seconds(self):
+        for seconds in (0, MAX_SECONDS + 1, 'x'):
+            request, body = self.profile(seconds=seconds)
+            self.assertEquals(request.code, 400)
+        self.assertFalse(self.resource.site.profiler.running)
+
+    def test_profile(self):
+        profiler = self.resource.site.profiler = Mock()
+        profiler.profile.return_value = defer.succeed('stats')
+        request, body = self.profile(seconds=MAX_SECONDS, sort='time')
+
+        self.assertEquals(body, NOT_DONE_YET)
+        profiler.profile.assert_called_with(MAX_SECONDS, sort='time')
+        self.assertEquals(request.written, ['stats'])
+        self.assertEquals(request.finished, 1)
+        self.assertEquals(request.responseHeaders.getRawHeaders('content-type'), ['text/plain'])
+
+
+def test_suite():
+    from unittest import TestSuite, makeSuite
+    suite = TestSuite()
+    suite.addTest(makeSuite(TestCeilometerV1Samples))
+    suite.addTest(makeSuite(TestIngestWorkers))
+    suite.addTest(makeSuite(TestProfile))
+    return suite
+
+
+if __name__ == "__main__":
+    from zope.testrunner.runner import Runner
+    runner = Runner(found_suites=[test_suite()])
+    runner.run()
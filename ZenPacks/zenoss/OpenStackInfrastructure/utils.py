@@ -24,8 +24,10 @@ from Products.ZenUtils.guid.interfaces import IGlobalIdentifier
 from collections import deque
 import dateutil
 import datetime
+import fnmatch
 import functools
 import importlib
+import json
 import pytz
 import time
 
@@ -199,6 +201,97 @@ def amqp_timestamp_to_int(timestamp_string):
     return (dt - _EPOCH).total_seconds()
 
 
+class JSONStreamError(ValueError):
+    """Raised by iter_json_array when its input is not a valid JSON array."""
+
+
+_JSON_DECODER = json.JSONDecoder()
+_JSON_WHITESPACE = re.compile(r'[ \t\n\r]*')
+# What may follow an element of an array.
+_JSON_DELIMITERS = frozenset(' \t\n\r,]')
+
+
+def iter_json_array(fileobj, chunk_size=64 * 1024):
+    '''
+    Incrementally decode a JSON array read from fileobj, yielding its
+    elements one at a time.
+
+    Only the element currently being decoded (plus at most one chunk of
+    unread input) is held in memory, rather than the entire decoded array,
+    so memory use is bounded by the size of the largest element instead
+    of the size of the whole document.
+
+    Because decoding happens as the generator is consumed, JSONStreamError
+    may be raised part way through iteration, after some elements have
+    already been returned.
+    '''
+
+    buf = ''
+    pos = 0
+    eof = False
+    state = 'start'   # start, first, value, separator, end
+
+    while True:
+        pos = _JSON_WHITESPACE.match(buf, pos).end()
+
+        if pos < len(buf):
+            char = buf[pos]
+
+            if state == 'start':
+                if char != '[':
+                    raise JSONStreamError("Expecting JSON array at offset %d" % pos)
+                pos += 1
+                state = 'first'
+                continue
+
+            if state == 'separator':
+                if char == ',':
+                    state = 'value'
+                elif char == ']':
+                    state = 'end'
+                else:
+                    raise JSONStreamError("Expecting , or ] at offset %d" % pos)
+                pos += 1
+                continue
+
+            if state == 'end':
+                raise JSONStreamError("Extra data after JSON array at offset %d" % pos)
+
+            if state == 'first' and char == ']':
+                pos += 1
+                state = 'end'
+                continue
+
+            try:
+                value, end = _JSON_DECODER.raw_decode(buf, pos)
+            except ValueError, e:
+                if eof:
+                    raise JSONStreamError(str(e))
+                end = None
+
+            # If the value was cut off by the end of the buffer (or may have
+            # been), read more input and decode it again.  A number may look
+            # complete when it is not (say, "1.5" of "1.5e10"), so a value is
+            # only taken as complete once what follows it has been read.
+            if end is not None and (eof or (end < len(buf) and buf[end] in _JSON_DELIMITERS)):
+                yield value
+                pos = end
+                state = 'separator'
+                continue
+
+        elif eof:
+            if state == 'end':
+                return
+            raise JSONStreamError("Unexpected end of JSON array")
+
+        chunk = fileobj.read(chunk_size)
+        if chunk:
+            buf = buf[pos:] + chunk
+            pos = 0
+        else:
+            eof = True
+
+
 def sleep(sec):
     # Simple helper to delay asynchronously for some number of seconds.
     return deferLater(reactor, sec, lambda: None)
@@ -251,6 +344,100 @@ class ExpiringFIFO(object):
                 break
 
 
+class EventTypeFilter(object):
+    '''
+    Matches event types against a list of event type names, which may
+    include glob patterns such as 'compute.instance.*'.
+
+    Plain names are held in a frozenset, and any patterns are compiled into
+    a single regular expression.  Since only a limited number of distinct
+    event types are seen, the result for each is cached, so membership
+    tests are a dict lookup regardless of the number of patterns.
+    '''
+
+    cache_size = 1000
+
+    def __init__(self, event_types=()):
+        names = set()
+        patterns = []
+        for event_type in event_types or ():
+            event_type = event_type.strip()
+            if not event_type:
+                continue
+            if any(c in event_type for c in '*?['):
+                patterns.append(event_type)
+            else:
+                names.add(event_type)
+
+        self.names = frozenset(names)
+        self.patterns = tuple(patterns)
+        if patterns:
+            self.regex = re.compile('|'.join(fnmatch.translate(p) for p in patterns))
+        else:
+            self.regex = None
+        self._cache = {}
+
+    def __contains__(self, event_type):
+        try:
+            return self._cache[event_type]
+        except KeyError:
+            pass
+
+        matched = event_type in self.names or bool(
+            self.regex and event_type and self.regex.match(event_type))
+
+        if len(self._cache) >= self.cache_size:
+            self._cache.clear()
+        self._cache[event_type] = matched
+
+        return matched
+
+    def __len__(self):
+        return len(self.names) + len(self.patterns)
+
+    def __iter__(self):
+        return iter(sorted(self.names) + list(self.patterns))
+
+    def __repr__(self):
+        return '<%s %r>' % (self.__class__.__name__, list(self))
+
+
+class TokenBucket(object):
+    '''
+    Limits a rate to `rate` per second on average, in bursts of up to
+    `burst`.
+
+    Since the number of items in a request is not known until it has been
+    processed, they are taken from the bucket afterwards, which may leave it
+    in debt.  Nothing more is allowed until it has refilled.
+    '''
+
+    def __init__(self, rate, burst, clock=time.time):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.clock = clock
+        self.tokens = self.burst
+        self.updated = clock()
+
+    def refill(self):
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def allowed(self):
+        self.refill()
+        return self.tokens > 0
+
+    def take(self, count):
+        self.refill()
+        self.tokens -= count
+
+    def wait_time(self):
+        # Seconds until something will be allowed again.
+        self.refill()
+        return max(0.0, -self.tokens) / self.rate
+
+
 def findIpInterfacesByMAC(dmd, macaddresses, interfaceType=None):
     '''
     Yield IpInterface objects that match the parameters.
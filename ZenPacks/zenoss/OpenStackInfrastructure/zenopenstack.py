@@ -19,26 +19,36 @@ log = logging.getLogger('zen.OpenStack.zenopenstack')
 
 import Globals
 
+from array import array
 import cgi
 from collections import defaultdict, deque
 import datetime
 from functools import partial
+from itertools import izip
+import hmac
 import json
+import math
 from metrology import Metrology
 from metrology.registry import registry as metrology_registry
-from metrology.instruments import Meter
+from metrology.instruments import Counter, Gauge, Histogram, Meter, Timer
 import optparse
+import os
+import random
 import re
 import time
 from pprint import pformat
 import socket
+import sys
+import threading
+import traceback
 
-from twisted.internet import reactor, defer, task
+from twisted.internet import reactor, defer, task, threads
 from twisted.python import log as twisted_log
+from twisted.python.threadpool import ThreadPool
 from twisted.spread import pb
 from twisted.web.http import combinedLogFormatter, datetimeToLogString
 from twisted.web.resource import Resource as TwistedResource, NoResource, ErrorPage
-from twisted.web.server import Site as TwistedSite
+from twisted.web.server import Site as TwistedSite, NOT_DONE_YET
 
 import zope.interface
 import zope.component
@@ -66,25 +76,136 @@ unused(Globals)
 
 from ZenPacks.zenoss.OpenStackInfrastructure.events import event_is_mapped, map_event, event_component_id
 from ZenPacks.zenoss.OpenStackInfrastructure.datamaps import ConsolidatingObjectMapQueue
-from ZenPacks.zenoss.OpenStackInfrastructure.utils import amqp_timestamp_to_int
-from ZenPacks.zenoss.OpenStackInfrastructure.services.OpenStackConfig import OpenStackDataSourceConfig
+from ZenPacks.zenoss.OpenStackInfrastructure.utils import (
+    amqp_timestamp_to_int,
+    EventTypeFilter,
+    iter_json_array,
+    JSONStreamError,
+    TokenBucket
+)
+from ZenPacks.zenoss.OpenStackInfrastructure.services.OpenStackConfig import (
+    OpenStackConfigDelta,
+    OpenStackDataSourceConfig,
+    resolve_datapoints
+)
 from ZenPacks.zenoss.OpenStackInfrastructure import manhole
+from ZenPacks.zenoss.OpenStackInfrastructure.journal import Journal
+from ZenPacks.zenoss.OpenStackInfrastructure.profiling import Profiler, ProfilerBusy
 
 pb.setUnjellyableForClass(OpenStackDataSourceConfig, OpenStackDataSourceConfig)
+pb.setUnjellyableForClass(OpenStackConfigDelta, OpenStackConfigDelta)
 
 # Twisted manhole defaults.
 DEFAULT_MANHOLE_PORT = 7777
 DEFAULT_MANHOLE_USERNAME = 'zenoss'
 DEFAULT_MANHOLE_PASSWORD = 'zenoss'
 
+# /health/profile defaults.
+DEFAULT_PROFILE_USERNAME = 'zenoss'
+
+
+class ActionCount(object):
+    """
+    Stands in for one of the lists in request._zaction when only the
+    number of actions is to be kept, not the actions themselves.
+    """
+
+    __slots__ = ('count',)
+
+    def __init__(self):
+        self.count = 0
+
+    def append(self, item):
+        self.count += 1
+
+    def __len__(self):
+        return self.count
+
+
+class RequestMeters(object):
+    """
+    The Metrology meters updated for each request with a given method and
+    URI from a given client.
+    """
+
+    __slots__ = (
+        'requests', 'method_requests', 'uri_requests', 'client_requests',
+        'client_errors', 'datamaps', 'events', 'metrics'
+    )
+
+    def __init__(self, method, uri, client_ip):
+        v = dict(
+            dotted_uri=uri.replace('/', '.').strip('.'),
+            client_ip=client_ip,
+            method=method
+        )
+
+        self.requests = Metrology.meter('http.requests')
+        self.method_requests = Metrology.meter('http.{method}.requests'.format(**v))
+        self.uri_requests = Metrology.meter("http.{method}.{dotted_uri}.requests".format(**v))
+        self.client_requests = Metrology.meter("http.{method}.{dotted_uri}.{client_ip}.requests".format(**v))
+        self.client_errors = Metrology.meter("http.{method}.{dotted_uri}.{client_ip}.errors".format(**v))
+        self.datamaps = Metrology.meter("zenopenstack.{dotted_uri}.{client_ip}.datamaps".format(**v))
+        self.events = Metrology.meter("zenopenstack.{dotted_uri}.{client_ip}.events".format(**v))
+        self.metrics = Metrology.meter("zenopenstack.{dotted_uri}.{client_ip}.metrics".format(**v))
+
 
 class HTTPDebugLogBuffer(object):
-    """Process payload data from ceilometer.publisher.http."""
+    """Process payload data from ceilometer.publisher.http.
+
+    Only a sample (sample_rate) of successful requests are stored, though
+    all error responses are.  Request and response bodies are truncated to
+    max_body bytes, and unless full_actions is set, only the number of
+    each type of zenoss action taken for a request is kept.
+    """
 
-    def __init__(self, cache_size=100):
+    def __init__(self, cache_size=100, sample_rate=1.0, max_body=64 * 1024, full_actions=False):
         # Create a dict cache that consists of deques of size self.cache_size
         self.cache_size = cache_size
         self.cache = defaultdict(partial(deque, maxlen=self.cache_size))
+        self.sample_rate = sample_rate
+        self.max_body = max_body
+        self.full_actions = full_actions
+        self.meters = {}
+
+    def new_actions(self):
+        # Return the initial value for request._zaction
+        if self.full_actions:
+            action = list
+        else:
+            action = ActionCount
+
+        return {
+            "metrics": action(),
+            "maps": action(),
+            "events": action(),
+            "dropped": action()
+        }
+
+    def sampled(self, request):
+        if request.code >= 400 or self.sample_rate >= 1:
+            return True
+        return random.random() < self.sample_rate
+
+    def truncate(self, data):
+        if self.max_body and len(data) > self.max_body:
+            return data[:self.max_body]
+        return data
+
+    def read_body(self, request):
+        # Read (up to max_body bytes of) the request body, which may be in
+        # a temporary file rather than in memory.
+        content = request.content
+        if content is None:
+            return '', 0
+
+        content.seek(0, 2)
+        size = content.tell()
+        content.seek(0)
+
+        if self.max_body:
+            return content.read(self.max_body), size
+        return content.read(), size
 
     def store_request(self, request, response):
         """Store events in the cache, update statistics.
@@ -96,41 +217,57 @@ class HTTPDebugLogBuffer(object):
         client_ip = request.getClientIP()
         client_id = (client_ip, request.uri)
 
-        # Add the client's message to the cache
-        self.cache[client_id].append({
-            'timestamp': datetime.datetime.now(),
-            'response_code': request.code,
-            'response_code_message': request.code_message,
-            'request_body': request.content.getvalue(),
-            'response_body': response,
-            'zenoss_actions': request._zaction
-        })
+        if self.sampled(request):
+            request_body, request_body_size = self.read_body(request)
+            response = response or ''
+
+            if self.full_actions:
+                zenoss_actions = request._zaction
+            else:
+                zenoss_actions = dict(
+                    (k, len(v)) for k, v in request._zaction.iteritems())
+
+            # Add the client's message to the cache
+            self.cache[client_id].append({
+                'timestamp': datetime.datetime.now(),
+                'response_code': request.code,
+                'response_code_message': request.code_message,
+                'request_body': request_body,
+                'request_body_size': request_body_size,
+                'response_body': self.truncate(response),
+                'response_body_size': len(response),
+                'zenoss_actions': zenoss_actions
+            })
 
         # --------------------------------------------------------------------
         # Use Metrology to record the event
         # --------------------------------------------------------------------
-        v = dict(
-            dotted_uri=request.uri.replace('/', '.').strip('.'),
-            client_ip=client_ip,
-            method=request.method.lower()
-        )
+        meters = self.get_meters(request.method.lower(), request.uri, client_ip)
 
-        Metrology.meter('http.requests').mark()
-        Metrology.meter('http.{method}.requests'.format(**v)).mark()
-        Metrology.meter("http.{method}.{dotted_uri}.requests".format(**v)).mark()
-        Metrology.meter("http.{method}.{dotted_uri}.{client_ip}.requests".format(**v)).mark()
+        meters.requests.mark()
+        meters.method_requests.mark()
+        meters.uri_requests.mark()
+        meters.client_requests.mark()
 
         if (request.code >= 400):
-            Metrology.meter("http.{method}.{dotted_uri}.{client_ip}.errors".format(**v)).mark()
+            meters.client_errors.mark()
+
+        if request._zaction['maps']:
+            meters.datamaps.mark(len(request._zaction['maps']))
 
-        for _ in request._zaction['maps']:
-            Metrology.meter("zenopenstack.{dotted_uri}.{client_ip}.datamaps".format(**v)).mark()
+        if request._zaction['events']:
+            meters.events.mark(len(request._zaction['events']))
 
-        for _ in request._zaction['events']:
-            Metrology.meter("zenopenstack.{dotted_uri}.{client_ip}.events".format(**v)).mark()
+        if request._zaction['metrics']:
+            meters.metrics.mark(len(request._zaction['metrics']))
 
-        for _ in request._zaction['metrics']:
-            Metrology.meter("zenopenstack.{dotted_uri}.{client_ip}.metrics".format(**v)).mark()
+    def get_meters(self, method, uri, client_ip):
+        """Return the RequestMeters for a (lowercase) method, URI and client."""
+        key = (method, uri, client_ip)
+        meters = self.meters.get(key)
+        if meters is None:
+            meters = self.meters[key] = RequestMeters(method, uri, client_ip)
+        return meters
 
     def get_client_keys(self):
         """Return list of client IDs monitored."""
@@ -153,6 +290,49 @@ class HTTPDebugLogBuffer(object):
         return None
 
 
+EMPTY_EVENT_TYPE_FILTER = EventTypeFilter()
+
+
+class PublishRecord(object):
+    """
+    What is needed to publish values for a datapoint of a component:
+    its rrdPath, the parts of its (template's) DataPointSkeleton, copied
+    out when the config is loaded so that they are cheap to access for
+    every sample, and the component's metric metadata.
+    """
+
+    __slots__ = (
+        'rrdPath', 'dpName', 'rrdType', 'rrdCreateCommand',
+        'rrdMin', 'rrdMax', 'metadata', 'index'
+    )
+
+    def __init__(self, rrdPath, dp, metadata=None):
+        # position in the Registry's datapoint table
+        self.index = None
+
+        self.rrdPath = rrdPath
+        self.dpName = dp.dpName
+        self.rrdType = dp.rrdType
+        self.rrdCreateCommand = dp.rrdCreateCommand
+        self.rrdMin = dp.rrdMin
+        self.rrdMax = dp.rrdMax
+        self.metadata = metadata
+
+    def matches(self, rrdPath, dp, metadata=None):
+        # Whether this record is a copy of dp (and rrdPath and metadata).
+        return (
+            self.rrdPath == rrdPath and
+            self.dpName == dp.dpName and
+            self.rrdType == dp.rrdType and
+            self.rrdCreateCommand == dp.rrdCreateCommand and
+            self.rrdMin == dp.rrdMin and
+            self.rrdMax == dp.rrdMax and
+            self.metadata == metadata)
+
+    def __repr__(self):
+        return '<%s %s>' % (self.__class__.__name__, self.rrdPath)
+
+
 class Registry(object):
     # Holds all the configured devices, metrics, etc.  Used by the
     # web server to process incoming messages.
@@ -163,6 +343,17 @@ class Registry(object):
         self.resource_bytype = {}
         self.event_types = {}
 
+        # Every PublishRecord, by index.  A datapoint (rrdPath) keeps its
+        # index when the config is reloaded, so an index held in a
+        # ColumnarMetricQueue always resolves to the current record.
+        # Once a datapoint is no longer in any config, its index is freed,
+        # to be reused by another, and its generation is incremented, so
+        # that an index held from before then is known to be stale.
+        self.datapoint_table = []
+        self.datapoint_index = {}
+        self.datapoint_generation = array('i')
+        self.free_indexes = []
+
     def all_devices(self):
         return self.configs.keys()
 
@@ -170,30 +361,158 @@ class Registry(object):
         return device_id in self.configs
 
     def remove_device(self, device_id):
-        if device_id in self.configs:
-            del self.configs[device_id]
-        if device_id in self.event_types:
-            del self.event_types[device_id]
+        self.remove_datapoints(
+            record.rrdPath
+            for meters in self.configs.get(device_id, {}).itervalues()
+            for records in meters.itervalues()
+            for record in records)
+
+        for mapping in (self.configs, self.component_id, self.resource_bytype, self.event_types):
+            if device_id in mapping:
+                del mapping[device_id]
 
     def device_event_types(self, device_id):
         if device_id in self.event_types:
             return self.event_types[device_id]
-        return []
+        return EMPTY_EVENT_TYPE_FILTER
 
     def set_config(self, device_id, cfg):
         # (list of OpenStackDataSourceConfig as returned by OpenStackConfig service)
-
-        self.configs[device_id] = {}
-        self.component_id[device_id] = {}
-        self.resource_bytype[device_id] = defaultdict(set)
-        self.event_types[device_id] = cfg.zOpenStackProcessEventTypes
-
+        #
+        # The device's new config is compared with its current one, and
+        # only the resources which have been added or changed are given
+        # new records.  Unchanged resources keep their existing ones.  The
+        # result is then swapped in, so that lookups made while it is being
+        # built see the old config in full.
+
+        start = time.time()
+        old_configs = self.configs.get(device_id, {})
+        old_component_id = self.component_id.get(device_id, {})
+
+        event_types = EventTypeFilter(cfg.zOpenStackProcessEventTypes)
+        old_event_types = self.event_types.get(device_id)
+        if old_event_types is not None and list(old_event_types) == list(event_types):
+            event_types = old_event_types
+
+        # Every datasource of a component has the same metric metadata,
+        # which may arrive as several copies (say, when datasources from
+        # config updates have been merged in).  Keep just one of them.
+        component_metadata = {}
+
+        resources = {}
+        component_id = {}
+        resource_bytype = defaultdict(set)
         for datasource in cfg.datasources:
-            self.configs.setdefault(device_id, {})
-            self.configs[device_id].setdefault(datasource.resourceId, {})
-            self.configs[device_id][datasource.resourceId][datasource.meter] = datasource.points
-            self.component_id[device_id][datasource.resourceId] = datasource.component
-            self.resource_bytype[device_id][datasource.component_meta_type].add(datasource.resourceId)
+            old_records = old_configs.get(datasource.resourceId, {}).get(datasource.meter, ())
+            resources.setdefault(datasource.resourceId, {})[datasource.meter] = \
+                self.datasource_records(datasource, old_records, component_metadata)
+            component_id[datasource.resourceId] = datasource.component
+            resource_bytype[datasource.component_meta_type].add(datasource.resourceId)
+
+        configs = {}
+        added = changed = 0
+        for resourceId, meters in resources.iteritems():
+            old_meters = old_configs.get(resourceId)
+            if old_meters is None:
+                added += 1
+            elif old_meters == meters and old_component_id.get(resourceId) == component_id[resourceId]:
+                meters = old_meters
+            else:
+                changed += 1
+            configs[resourceId] = meters
+        removed = len(set(old_configs) - set(configs))
+
+        # Datapoints of removed or changed resources which are no longer in
+        # the config at all (under any resource).
+        dropped = set()
+        for resourceId, old_meters in old_configs.iteritems():
+            if configs.get(resourceId) is not old_meters:
+                dropped.update(
+                    record.rrdPath
+                    for records in old_meters.itervalues()
+                    for record in records)
+        if dropped:
+            for resourceId, meters in configs.iteritems():
+                if old_configs.get(resourceId) is not meters:
+                    dropped.difference_update(
+                        record.rrdPath
+                        for records in meters.itervalues()
+                        for record in records)
+
+        old_resource_bytype = self.resource_bytype.get(device_id)
+        if old_resource_bytype == resource_bytype:
+            resource_bytype = old_resource_bytype
+
+        self.configs[device_id] = configs
+        self.component_id[device_id] = component_id
+        self.resource_bytype[device_id] = resource_bytype
+        self.event_types[device_id] = event_types
+        self.remove_datapoints(dropped)
+
+        if added or changed or removed:
+            log.info("%s: Updated config in %.3f seconds (%d resources added, %d changed, %d removed, %d unchanged)",
+                     device_id, time.time() - start, added, changed, removed,
+                     len(configs) - added - changed)
+        else:
+            log.debug("%s: Config unchanged (%d resources, checked in %.3f seconds)",
+                      device_id, len(configs), time.time() - start)
+
+    def datasource_records(self, datasource, old_records, component_metadata):
+        # Return the PublishRecords for a datasource's datapoints, reusing
+        # old_records (the datasource's current records) where unchanged.
+        metadata = datasource.metadata
+        if metadata is not None:
+            if old_records and old_records[0].metadata == metadata:
+                metadata = old_records[0].metadata
+            shared = component_metadata.setdefault(datasource.component, metadata)
+            if shared == metadata:
+                metadata = shared
+
+        records = []
+        for i, dp in enumerate(datasource.points):
+            rrdPath = '/'.join((datasource.rrdPath, dp.dpName))
+
+            if i < len(old_records) and old_records[i].matches(rrdPath, dp, metadata):
+                record = old_records[i]
+            else:
+                record = self.add_datapoint(PublishRecord(rrdPath, dp, metadata))
+            records.append(record)
+
+        if len(records) == len(old_records) and all(
+                new is old for new, old in zip(records, old_records)):
+            return old_records
+        return tuple(records)
+
+    def add_datapoint(self, record):
+        index = self.datapoint_index.get(record.rrdPath)
+        if index is None:
+            if self.free_indexes:
+                index = self.free_indexes.pop()
+            else:
+                index = len(self.datapoint_table)
+                self.datapoint_table.append(None)
+                self.datapoint_generation.append(0)
+            self.datapoint_index[record.rrdPath] = index
+        self.datapoint_table[index] = record
+        record.index = index
+        return record
+
+    def remove_datapoints(self, rrdPaths):
+        # Free the indexes of datapoints which are no longer in any config.
+        for rrdPath in rrdPaths:
+            index = self.datapoint_index.pop(rrdPath, None)
+            if index is not None:
+                self.datapoint_table[index] = None
+                self.datapoint_generation[index] += 1
+                self.free_indexes.append(index)
+
+    def get_datapoint(self, index):
+        return self.datapoint_table[index]
+
+    def find_datapoint(self, rrdPath):
+        index = self.datapoint_index.get(rrdPath)
+        if index is not None:
+            return self.datapoint_table[index]
 
     def has_resource(self, device_id, resourceId):
         return resourceId in self.component_id.get(device_id, {})
@@ -205,33 +524,566 @@ class Registry(object):
 
     def device_resource_ids(self, device_id, meta_type):
         # Given a device and meta_type, return all monitored resource IDs.
-        return self.resource_bytype.get(device_id, {}).get(meta_type, [])
+        return self.resource_bytype.get(device_id, {}).get(meta_type, frozenset())
+
+    def get_instance_id(self, device_id, instanceUUID):
+        # Given an instance UUID, return the corresponding component ID,
+        # or None if it is not a known instance.
+        if instanceUUID in self.device_resource_ids(device_id, 'OpenStackInfrastructureInstance'):
+            return self.get_component_id(device_id, instanceUUID)
 
     def get_datapoints(self, device_id, resourceId, metric_name):
+        # Given a resource ID and meter name, return the PublishRecords
+        # of the datapoints to store its samples in.
         if device_id not in self.configs:
-            return []
-        return self.configs[device_id].get(resourceId, {}).get(metric_name, [])
+            return ()
+        return self.configs[device_id].get(resourceId, {}).get(metric_name, ())
+
+
+class BoundedQueue(deque):
+    """
+    A deque with an optional high-water mark (limit).
+
+    Items appended while the queue is at its limit are dropped, and counted
+    in the zenopenstack.<name>.dropped meter, rather than allowing the queue
+    to grow without bound when it is not being drained quickly enough.
+    """
+
+    def __init__(self, name, limit=None):
+        super(BoundedQueue, self).__init__()
+        self.name = name
+        self.limit = limit
+
+    def full(self):
+        return bool(self.limit) and len(self) >= self.limit
+
+    def append(self, item):
+        # Returns False if the item was dropped.
+        if self.full():
+            Metrology.meter('zenopenstack.%s.dropped' % self.name).mark()
+            return False
+
+        super(BoundedQueue, self).append(item)
+        return True
+
+    def popbatch(self, size):
+        # Remove and return (up to) the first size items.
+        return [self.popleft() for _ in xrange(min(size, len(self)))]
+
+
+class ColumnarMetricQueue(object):
+    """
+    A metric queue with the same interface as a BoundedQueue of
+    (PublishRecord, value, timestamp) tuples, which stores the entries in
+    arrays (the record's index in the Registry's datapoint table and that
+    index's generation, the value and the timestamp), using around 24 bytes
+    for each, rather than as tuples of python objects.
+
+    Entries for datapoints which have since been removed from the Registry
+    are discarded when they are popped.
+    """
+
+    # Consumed entries are removed from the front of the arrays once there
+    # are at least this many of them, and they make up half of the arrays.
+    compact_size = 64 * 1024
+
+    def __init__(self, name, registry, limit=None):
+        self.name = name
+        self.registry = registry
+        self.limit = limit
+        self.clear()
+
+    def __len__(self):
+        return len(self.values) - self.head
+
+    def full(self):
+        return bool(self.limit) and len(self) >= self.limit
+
+    def clear(self):
+        self.indexes = array('i')
+        self.generations = array('i')
+        self.values = array('d')
+        self.timestamps = array('d')
+        self.head = 0
+
+    def append(self, item):
+        # Returns False if the item was dropped.
+        if self.full():
+            Metrology.meter('zenopenstack.%s.dropped' % self.name).mark()
+            return False
+
+        dp, value, timestamp = item
+        value = float(value)
+        timestamp = float(timestamp)
+
+        self.indexes.append(dp.index)
+        self.generations.append(self.registry.datapoint_generation[dp.index])
+        self.values.append(value)
+        self.timestamps.append(timestamp)
+        return True
+
+    def popleft(self):
+        while len(self):
+            batch = self.popbatch(1)
+            if batch:
+                return batch[0]
+        raise IndexError('pop from an empty queue')
+
+    def popbatch(self, size):
+        # Remove and return (up to) the first size items, less any which
+        # are discarded.
+        start = self.head
+        end = min(start + size, len(self.values))
+
+        table = self.registry.datapoint_table
+        generation = self.registry.datapoint_generation
+        batch = [
+            (table[index], value, timestamp)
+            for index, index_generation, value, timestamp in izip(
+                self.indexes[start:end], self.generations[start:end],
+                self.values[start:end], self.timestamps[start:end])
+            if generation[index] == index_generation]
+
+        if len(batch) < end - start:
+            Metrology.meter('zenopenstack.%s.discarded' % self.name).mark(end - start - len(batch))
+
+        self.head = end
+        if self.head == len(self.values):
+            self.clear()
+        elif self.head >= self.compact_size and self.head * 2 >= len(self.values):
+            del self.indexes[:self.head]
+            del self.generations[:self.head]
+            del self.values[:self.head]
+            del self.timestamps[:self.head]
+            self.head = 0
+
+        return batch
+
+
+class DeviceQueues(object):
+    """
+    A queue made up of a sub-queue for each device, which are drained in
+    turn, so that a device which sends a lot of data does not hold up
+    every other device's data behind its own.
+
+    Has the same interface as BoundedQueue, except that append() also takes
+    the id of the device which the item came from.  limit applies to the
+    total length of the sub-queues, and device_share (if set) is the
+    fraction of that limit which each device's sub-queue may use.
+
+    The sub-queues are created by factory(name), which returns an
+    unbounded BoundedQueue by default.
+
+    If a journal is in use (see use_journal), items which do not fit are
+    written to it rather than dropped.  Items read back from the journal for
+    devices which are not yet ready (say, whose config has not been loaded
+    since a restart) are held until they are released or discarded.
+    """
+
+    # Items are read back from the journal (when replaying) in batches of
+    # this size, until the queue is half full.
+    refill_size = 1000
+
+    def __init__(self, name, factory=BoundedQueue, limit=None, device_share=None):
+        self.name = name
+        self.factory = factory
+        self.limit = limit
+        self.device_share = device_share
+        self.journal = None
+        self.restored = 0
+        self.replaying = False
+        self.clear()
+
+    def __len__(self):
+        # Including the items still to be read back from the journal, if
+        # replaying.  (The length held in memory is self.length.)
+        if self.replaying:
+            return self.length + len(self.journal)
+        return self.length
+
+    def clear(self):
+        self.queues = {}
+        self.order = deque()
+        self.length = 0
+
+        # number of each device's items which are in the journal
+        self.journaled = defaultdict(int)
+
+        # each device's (encoded) items which have been read back from the
+        # journal, held until the device is ready
+        self.held = defaultdict(list)
+
+    def use_journal(self, journal, encode=None, decode=None, ready=None):
+        """
+        Write items which do not fit in the queue to journal (a Journal),
+        as (device_id, encode(item)), rather than dropping them.
+
+        Once replaying is set, they are read back into the queue as it
+        drains, as decode(device_id, encoded item), which returns None if
+        the item should be discarded.  If ready(device_id) is false, the
+        device's items are instead held until release(device_id).
+        """
+
+        self.journal = journal
+        self.encode = encode or (lambda item: item)
+        self.decode = decode or (lambda device_id, item: item)
+        self.ready = ready or (lambda device_id: True)
+
+        # Items already in the journal (from before a restart) are not
+        # counted by device, so until they have all been read back, every
+        # device's items are written to the journal after them.
+        self.restored = len(journal)
+
+    def device_length(self, device_id):
+        queue = self.queues.get(device_id)
+        return len(queue) if queue is not None else 0
+
+    def device_limit(self):
+        if self.limit and self.device_share:
+            return max(1, int(self.limit * self.device_share))
+        return None
+
+    def full(self, device_id=None):
+        # Whether the queue as a whole, or the device's sub-queue, is full.
+        if self.journal is not None:
+            return self.journal.full()
+
+        return self.memory_full(device_id)
+
+    def memory_full(self, device_id=None):
+        if self.limit and self.length >= self.limit:
+            return True
+
+        device_limit = self.device_limit()
+        return bool(device_id and device_limit) and \
+            self.device_length(device_id) >= device_limit
+
+    def append(self, item, device_id):
+        # Returns False if the item was dropped.
+        if self.journal is not None and (
+                self.restored or self.journaled.get(device_id) or
+                self.memory_full(device_id)):
+            # Once some of a device's items are in the journal, the rest
+            # follow them there, so that they are sent in order.
+            if self.journal.append((device_id, self.encode(item))):
+                self.journaled[device_id] += 1
+                return True
+
+        elif not self.memory_full(device_id):
+            self.push(item, device_id)
+            return True
+
+        Metrology.meter('zenopenstack.%s.dropped' % self.name).mark()
+        return False
+
+    def push(self, item, device_id):
+        queue = self.queues.get(device_id)
+        if queue is None:
+            queue = self.queues[device_id] = self.factory(self.name)
+            self.order.append(device_id)
+
+        queue.append(item)
+        self.length += 1
+
+    def refill(self):
+        # Read items back from the journal until the queue is half full.
+        target = self.limit // 2 if self.limit else len(self.journal)
+
+        while len(self.journal) and self.length < target:
+            for device_id, item in self.journal.popbatch(self.refill_size):
+                if self.restored:
+                    self.restored -= 1
+                elif self.journaled.get(device_id):
+                    self.journaled[device_id] -= 1
+                    if not self.journaled[device_id]:
+                        del self.journaled[device_id]
+
+                if self.held.get(device_id) or not self.ready(device_id):
+                    self.held[device_id].append(item)
+                else:
+                    self.restore(item, device_id)
+
+    def restore(self, item, device_id):
+        # Decode an item read back from the journal into the queue.
+        item = self.decode(device_id, item)
+        if item is None:
+            Metrology.meter('zenopenstack.%s.discarded' % self.name).mark()
+        else:
+            self.push(item, device_id)
+
+    def release(self, device_id):
+        # The device is now ready: restore its held items.
+        for item in self.held.pop(device_id, ()):
+            self.restore(item, device_id)
+
+    def discard_held(self):
+        # Discard the held items of every device, returning how many.
+        count = sum(len(items) for items in self.held.itervalues())
+        self.held.clear()
+        if count:
+            Metrology.meter('zenopenstack.%s.discarded' % self.name).mark(count)
+        return count
+
+    def spill(self):
+        # Move every item in the queue into the journal.  They are older
+        # than any of the same device's items which are already there, so
+        # are written ahead of them.  (Held items are already encoded, and
+        # their devices have no items in memory.)
+        records = [
+            (device_id, item)
+            for device_id, items in self.held.iteritems()
+            for item in items]
+        self.held.clear()
+
+        while self.order:
+            device_id = self.order.popleft()
+            queue = self.queues.pop(device_id)
+            for item in queue.popbatch(len(queue)):
+                records.append((device_id, self.encode(item)))
+        self.length = 0
+        self.journal.prepend(records)
+
+    def popleft(self):
+        batch = self.popbatch(1)
+        if not batch:
+            raise IndexError('pop from an empty queue')
+        return batch[0]
+
+    def popbatch(self, size):
+        # Remove and return up to size items, taking an equal share from
+        # each device's sub-queue in turn.
+        if self.replaying:
+            self.refill()
+
+        batch = []
+        while self.order and len(batch) < size:
+            share = max(1, (size - len(batch)) // len(self.order))
+
+            for _ in xrange(len(self.order)):
+                device_id = self.order.popleft()
+                queue = self.queues[device_id]
+                length = len(queue)
+                batch.extend(queue.popbatch(min(share, size - len(batch))))
+                # (which may discard items, as well as returning them)
+                self.length -= length - len(queue)
+
+                # devices which still have items go to the back of the line
+                if len(queue):
+                    self.order.append(device_id)
+                else:
+                    del self.queues[device_id]
+
+                if len(batch) >= size:
+                    break
+
+        return batch
 
 
 REGISTRY = Registry()
-METRIC_QUEUE = deque()
-EVENT_QUEUE = deque()
+METRIC_QUEUE = DeviceQueues('metrics')
+
+# Rates at which samples and events are received for each device, and
+# at which their requests are refused by its rate limits.  These are not
+# registered with Metrology, so that they can be reported by device.
+DEVICE_RATES = defaultdict(lambda: dict(
+    samples=Meter(),
+    events=Meter(),
+    samples_throttled=Meter(),
+    events_throttled=Meter()
+))
+
+# Each device's TokenBucket for samples and events (--devicesamplerate,
+# --deviceeventrate)
+DEVICE_LIMITS = defaultdict(dict)
+
+EVENT_QUEUE = DeviceQueues('events')
 MAP_QUEUE = defaultdict(ConsolidatingObjectMapQueue)
 VNICS = defaultdict(lambda: dict(
     potential=dict(),
     modeled=set()
 ))
 
+# Vnic resourceIds are of the form:
+#  [instanceName]-[instanceUUID]-[vnicName]
+#  instance-00000001-95223d22-d3af-4b06-a91c-81114d557bd1-tap908bc571-0d
+# Every candidate UUID is matched (within a lookahead, so that none is
+# skipped by overlapping an earlier one), whatever its case.
+VNIC_INSTANCE_UUID = re.compile(
+    r'-(?=([0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})-.)',
+    re.IGNORECASE)
+
+
+# Timers around zenopenstack's hot paths, which are shown on /health and
+# logged with the daemon's periodic statistics.  All are in seconds.
+LATENCY_TIMERS = (
+    ('zenopenstack.samples.decode_time', 'Sample JSON decode (per request)'),
+    ('zenopenstack.events.decode_time', 'Event JSON decode (per request)'),
+    ('zenopenstack.samples.resolve_time', 'Sample to datapoint resolution (per request)'),
+    ('zenopenstack.events.map_time', 'Event to datamap mapping (per event)'),
+    ('zenopenstack.maps.drain_time', 'Model update queue drain (per device)'),
+    ('zenopenstack.maps.apply_time', 'applyDataMaps call (per device)'),
+    ('zenopenstack.metrics.write_time', 'Metric write (per datapoint)'),
+)
+
+
+def request_payload(request, streaming=False, timer=None):
+    """
+    Return an iterable over the elements of the JSON array in the body
+    of request.
+
+    By default, the whole body is decoded at once.  In streaming mode,
+    elements are decoded one at a time as they are iterated over, so
+    JSONStreamError may be raised during iteration.
+
+    If a timer is given, it is updated with the time taken to decode the
+    body (in streaming mode, once all of its elements have been).
+    """
+
+    request.content.seek(0)
+    if streaming:
+        payload = iter_json_array(request.content)
+        if timer is not None:
+            payload = timed_iter(payload, timer)
+        return payload
+
+    # (large request bodies are held in a temporary file, not a StringIO)
+    start = time.time()
+    payload = json.loads(request.content.read())
+    if timer is not None:
+        timer.update(time.time() - start)
+    return payload
+
+
+def timed_iter(iterable, timer):
+    # Yield the elements of iterable, then update timer with the total
+    # time spent producing them (but not consuming them).
+    iterator = iter(iterable)
+    elapsed = 0.0
+    while True:
+        start = time.time()
+        try:
+            element = next(iterator)
+        except StopIteration:
+            timer.update(elapsed + time.time() - start)
+            return
+        elapsed += time.time() - start
+        yield element
+
+
+class PayloadError(Exception):
+    """
+    Raised while decoding a request payload, to reject the request with
+    the specified HTTP error response.
+    """
+
+    def __init__(self, code, brief, detail):
+        super(PayloadError, self).__init__(detail)
+        self.code = code
+        self.brief = brief
+        self.detail = detail
+
+    def render(self, request):
+        return ErrorPage(self.code, self.brief, self.detail).render(request)
+
+
+class IngestWorkers(object):
+    """
+    A bounded pool of threads which decode ceilometer payloads (--workerthreads),
+    so that the reactor thread remains free to accept new connections and
+    run the drain tasks while large batches are being processed.
+
+    Decoding happens in a worker thread, and must not modify any shared
+    state, other than by updating Metrology instruments (which are thread
+    safe) and the event mapping caches in events (which are locked).  The
+    decoded items are then handed back to the reactor thread, which stores
+    them in the appropriate queues and completes the request.
+    """
+
+    def __init__(self, threads, backlog, retry_after):
+        self.pool = ThreadPool(minthreads=0, maxthreads=threads,
+                               name='zenopenstack-ingest')
+        self.backlog = backlog
+        self.retry_after = retry_after
+        self.pending = 0
+
+    def start(self):
+        self.pool.start()
+        reactor.addSystemEventTrigger('before', 'shutdown', self.pool.stop)
+
+    def saturated(self):
+        # Every thread is busy, and enough requests are already waiting
+        # for one that there is no point in accepting more.
+        return self.pending >= self.pool.max + self.backlog
+
+    def render(self, resource, request, decode, store):
+        """
+        Run decode(store) in a worker thread, where store() is called
+        once for each decoded item.  The calls are then replayed against
+        the real store() function in the reactor thread, and the request
+        finished.
+
+        Returns NOT_DONE_YET, or an error page if the pool is saturated.
+        """
+
+        if self.saturated():
+            Metrology.meter('zenopenstack.workers.rejected').mark()
+            request.setHeader(b"retry-after", str(self.retry_after))
+            return ErrorPage(503, "Service Unavailable", "Too many requests are being processed, try again later").render(request)
+
+        self.pending += 1
+        disconnected = []
+        request.notifyFinish().addErrback(lambda _: disconnected.append(True))
+
+        def decode_in_thread():
+            items = []
+            start = time.time()
+            try:
+                decode(lambda *args: items.append(args))
+            except PayloadError, e:
+                return items, e, time.time() - start
+            return items, None, time.time() - start
+
+        def decoded(result):
+            items, error, parse_time = result
+            for args in items:
+                store(*args)
+            return resource.respond(request, error, parse_time)
+
+        def failed(failure):
+            log.error("Error processing %s: %s", request.uri, failure.getErrorMessage())
+            return ErrorPage(500, "Internal Server Error", "Error processing data").render(request)
+
+        def finish(body):
+            self.pending -= 1
+            resource.request_finished(request, body)
+            if not disconnected:
+                request.write(body)
+                request.finish()
+
+        d = threads.deferToThreadPool(reactor, self.pool, decode_in_thread)
+        d.addCallback(decoded)
+        d.addErrback(failed)
+        d.addCallback(finish)
+
+        return NOT_DONE_YET
 
 
 class Site(TwistedSite):
     request_buffer = None
+    ingest_workers = None
+    profiler = None
 
     def __init__(self, resource, requestFactory=None, *args, **kwargs):
         preferences = zope.component.queryUtility(
             ICollectorPreferences, 'zenopenstack')
 
-        self.request_buffer = HTTPDebugLogBuffer(preferences.options.httpdebugbuffersize)
+        self.options = preferences.options
+        self.request_buffer = HTTPDebugLogBuffer(
+            preferences.options.httpdebugbuffersize,
+            sample_rate=preferences.options.httpdebugsamplerate,
+            max_body=preferences.options.httpdebugmaxbody,
+            full_actions=preferences.options.httpdebugactions == 'full')
+        self.profiler = Profiler()
 
         return TwistedSite.__init__(self, resource, requestFactory, *args, **kwargs)
 
@@ -255,14 +1107,18 @@ class Resource(TwistedResource):
         # Add a few properties to the request object that are used to
         # return additional information for the request_buffer debugging
         # tool
-        request._zaction = {
-            "metrics": [],
-            "maps": [],
-            "events": []
-        }
+        request._zaction = self.site.request_buffer.new_actions()
 
         result = TwistedResource.render(self, request)
 
+        # Requests processed by IngestWorkers are completed (and logged)
+        # later, once their payload has been decoded.
+        if result is not NOT_DONE_YET:
+            self.request_finished(request, result)
+
+        return result
+
+    def request_finished(self, request, response):
         # log any requests that generated error responses
         # this will only get us the code, but the detailed response bodies
         # will be in the /health logs.
@@ -271,9 +1127,7 @@ class Resource(TwistedResource):
             log.error(combinedLogFormatter(timestamp, request))
 
         if not request.uri.startswith("/health"):
-            self.site.request_buffer.store_request(request, result)
-
-        return result
+            self.site.request_buffer.store_request(request, response)
 
 
 class Root(Resource):
@@ -298,6 +1152,203 @@ class Root(Resource):
         })
 
 
+def metric_values(metric):
+    # Return a dict of the current values of a Metrology metric, or None
+    # if it is not of a supported type.
+    values = None
+
+    if isinstance(metric, (Timer, Histogram)):
+        snapshot = metric.snapshot
+        values = {
+            'count': metric.count,
+            'mean': metric.mean,
+            'median': snapshot.median,
+            '95th_percentile': snapshot.percentile_95th,
+            '99th_percentile': snapshot.percentile_99th,
+        }
+
+    if isinstance(metric, (Timer, Meter)):
+        values = values or {'count': metric.count}
+        values.update({
+            '1m_rate': metric.one_minute_rate,
+            '5m_rate': metric.five_minute_rate,
+            '15m_rate': metric.fifteen_minute_rate,
+            'mean_rate': metric.mean_rate,
+        })
+
+    elif isinstance(metric, Counter):
+        values = {'count': metric.count}
+
+    elif isinstance(metric, Gauge):
+        values = {'value': metric.value}
+
+    return values
+
+
+def health_snapshot():
+    # Return the current state of zenopenstack's queues and tasks, along
+    # with all of its metrics, as a dict.
+
+    snapshot = {
+        'queues': {},
+        'map_queues': {},
+        'tasks': {},
+        'devices': {},
+        'reactor': {
+            'stalls': STALL_DETECTOR.stalls,
+            'stall_time': STALL_DETECTOR.stall_time,
+            'max_stall_time': STALL_DETECTOR.max_stall,
+            'recent_stalls': [
+                {
+                    'timestamp': stall['timestamp'].isoformat(),
+                    'duration': stall['duration'],
+                    'stack': stall['stack'],
+                }
+                for stall in STALL_DETECTOR.recent],
+        },
+        'metrics': {},
+    }
+
+    for queue in (METRIC_QUEUE, EVENT_QUEUE):
+        snapshot['queues'][queue.name] = {
+            'length': queue.length,
+            'limit': queue.limit or 0,
+            'journaled': len(queue.journal) if queue.journal is not None else 0,
+            'rejected': Metrology.meter("zenopenstack.%s.rejected" % queue.name).count,
+            'dropped': Metrology.meter("zenopenstack.%s.dropped" % queue.name).count,
+        }
+
+    for device_id, queue in MAP_QUEUE.items():
+        snapshot['map_queues'][device_id] = {
+            'held': len(queue.held_objmaps)
+        }
+
+    for name, stats in TASK_STATS.items():
+        snapshot['tasks'][name] = {
+            'runs': stats.runs,
+            'slices': stats.slices,
+            'slice_time': stats.total_time,
+            'max_slice_time': stats.max_time,
+        }
+
+    for device_id, rates in DEVICE_RATES.items():
+        snapshot['devices'][device_id] = dict(
+            (kind, metric_values(meter)) for kind, meter in rates.iteritems())
+        snapshot['devices'][device_id]['queued'] = dict(
+            (queue.name, queue.device_length(device_id))
+            for queue in (METRIC_QUEUE, EVENT_QUEUE))
+
+    for name, metric in metrology_registry:
+        values = metric_values(metric)
+        if values is not None:
+            snapshot['metrics'][name] = values
+
+    return snapshot
+
+
+def prometheus_name(name):
+    name = re.sub(r'[^a-zA-Z0-9_:]', '_', name)
+    if name[:1].isdigit():
+        name = '_' + name
+    return name
+
+
+def prometheus_value(value):
+    value = float(value)
+    if value != value:
+        return 'NaN'
+    if value in (float('inf'), float('-inf')):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(value)
+
+
+def prometheus_labels(**labels):
+    if not labels:
+        return ''
+
+    return '{%s}' % ','.join(
+        '%s="%s"' % (k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for k, v in sorted(labels.iteritems()))
+
+
+def prometheus_text(snapshot):
+    # Render a health_snapshot() in the prometheus text exposition format.
+
+    lines = []
+
+    def metric(name, type_, samples):
+        lines.append('# TYPE %s %s' % (name, type_))
+        for suffix, labels, value in samples:
+            lines.append('%s%s%s %s' % (name, suffix, prometheus_labels(**labels), prometheus_value(value)))
+
+    def rates(name, values, **labels):
+        metric(name + '_rate', 'gauge', [
+            ('', dict(labels, window=window), values[window + '_rate'])
+            for window in ('1m', '5m', '15m')])
+
+    for field, name, type_ in (
+            ('length', 'length', 'gauge'),
+            ('limit', 'limit', 'gauge'),
+            ('journaled', 'journaled', 'gauge'),
+            ('rejected', 'rejected_total', 'counter'),
+            ('dropped', 'dropped_total', 'counter')):
+        metric('zenopenstack_queue_' + name, type_, [
+            ('', {'queue': queue}, values[field])
+            for queue, values in sorted(snapshot['queues'].iteritems())])
+
+    metric('zenopenstack_map_queue_held', 'gauge', [
+        ('', {'device': device_id}, values['held'])
+        for device_id, values in sorted(snapshot['map_queues'].iteritems())])
+
+    for field, name, type_ in (
+            ('runs', 'runs_total', 'counter'),
+            ('slices', 'slices_total', 'counter'),
+            ('slice_time', 'slice_seconds_total', 'counter'),
+            ('max_slice_time', 'max_slice_seconds', 'gauge')):
+        metric('zenopenstack_task_' + name, type_, [
+            ('', {'task': task_name}, values[field])
+            for task_name, values in sorted(snapshot['tasks'].iteritems())])
+
+    reactor_stats = snapshot['reactor']
+    metric('zenopenstack_reactor_stalls_total', 'counter', [('', {}, reactor_stats['stalls'])])
+    metric('zenopenstack_reactor_stall_seconds_total', 'counter', [('', {}, reactor_stats['stall_time'])])
+    metric('zenopenstack_reactor_max_stall_seconds', 'gauge', [('', {}, reactor_stats['max_stall_time'])])
+
+    devices = sorted(snapshot['devices'].iteritems())
+    metric('zenopenstack_device_queue_length', 'gauge', [
+        ('', {'device': device_id, 'queue': queue}, length)
+        for device_id, values in devices
+        for queue, length in sorted(values['queued'].iteritems())])
+
+    for kind in ('samples', 'events', 'samples_throttled', 'events_throttled'):
+        metric('zenopenstack_device_%s_total' % kind, 'counter', [
+            ('', {'device': device_id}, values[kind]['count'])
+            for device_id, values in devices])
+        metric('zenopenstack_device_%s_rate' % kind, 'gauge', [
+            ('', {'device': device_id, 'window': window}, values[kind][window + '_rate'])
+            for device_id, values in devices
+            for window in ('1m', '5m', '15m')])
+
+    for name, values in sorted(snapshot['metrics'].iteritems()):
+        name = prometheus_name(name)
+        if 'median' in values:
+            metric(name, 'summary', [
+                ('', {'quantile': '0.5'}, values['median']),
+                ('', {'quantile': '0.95'}, values['95th_percentile']),
+                ('', {'quantile': '0.99'}, values['99th_percentile']),
+                ('_sum', {}, values['mean'] * values['count']),
+                ('_count', {}, values['count'])])
+        elif 'count' in values:
+            metric(name + '_total', 'counter', [('', {}, values['count'])])
+        else:
+            metric(name, 'gauge', [('', {}, values['value'])])
+
+        if '1m_rate' in values:
+            rates(name, values)
+
+    return '\n'.join(lines) + '\n'
+
+
 class Health(Resource):
     """ /health: expose health of zenopenstack daemon (metrics, logs) """
 
@@ -308,6 +1359,14 @@ class Health(Resource):
         request.setHeader(b"content-type", b"text/html")
 
         if len(request.postpath):
+            if len(request.postpath) == 1 and request.postpath[0] == "metrics.json":
+                request.setHeader(b"content-type", b"application/json")
+                return json.dumps(health_snapshot(), indent=2, sort_keys=True)
+
+            if len(request.postpath) == 1 and request.postpath[0] == "prometheus":
+                request.setHeader(b"content-type", b"text/plain; version=0.0.4")
+                return prometheus_text(health_snapshot())
+
             if len(request.postpath) == 1 and request.postpath[0] == "metrics":
                 body = "<html><body>"
                 body += "<table border=\"1\">"
@@ -335,6 +1394,24 @@ class Health(Resource):
                 body += "</body></html>"
                 return body
 
+            if len(request.postpath) == 1 and request.postpath[0] == "profile":
+                return self.render_profile(request)
+
+            if len(request.postpath) == 1 and request.postpath[0] == "stalls":
+                body = "<html><body>"
+                body += "<b>Most recent %d reactor stalls</b> (of %d total)<p>" % (
+                    len(STALL_DETECTOR.recent), STALL_DETECTOR.stalls)
+
+                for stall in reversed(STALL_DETECTOR.recent):
+                    body += "<hr>%s (%s ago): blocked for %.3f seconds" % (
+                        stall['timestamp'].isoformat(),
+                        (datetime.datetime.now() - stall['timestamp']),
+                        stall['duration'])
+                    body += "<pre>%s</pre>" % cgi.escape(stall['stack'] or "(stack not captured)")
+
+                body += "</body></html>"
+                return body
+
             if len(request.postpath) == 1 and request.postpath[0] == "queue":
                 body = "<html><body>"
                 body = "The following devices have received model updates:<ul>"
@@ -385,12 +1462,20 @@ class Health(Resource):
             for record in reversed(records):
                 try:
                     request_body = record['request_body']
-                    try:
-                        # if the payload is JSON data, reindent it for readability
-                        request_body = json.dumps(json.loads(request_body), indent=5)
-                    except Exception:
-                        pass
-                    response_body = cgi.escape(record['response_body'])
+                    if len(request_body) < record['request_body_size']:
+                        request_body += "\n... (truncated, %d bytes total)" % record['request_body_size']
+                    else:
+                        try:
+                            # if the payload is JSON data, reindent it for readability
+                            request_body = json.dumps(json.loads(request_body), indent=5)
+                        except Exception:
+                            pass
+                    request_body = cgi.escape(request_body)
+
+                    response_body = record['response_body']
+                    if len(response_body) < record['response_body_size']:
+                        response_body += "\n... (truncated, %d bytes total)" % record['response_body_size']
+                    response_body = cgi.escape(response_body)
                     zenoss_actions = cgi.escape(pformat(record['zenoss_actions']))
 
                     body += "<hr>%s (%s ago)" % (
@@ -455,18 +1540,16 @@ class Health(Resource):
         """
 
         for client_ip, uri in sorted(self.site.request_buffer.get_client_keys()):
-            v = dict(
-                dotted_uri=uri.replace('/', '.').strip('.'),
-                client_ip=client_ip
-            )
+            post_meters = self.site.request_buffer.get_meters('post', uri, client_ip)
+            get_meters = self.site.request_buffer.get_meters('get', uri, client_ip)
 
-            posts = Metrology.meter("http.post.{dotted_uri}.{client_ip}.requests".format(**v))
-            gets = Metrology.meter("http.get.{dotted_uri}.{client_ip}.requests".format(**v))
-            post_errors = Metrology.meter("http.post.{dotted_uri}.{client_ip}.errors".format(**v))
-            get_errors = Metrology.meter("http.get.{dotted_uri}.{client_ip}.errors".format(**v))
-            datamaps = Metrology.meter("zenopenstack.{dotted_uri}.{client_ip}.datamaps".format(**v))
-            events = Metrology.meter("zenopenstack.{dotted_uri}.{client_ip}.events".format(**v))
-            metrics = Metrology.meter("zenopenstack.{dotted_uri}.{client_ip}.metrics".format(**v))
+            posts = post_meters.client_requests
+            gets = get_meters.client_requests
+            post_errors = post_meters.client_errors
+            get_errors = get_meters.client_errors
+            datamaps = post_meters.datamaps
+            events = post_meters.events
+            metrics = post_meters.metrics
 
             most_recent_request = self.site.request_buffer.get_most_recent_request((client_ip, uri))
 
@@ -504,15 +1587,215 @@ class Health(Resource):
             body += "  <td><a href=\"/health/logs/%s%s\">request log</a></td>" % (client_ip, uri)
             body += "</tr>"
             
+        body += """
+    </table>
+
+    <p><b>Queues</b></p>
+    <table border="1">
+      <tr>
+        <th>Queue</th>
+        <th>Length</th>
+        <th>Limit</th>
+        <th>Journaled</th>
+        <th>Rejected Requests</th>
+        <th>Dropped Items</th>
+      </tr>
+        """
+
+        for queue in (METRIC_QUEUE, EVENT_QUEUE):
+            rejected = Metrology.meter("zenopenstack.%s.rejected" % queue.name)
+            dropped = Metrology.meter("zenopenstack.%s.dropped" % queue.name)
+
+            body += "<tr>"
+            body += "  <td>%s</td>" % queue.name
+            body += "  <td>%d</td>" % queue.length
+            body += "  <td>%s</td>" % (queue.limit or "None")
+            body += "  <td>%s</td>" % (len(queue.journal) if queue.journal is not None else "None")
+            body += "  <td>%d</td>" % rejected.count
+            body += "  <td>%d</td>" % dropped.count
+            body += "</tr>"
+
+        body += """
+    </table>
+
+    <p><b>Devices</b></p>
+    <table border="1">
+      <tr>
+        <th rowspan="2">Device</th>
+        <th colspan="2">Queued</th>
+        <th colspan="3">Samples</th>
+        <th colspan="3">Events</th>
+      </tr>
+      <tr>
+        <th>metrics</th>
+        <th>events</th>
+        <th>15m rate</th>
+        <th>limit</th>
+        <th>throttled</th>
+        <th>15m rate</th>
+        <th>limit</th>
+        <th>throttled</th>
+      </tr>
+        """
+
+        options = self.site.options
+        for device_id, rates in sorted(DEVICE_RATES.items()):
+            body += "<tr>"
+            body += "  <td>%s</td>" % device_id
+            body += "  <td>%d</td>" % METRIC_QUEUE.device_length(device_id)
+            body += "  <td>%d</td>" % EVENT_QUEUE.device_length(device_id)
+            body += "  <td>%.2f</td>" % rates['samples'].fifteen_minute_rate
+            body += "  <td>%s</td>" % (options.devicesamplerate or "None")
+            body += "  <td>%d</td>" % rates['samples_throttled'].count
+            body += "  <td>%.2f</td>" % rates['events'].fifteen_minute_rate
+            body += "  <td>%s</td>" % (options.deviceeventrate or "None")
+            body += "  <td>%d</td>" % rates['events_throttled'].count
+            body += "</tr>"
+
+        body += """
+    </table>
+
+    <p><b>Tasks</b></p>
+    <table border="1">
+      <tr>
+        <th>Task</th>
+        <th>Runs</th>
+        <th>Time Slices</th>
+        <th>Total Time (s)</th>
+        <th>Longest Slice (ms)</th>
+      </tr>
+        """
+
+        for name, stats in sorted(TASK_STATS.iteritems()):
+            body += "<tr>"
+            body += "  <td>%s</td>" % name
+            body += "  <td>%d</td>" % stats.runs
+            body += "  <td>%d</td>" % stats.slices
+            body += "  <td>%.3f</td>" % stats.total_time
+            body += "  <td>%.1f</td>" % (stats.max_time * 1000)
+            body += "</tr>"
+
+        lag = STALL_DETECTOR.lag_timer
+        body += """
+    </table>
+
+    <p><b>Reactor</b></p>
+    <table border="1">
+      <tr>
+        <th>Mean Lag (ms)</th>
+        <th>99th Lag (ms)</th>
+        <th>Stalls</th>
+        <th>Total Stall Time (s)</th>
+        <th>Longest Stall (ms)</th>
+        <th>Details</th>
+      </tr>
+      <tr>
+        <td>%.1f</td>
+        <td>%.1f</td>
+        <td>%d</td>
+        <td>%.3f</td>
+        <td>%.1f</td>
+        <td><a href="/health/stalls">stack traces</a></td>
+      </tr>
+    </table>
+
+    <p><b>Latency</b></p>""" % (
+            lag.mean * 1000,
+            lag.snapshot.percentile_99th * 1000,
+            STALL_DETECTOR.stalls,
+            STALL_DETECTOR.stall_time,
+            STALL_DETECTOR.max_stall * 1000)
+
+        body += """
+    <table border="1">
+      <tr>
+        <th>Operation</th>
+        <th>Count</th>
+        <th>Mean (ms)</th>
+        <th>Median (ms)</th>
+        <th>95th (ms)</th>
+        <th>99th (ms)</th>
+      </tr>
+        """
+
+        for name, description in LATENCY_TIMERS:
+            timer = Metrology.timer(name)
+            snapshot = timer.snapshot
+
+            body += "<tr>"
+            body += "  <td>%s</td>" % description
+            body += "  <td>%d</td>" % timer.count
+            body += "  <td>%.1f</td>" % (timer.mean * 1000)
+            body += "  <td>%.1f</td>" % (snapshot.median * 1000)
+            body += "  <td>%.1f</td>" % (snapshot.percentile_95th * 1000)
+            body += "  <td>%.1f</td>" % (snapshot.percentile_99th * 1000)
+            body += "</tr>"
+
         return body + """
     </table>
 
-    <p><a href="/health/metrics">All Metrics</a></p>
+    <p><a href="/health/metrics">All Metrics</a>
+       (<a href="/health/metrics.json">JSON</a>,
+        <a href="/health/prometheus">Prometheus</a>)</p>
     <p><a href="/health/queue">Model Update Queue</a></p>
   </body>
 </html>
         """
 
+    def render_profile(self, request):
+        # /health/profile?seconds=N[&mode=cprofile|sample][&sort=cumulative]
+        #
+        # Profile the reactor thread for N seconds, returning pstats
+        # output (cprofile), or collapsed stacks suitable for a flame
+        # graph (sample).
+        options = self.site.options
+        if not options.profile_password:
+            return NoResource(message="Profiling is disabled").render(request)
+
+        if not (hmac.compare_digest(request.getUser(), options.profile_username) and
+                hmac.compare_digest(request.getPassword(), options.profile_password)):
+            request.setHeader(b"www-authenticate", b'Basic realm="zenopenstack"')
+            return ErrorPage(401, "Unauthorized", "Profiling requires authentication").render(request)
+
+        def arg(name, default):
+            return request.args.get(name, [default])[0]
+
+        try:
+            seconds = int(arg('seconds', '10'))
+            mode = arg('mode', 'cprofile')
+            if mode == 'cprofile':
+                d = self.site.profiler.profile(seconds, sort=arg('sort', 'cumulative'))
+            elif mode == 'sample':
+                d = self.site.profiler.sample(seconds)
+            else:
+                raise ValueError("mode must be cprofile or sample")
+        except ProfilerBusy, e:
+            return ErrorPage(409, "Conflict", str(e)).render(request)
+        except ValueError, e:
+            return ErrorPage(400, "Bad Request", str(e)).render(request)
+
+        log.info("%s: Profiling reactor (%s) for %d seconds",
+                 request.getClientIP(), mode, seconds)
+
+        disconnected = []
+        request.notifyFinish().addErrback(lambda _: disconnected.append(True))
+
+        def failed(failure):
+            log.error("Error profiling reactor: %s", failure.getErrorMessage())
+            return ErrorPage(500, "Internal Server Error", "Error profiling reactor").render(request)
+
+        def finish(body):
+            self.request_finished(request, body)
+            if not disconnected:
+                if request.code == 200:
+                    request.setHeader(b"content-type", b"text/plain")
+                request.write(body)
+                request.finish()
+
+        d.addErrback(failed)
+        d.addCallback(finish)
+        return NOT_DONE_YET
+
 
 class CeilometerRoot(Resource):
     """ /ceilometer """
@@ -549,13 +1832,29 @@ class CeilometerV1(Resource):
     pass
 
 
-class CeilometerV1Samples(Resource):
-    """ /ceilometer/v1/samples/<device id> : accept metrics from ceilometer """
+class CeilometerV1Payload(Resource):
+    """
+    Base class for resources which accept a JSON payload from ceilometer,
+    and store the items in it in queue.
+    """
 
     isLeaf = True
-    future_warning = set()
 
-    def render_POST(self, request):
+    # The type of item received by this resource (samples or events)
+    name = None
+
+    # The option which limits the rate at which each device's items are
+    # accepted.
+    rate_option = None
+
+    def __init__(self, queue):
+        Resource.__init__(self)
+        self.queue = queue
+
+    def accept(self, request, decode, store):
+        # Render a POST of a payload.  decode(request, device_id, store)
+        # decodes the payload, passing each resulting item to
+        # store(request, device_id, *item).
         if len(request.postpath) != 1:
             return NoResource().render(request)
 
@@ -567,154 +1866,306 @@ class CeilometerV1Samples(Resource):
         content_type = request.requestHeaders.getRawHeaders('content-type', [None])[0]
         if content_type != 'application/json':
             return ErrorPage(415, "Unsupported Media Type", "Unsupported Media Type").render(request)
-        try:
-            payload = json.loads(request.content.getvalue())
-        except Exception, e:
-            log.error("%s: Error [%s] while parsing JSON data: %s",
-                      device_id, e, request.content.getvalue())
-            return ErrorPage(400, "Bad Request", "Error parsing JSON data: %s" % e).render(request)
 
-        samples = []
-        now = time.time()
+        # Ask ceilometer to back off while the queue drains, or if this
+        # device has exceeded its rate limit.
+        if self.queue.full(device_id):
+            return self.reject(request)
 
-        try:
-            for sample in payload:
-                if 'event_type' in sample and 'volume' not in sample:
-                    return ErrorPage(422, "Unprocessable Entity", "Misconfigured- sending event data to metric URL").render(request)
+        limit = self.rate_limit(device_id)
+        if limit and not limit.allowed():
+            return self.throttle(request, limit)
 
-                resourceId = sample['resource_id']
-                meter = sample['name']
-                value = sample['volume']
-                timestamp = amqp_timestamp_to_int(sample['timestamp'])
+        request._zreceived = 0
+        decode = partial(decode, request, device_id)
+        store = partial(self.receive, store, request, device_id)
 
-                if timestamp > now:
-                    if device_id not in self.future_warning:
-                        log.debug("%s: [%s/%s] Timestamp (%s) appears to be in the future. Using now instead.",
-                                  device_id, resourceId, meter, timestamp)
-                        self.future_warning.add(device_id)
-                    timestamp = now
+        if self.site.ingest_workers:
+            return self.site.ingest_workers.render(self, request, decode, store)
 
-                samples.append((resourceId, meter, value, timestamp))
+        start = time.time()
+        try:
+            decode(store)
+        except PayloadError, e:
+            return self.respond(request, e, time.time() - start)
 
-        except Exception, e:
-            log.exception("%s: Error processing sample data", device_id)
-            return ErrorPage(422, "Unprocessable Entity", "Error processing data: %s" % e).render(request)
+        return self.respond(request, None, time.time() - start)
 
-        for resourceId, meter, value, timestamp in samples:
-            datapoints = REGISTRY.get_datapoints(device_id, resourceId, meter)
+    def receive(self, store, request, device_id, *args):
+        request._zreceived += 1
+        store(request, device_id, *args)
 
-            if datapoints:
-                for dp in datapoints:
-                    log.debug("Storing datapoint %s / %s value %d @ %d", device_id, dp.rrdPath, value, timestamp)
-                    METRIC_QUEUE.append((dp, value, timestamp))
-                    request._zaction['metrics'].append((device_id, dp.rrdPath, value, timestamp))
+    def respond(self, request, error=None, parse_time=None):
+        # Return the response body for a request whose payload has been
+        # decoded and stored, which took parse_time seconds.
+        DRAIN_SCHEDULER.notify(self.queue)
 
-            else:
-                log.debug("Ignoring unmonitored sample: %s / %s / %s", device_id, resourceId, meter)
+        if parse_time is not None:
+            Metrology.timer('zenopenstack.%s.parse_time' % self.name).update(parse_time)
+        if request._zreceived:
+            device_id = request.postpath[0]
+            DEVICE_RATES[device_id][self.name].mark(request._zreceived)
+
+            limit = self.rate_limit(device_id)
+            if limit:
+                limit.take(request._zreceived)
 
-            if meter.startswith("network") and not REGISTRY.has_resource(device_id, resourceId):
-                # potentially, a new vnic.   Store the resource ID
-                # so that we can investigate further in the VnicTask
-                if resourceId not in VNICS[device_id]['potential']:
-                    VNICS[device_id]['potential'][resourceId] = now
+        if error is not None:
+            return error.render(request)
+
+        # If the queue filled up part way through the request, the rest of
+        # its items have been dropped (and counted in the queue's dropped
+        # meter).  The request is still accepted, since having it resent
+        # would duplicate the items which were queued.  (A request is only
+        # rejected if the queue is already full when it arrives.)
 
         # An empty response is fine.
         return b""
 
+    def reject(self, request):
+        name = self.queue.name
+        Metrology.meter('zenopenstack.%s.rejected' % name).mark()
+        request.setHeader(b"retry-after", str(self.site.options.retryafter))
+        return ErrorPage(503, "Service Unavailable", "The %s queue is full, try again later" % name).render(request)
+
+    def rate_limit(self, device_id):
+        # Return the TokenBucket which limits the rate at which the device's
+        # items are accepted, or None if they are not limited.
+        rate = getattr(self.site.options, self.rate_option)
+        if not rate:
+            return None
+
+        limits = DEVICE_LIMITS[device_id]
+        if self.name not in limits:
+            limits[self.name] = TokenBucket(
+                rate, rate * self.site.options.deviceburstseconds)
+        return limits[self.name]
+
+    def throttle(self, request, limit):
+        device_id = request.postpath[0]
+        DEVICE_RATES[device_id][self.name + '_throttled'].mark()
+        request.setHeader(b"retry-after", str(int(math.ceil(limit.wait_time())) or 1))
+        return ErrorPage(429, "Too Many Requests", "Device %s has exceeded its %s rate limit, try again later" % (device_id, self.name)).render(request)
+
 
-class CeilometerV1Events(Resource):
-    """ /ceilometer/v1/events/<device id> : accept events from ceilomter """
+class CeilometerV1Samples(CeilometerV1Payload):
+    """ /ceilometer/v1/samples/<device id> : accept metrics from ceilometer """
 
-    isLeaf = True
+    name = 'samples'
+    rate_option = 'devicesamplerate'
+    future_warning = set()
 
     def render_POST(self, request):
+        # Time spent resolving this request's samples to datapoints
+        request._zresolve_time = 0.0
+        return self.accept(request, self.decode, self.store)
 
-        if len(request.postpath) != 1:
-            return NoResource().render(request)
+    def respond(self, request, error=None, parse_time=None):
+        if request._zreceived:
+            Metrology.timer('zenopenstack.samples.resolve_time').update(request._zresolve_time)
+        return CeilometerV1Payload.respond(self, request, error, parse_time)
 
-        device_id = request.postpath[0]
+    def decode(self, request, device_id, store):
+        # Decode and validate the samples in the request, passing each
+        # one to store(sample, now).  This may be run outside of the
+        # reactor thread (see IngestWorkers), so must not modify any
+        # shared state (which store() may).
 
-        if not REGISTRY.has_device(device_id):
-            return NoResource(message="Unrecognized device '%s'" % device_id).render(request)
+        # In streaming mode, each sample is stored as soon as it has been
+        # decoded and validated, rather than after the whole batch has been.
+        streaming = self.site.options.streamingjson
 
-        content_type = request.requestHeaders.getRawHeaders('content-type', [None])[0]
-        if content_type != 'application/json':
-            return ErrorPage(415, "Unsupported Media Type", "Unsupported Media Type").render(request)
         try:
-            payload = json.loads(request.content.getvalue())
+            payload = request_payload(
+                request, streaming, Metrology.timer('zenopenstack.samples.decode_time'))
         except Exception, e:
             log.error("%s: Error [%s] while parsing JSON data: %s",
-                      device_id, e, request.content.getvalue())
-            return ErrorPage(400, "Bad Request", "Error parsing JSON data: %s" % e).render(request)
-
-        for c_event in payload:
-            if 'event_type' not in c_event:
-                if 'name' in c_event and 'volume' in c_event:
-                    return ErrorPage(422, "Unprocessable Entity", "Misconfigured- sending metric data to event URL").render(request)
-                log.error("%s / %s: Ignoring unrecognized event payload: %s",
-                          device_id, request.getClientIP(), c_event)
-                continue
+                      device_id, e, self.site.request_buffer.read_body(request)[0])
+            raise PayloadError(400, "Bad Request", "Error parsing JSON data: %s" % e)
 
-            event_type = c_event['event_type']
-
-            evt = {
-                'device': device_id,
-                'severity': ZenEventClasses.Info,
-                'eventKey': '',
-                'summary': 'OpenStackInfrastructure: ' + event_type,
-                'eventClassKey': 'openstack-' + event_type,
-                'openstack_event_type': event_type
-            }
-
-            traits = {}
-            for trait in c_event['traits']:
-                if isinstance(trait, list) and len(trait) == 3:
-                    # [[u'display_name', 1, u'demo-volume1-snap'], ...]
-                    traits[trait[0]] = trait[2]
-                elif isinstance(trait, dict) and "name" in trait and "value" in trait:
-                    # I'm not sure that this format is actually used by ceilometer,
-                    # but we're using it in sim_events.py currently.
-                    #
-                    # [{'name': 'display_name', 'value': 'demo-volume1-snap'}, ...]
-                    traits[trait['name']] = trait['value']
+        samples = []
+        now = time.time()
+
+        try:
+            for sample in payload:
+                if 'event_type' in sample and 'volume' not in sample:
+                    raise PayloadError(422, "Unprocessable Entity", "Misconfigured- sending event data to metric URL")
+
+                sample = self.parse_sample(sample)
+                if streaming:
+                    store(sample, now)
                 else:
-                    log.warning("%s: Unrecognized trait format: %s",
-                                device_id, c_event['traits'])
-
-            if 'priority' in traits:
-                if traits['priority'] == 'WARN':
-                    evt['severity'] = ZenEventClasses.Warning
-                elif traits['priority'] == 'ERROR':
-                    evt['severity'] = ZenEventClasses.Error
-
-            evt['eventKey'] = c_event['message_id']
-
-            for trait in traits:
-                evt['trait_' + trait] = traits[trait]
-
-            # only pass on events that we actually have mappings for.
-            if event_type in REGISTRY.device_event_types(device_id):
-                log.debug("%s: Propagated %s event", device_id, event_type)
-                component = event_component_id(evt)
-                if component:
-                    evt['component'] = component
-                EVENT_QUEUE.append(evt)
-                request._zaction['events'].append(evt)
+                    samples.append(sample)
 
-            if event_is_mapped(evt):
-                # Try to turn the event into an objmap.
-                try:
-                    objmap = map_event(evt)
-                    if objmap:
-                        log.debug("%s: Mapped %s event to %s",
-                                  device_id, event_type, objmap)
-                        MAP_QUEUE[device_id].append(objmap)
-                        request._zaction['maps'].append((device_id, objmap))
-                except Exception:
-                    log.exception("%s: Unable to process event: %s", device_id, evt)
+        except PayloadError:
+            raise
 
-        # An empty response is fine.
-        return b""
+        except JSONStreamError, e:
+            log.error("%s: Error [%s] while parsing JSON data", device_id, e)
+            raise PayloadError(400, "Bad Request", "Error parsing JSON data: %s" % e)
+
+        except Exception, e:
+            log.exception("%s: Error processing sample data", device_id)
+            raise PayloadError(422, "Unprocessable Entity", "Error processing data: %s" % e)
+
+        for sample in samples:
+            store(sample, now)
+
+    def parse_sample(self, sample):
+        # Validate a single decoded sample, returning
+        # (resourceId, meter, value, timestamp)
+        resourceId = sample['resource_id']
+        meter = sample['name']
+        value = sample['volume']
+        timestamp = amqp_timestamp_to_int(sample['timestamp'])
+
+        return (resourceId, meter, value, timestamp)
+
+    def store(self, request, device_id, sample, now):
+        resourceId, meter, value, timestamp = sample
+
+        if timestamp > now:
+            if device_id not in self.future_warning:
+                log.debug("%s: [%s/%s] Timestamp (%s) appears to be in the future. Using now instead.",
+                          device_id, resourceId, meter, timestamp)
+                self.future_warning.add(device_id)
+            timestamp = now
+
+        start = time.time()
+        datapoints = REGISTRY.get_datapoints(device_id, resourceId, meter)
+        request._zresolve_time += time.time() - start
+
+        if datapoints:
+            for dp in datapoints:
+                log.debug("Storing datapoint %s / %s value %d @ %d", device_id, dp.rrdPath, value, timestamp)
+                if self.queue.append((dp, value, timestamp), device_id):
+                    request._zaction['metrics'].append((device_id, dp.rrdPath, value, timestamp))
+                else:
+                    request._zaction['dropped'].append((device_id, dp.rrdPath, value, timestamp))
+
+        else:
+            log.debug("Ignoring unmonitored sample: %s / %s / %s", device_id, resourceId, meter)
+
+        if meter.startswith("network") and not REGISTRY.has_resource(device_id, resourceId):
+            # potentially, a new vnic.   Store the resource ID
+            # so that we can investigate further in the VnicTask
+            if resourceId not in VNICS[device_id]['potential']:
+                VNICS[device_id]['potential'][resourceId] = now
+
+
+class CeilometerV1Events(CeilometerV1Payload):
+    """ /ceilometer/v1/events/<device id> : accept events from ceilomter """
+
+    name = 'events'
+    rate_option = 'deviceeventrate'
+
+    def render_POST(self, request):
+        return self.accept(request, self.decode, self.store)
+
+    def decode(self, request, device_id, store):
+        # Decode the events in the request, and map them to zenoss events
+        # and objmaps, passing each to store(evt, propagate, objmap).
+        # This may be run outside of the reactor thread (see IngestWorkers),
+        # so must not modify any shared state, other than the (locked)
+        # caches used by map_event.
+        try:
+            payload = request_payload(
+                request, self.site.options.streamingjson,
+                Metrology.timer('zenopenstack.events.decode_time'))
+        except Exception, e:
+            log.error("%s: Error [%s] while parsing JSON data: %s",
+                      device_id, e, self.site.request_buffer.read_body(request)[0])
+            raise PayloadError(400, "Bad Request", "Error parsing JSON data: %s" % e)
+
+        try:
+            for c_event in payload:
+                if 'event_type' not in c_event:
+                    if 'name' in c_event and 'volume' in c_event:
+                        raise PayloadError(422, "Unprocessable Entity", "Misconfigured- sending metric data to event URL")
+                    log.error("%s / %s: Ignoring unrecognized event payload: %s",
+                              device_id, request.getClientIP(), c_event)
+                    continue
+
+                store(*self.build_event(device_id, c_event))
+
+        except JSONStreamError, e:
+            log.error("%s: Error [%s] while parsing JSON data", device_id, e)
+            raise PayloadError(400, "Bad Request", "Error parsing JSON data: %s" % e)
+
+    def build_event(self, device_id, c_event):
+        # Convert a ceilometer event to a zenoss event, returning
+        # (event, whether to send the event to zenoss, objmap or None)
+        event_type = c_event['event_type']
+
+        evt = {
+            'device': device_id,
+            'severity': ZenEventClasses.Info,
+            'eventKey': '',
+            'summary': 'OpenStackInfrastructure: ' + event_type,
+            'eventClassKey': 'openstack-' + event_type,
+            'openstack_event_type': event_type
+        }
+
+        traits = {}
+        for trait in c_event['traits']:
+            if isinstance(trait, list) and len(trait) == 3:
+                # [[u'display_name', 1, u'demo-volume1-snap'], ...]
+                traits[trait[0]] = trait[2]
+            elif isinstance(trait, dict) and "name" in trait and "value" in trait:
+                # I'm not sure that this format is actually used by ceilometer,
+                # but we're using it in sim_events.py currently.
+                #
+                # [{'name': 'display_name', 'value': 'demo-volume1-snap'}, ...]
+                traits[trait['name']] = trait['value']
+            else:
+                log.warning("%s: Unrecognized trait format: %s",
+                            device_id, c_event['traits'])
+
+        if 'priority' in traits:
+            if traits['priority'] == 'WARN':
+                evt['severity'] = ZenEventClasses.Warning
+            elif traits['priority'] == 'ERROR':
+                evt['severity'] = ZenEventClasses.Error
+
+        evt['eventKey'] = c_event['message_id']
+
+        for trait in traits:
+            evt['trait_' + trait] = traits[trait]
+
+        # only pass on events that we actually have mappings for.
+        propagate = event_type in REGISTRY.device_event_types(device_id)
+        if propagate:
+            component = event_component_id(evt)
+            if component:
+                evt['component'] = component
+
+        objmap = None
+        if event_is_mapped(evt):
+            # Try to turn the event into an objmap.
+            start = time.time()
+            try:
+                objmap = map_event(evt)
+                Metrology.timer('zenopenstack.events.map_time').update(time.time() - start)
+            except Exception:
+                log.exception("%s: Unable to process event: %s", device_id, evt)
+
+        return evt, propagate, objmap
+
+    def store(self, request, device_id, evt, propagate, objmap):
+        event_type = evt['openstack_event_type']
+
+        if propagate:
+            log.debug("%s: Propagated %s event", device_id, event_type)
+            if self.queue.append(evt, device_id):
+                request._zaction['events'].append(evt)
+            else:
+                request._zaction['dropped'].append(evt)
+
+        if objmap:
+            log.debug("%s: Mapped %s event to %s",
+                      device_id, event_type, objmap)
+            MAP_QUEUE[device_id].append(objmap)
+            request._zaction['maps'].append((device_id, objmap))
 
 
 class WebServer(object):
@@ -741,13 +2192,36 @@ class WebServer(object):
         root.putChild('ceilometer', ceilometer_root)
 
         ceilometer_v1 = CeilometerV1()
-        ceilometer_v1samples = CeilometerV1Samples()
-        ceilometer_v1events = CeilometerV1Events()
+        ceilometer_v1samples = CeilometerV1Samples(METRIC_QUEUE)
+        ceilometer_v1events = CeilometerV1Events(EVENT_QUEUE)
 
         ceilometer_root.putChild('v1', ceilometer_v1)
         ceilometer_v1.putChild('samples', ceilometer_v1samples)
         ceilometer_v1.putChild('events', ceilometer_v1events)
 
+        METRIC_QUEUE.limit = preferences.options.maxmetricqueue
+        EVENT_QUEUE.limit = preferences.options.maxeventqueue
+        METRIC_QUEUE.device_share = EVENT_QUEUE.device_share = \
+            preferences.options.devicequeueshare / 100.0
+
+        if preferences.options.journaldir:
+            JOURNALS.open(
+                preferences.options.journaldir,
+                preferences.options.journalsegmentsize * 1024 * 1024,
+                preferences.options.journalmaxsize * 1024 * 1024)
+
+        if preferences.options.workerthreads:
+            log.info("Decoding payloads with %d worker threads",
+                     preferences.options.workerthreads)
+            self.site.ingest_workers = IngestWorkers(
+                preferences.options.workerthreads,
+                preferences.options.workerbacklog,
+                preferences.options.retryafter)
+            self.site.ingest_workers.start()
+
+        if preferences.options.stallthreshold:
+            STALL_DETECTOR.start(preferences.options.stallthreshold / 1000.0)
+
         log.info("Starting http listener on port %d", port)
 
         # Enable twisted logging
@@ -765,10 +2239,26 @@ class WebServer(object):
 class OpenStackCollectorDaemon(CollectorDaemon):
     initialServices = CollectorDaemon.initialServices + ['ModelerService']
 
+    def __init__(self, *args, **kwargs):
+        super(OpenStackCollectorDaemon, self).__init__(*args, **kwargs)
+
+        # The current config of each device, to which the changes fetched
+        # by OpenStackConfigTask are applied.  (Only kept if that task is
+        # enabled, with --configchangeinterval.)
+        self.device_configs = {}
+
     def _updateConfig(self, cfg):
         configId = cfg.configId
         self.log.debug("Processing configuration for %s", configId)
 
+        # Datasources refer to their datapoints by index in the config's
+        # datapoint table until they are resolved.
+        if getattr(cfg, 'datapoint_table', None) is not None:
+            resolve_datapoints(cfg.datasources, cfg.datapoint_table)
+            cfg.datapoint_table = None
+
+        if self.options.configchangeinterval:
+            self.device_configs[configId] = cfg
         REGISTRY.set_config(configId, cfg)
 
         # update queue settings
@@ -787,6 +2277,7 @@ class OpenStackCollectorDaemon(CollectorDaemon):
     def _deleteDevice(self, deviceId):
         self.log.debug("Removing config for %s", deviceId)
 
+        self.device_configs.pop(deviceId, None)
         REGISTRY.remove_device(deviceId)
 
     def getInitialServices(self):
@@ -825,6 +2316,15 @@ class OpenStackCollectorDaemon(CollectorDaemon):
 
         self._scheduler.displayStatistics(verbose)
 
+        for name, description in LATENCY_TIMERS:
+            timer = Metrology.timer(name)
+            if timer.count:
+                snapshot = timer.snapshot
+                self.log.info("%s: %d, mean %.1fms, median %.1fms, 95th %.1fms, 99th %.1fms",
+                              description, timer.count, timer.mean * 1000,
+                              snapshot.median * 1000, snapshot.percentile_95th * 1000,
+                              snapshot.percentile_99th * 1000)
+
 
 class TaskSplitter(NullTaskSplitter):
     def splitConfiguration(self, configs):
@@ -832,106 +2332,560 @@ class TaskSplitter(NullTaskSplitter):
         for config in configs:
             collector._updateConfig(config)
 
+        # Journaled metrics can be matched up with the datapoints of these
+        # devices again.
+        JOURNALS.replay([config.configId for config in configs])
+
+
+class DrainScheduler(object):
+    """
+    Starts draining a queue as soon as it holds `threshold` items, or
+    `max_age` seconds after an item was added to it, rather than leaving
+    it to fill until the next scheduled run of the task that drains it.
+    The task's regular schedule remains as a fallback.
+
+    Notifications are coalesced, so that at most one drain is pending
+    for each queue.
+    """
+
+    def __init__(self):
+        self.drains = {}
+        self.calls = {}
+
+    def register(self, queue, task, threshold, max_age):
+        if threshold or max_age:
+            self.drains[queue.name] = (queue, task, threshold, max_age)
+
+    def notify(self, queue):
+        # Called after items have been added to queue.
+        if queue.name not in self.drains or not len(queue):
+            return
+
+        queue, task, threshold, max_age = self.drains[queue.name]
+        if threshold and len(queue) >= threshold:
+            delay = 0
+        elif max_age:
+            delay = max_age
+        else:
+            return
+
+        call = self.calls.get(queue.name)
+        if call and call.active():
+            if call.getTime() - reactor.seconds() > delay:
+                call.reset(delay)
+            return
+
+        self.calls[queue.name] = reactor.callLater(delay, self.drain, queue.name)
+
+    def drain(self, name):
+        queue, task, threshold, max_age = self.drains[name]
+        if not len(queue):
+            return
+
+        log.debug("Draining %s queue (%d items)", name, len(queue))
+        Metrology.meter('zenopenstack.%s.drains' % name).mark()
+
+        d = task.doTask()
+        d.addErrback(lambda failure: log.error(
+            "Error draining %s queue: %s", name, failure.getErrorMessage()))
+
+
+DRAIN_SCHEDULER = DrainScheduler()
+
+
+def encode_metric(item):
+    dp, value, timestamp = item
+    return dp.rrdPath, value, timestamp
+
+
+def decode_metric(device_id, item):
+    rrdPath, value, timestamp = item
+    dp = REGISTRY.find_datapoint(rrdPath)
+    if dp is None or not REGISTRY.has_device(device_id):
+        return None
+    return dp, value, timestamp
+
+
+class QueueJournals(object):
+    """
+    Keeps the contents of the metric and event queues, the held datamaps in
+    MAP_QUEUE and the vNICs in VNICS on disk (--journaldir), so that they
+    survive a restart of the daemon.
+
+    While running, metrics and events which do not fit in their queues are
+    written to their journals, rather than dropped.  Whatever is left in
+    memory is saved at shutdown.  After a restart, it is replayed once the
+    first configs have been loaded.  Each device's metrics, datamaps and
+    vNICs are held until its own config has been loaded, or discarded if it
+    is not loaded within hold_timeout seconds.
+    """
+
+    hold_timeout = 60 * 60
+
+    def __init__(self):
+        self.state = None
+        self.replaying = False
+
+        # state records of devices whose config has not yet been loaded
+        self.held_state = defaultdict(list)
+
+    def open(self, directory, segment_size, max_size):
+        log.info("Journaling queues in %s", directory)
+
+        METRIC_QUEUE.use_journal(
+            Journal(os.path.join(directory, 'metrics'), segment_size, max_size),
+            encode_metric, decode_metric, REGISTRY.has_device)
+        EVENT_QUEUE.use_journal(
+            Journal(os.path.join(directory, 'events'), segment_size, max_size))
+        self.state = Journal(os.path.join(directory, 'state'), segment_size)
+
+        for queue in (METRIC_QUEUE, EVENT_QUEUE):
+            if len(queue.journal):
+                log.info("%d %s to replay from journal", len(queue.journal), queue.name)
+
+        self.flusher = task.LoopingCall(self.flush)
+        self.flusher.start(1, now=False)
+        reactor.addSystemEventTrigger('before', 'shutdown', self.close)
+
+    def flush(self):
+        for queue in (METRIC_QUEUE, EVENT_QUEUE):
+            queue.journal.flush()
+
+    def replay(self, device_ids):
+        # Called once the configs of device_ids have been loaded.
+        if self.state is None:
+            return
+
+        if not self.replaying:
+            self.replaying = True
+            for record in self.state.popbatch(len(self.state)):
+                self.held_state[record[1]].append(record)
+
+            for queue in (METRIC_QUEUE, EVENT_QUEUE):
+                queue.replaying = True
+            reactor.callLater(self.hold_timeout, self.discard_held)
+
+            # including any devices loaded before this
+            device_ids = REGISTRY.all_devices()
+
+        for device_id in device_ids:
+            self.release(device_id)
+
+        for queue in (METRIC_QUEUE, EVENT_QUEUE):
+            DRAIN_SCHEDULER.notify(queue)
+
+    def release(self, device_id):
+        METRIC_QUEUE.release(device_id)
+
+        for record in self.held_state.pop(device_id, ()):
+            if record[0] == 'maps':
+                device_id, objmaps = record[1:]
+                log.info("%s: Replaying %d datamaps from journal", device_id, len(objmaps))
+                for objmap in objmaps:
+                    MAP_QUEUE[device_id].append(objmap)
+
+            elif record[0] == 'vnics':
+                device_id, potential, modeled = record[1:]
+                VNICS[device_id]['potential'].update(potential)
+                VNICS[device_id]['modeled'].update(modeled)
+
+    def discard_held(self):
+        # Devices whose configs have not been loaded by now (which have
+        # presumably been deleted) will not be.
+        device_ids = set(METRIC_QUEUE.held) | set(self.held_state)
+        if device_ids:
+            log.warning("Discarding journaled data of devices whose configs were not loaded: %s",
+                        ', '.join(sorted(device_ids)))
+
+        METRIC_QUEUE.discard_held()
+        self.held_state.clear()
+
+    def close(self):
+        if self.flusher.running:
+            self.flusher.stop()
+
+        for queue in (METRIC_QUEUE, EVENT_QUEUE):
+            queue.spill()
+            queue.journal.close()
+
+        for device_id, queue in MAP_QUEUE.items():
+            if queue.held_objmaps:
+                self.state.append(('maps', device_id, [
+                    objmap for first_update, objmap in queue.held_objmaps.itervalues()]))
+
+        for device_id, vnics in VNICS.items():
+            self.state.append(('vnics', device_id, vnics['potential'], vnics['modeled']))
+
+        for records in self.held_state.itervalues():
+            for record in records:
+                self.state.append(record)
+
+        self.state.close()
+
+
+JOURNALS = QueueJournals()
+
+
+class StallDetector(object):
+    """
+    Watches for the reactor being blocked, by a request handler or task,
+    for longer than `threshold` seconds (--stallthreshold).
+
+    A LoopingCall records when it last ran, and how late it was (the
+    zenopenstack.reactor.lag timer).  Meanwhile, a watchdog thread checks
+    that it keeps running, and if it falls more than `threshold` seconds
+    behind, logs the reactor thread's current stack, showing what is
+    blocking it.  Once the reactor is running again, the stall is logged
+    and counted.
+    """
+
+    def __init__(self, recent=10):
+        self.threshold = None
+        self.interval = None
+        self.stopped = threading.Event()
+        self.last_tick = None
+        self.reactor_thread = None
+
+        # (last_tick, stack) captured by the watchdog during a stall
+        self.captured = None
+
+        self.stalls = 0
+        self.stall_time = 0.0
+        self.max_stall = 0.0
+        self.recent = deque(maxlen=recent)
+        self.lag_timer = Metrology.timer('zenopenstack.reactor.lag')
+
+    def start(self, threshold):
+        self.threshold = threshold
+        self.interval = min(0.1, threshold / 2.0)
+        self.last_tick = time.time()
+
+        self.loop = task.LoopingCall(self.tick)
+        self.loop.start(self.interval, now=False)
+        reactor.addSystemEventTrigger('before', 'shutdown', self.stop)
+
+        self.watchdog = threading.Thread(target=self.watch, name='zenopenstack-watchdog')
+        self.watchdog.daemon = True
+        self.watchdog.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.loop.running:
+            self.loop.stop()
+        self.watchdog.join()
+
+    def tick(self):
+        # Called in the reactor thread every interval seconds, if it can be.
+        now = time.time()
+        previous, self.last_tick = self.last_tick, now
+        self.reactor_thread = threading.current_thread().ident
+
+        lag = max(now - previous - self.interval, 0.0)
+        self.lag_timer.update(lag)
+        if lag < self.threshold:
+            return
+
+        stack = None
+        if self.captured and self.captured[0] == previous:
+            stack = self.captured[1]
+        self.captured = None
+
+        self.stalls += 1
+        self.stall_time += lag
+        self.max_stall = max(self.max_stall, lag)
+        self.recent.append({
+            'timestamp': datetime.datetime.now(),
+            'duration': lag,
+            'stack': stack
+        })
+        log.warning("Reactor was blocked for %.3f seconds", lag)
+
+    def watch(self):
+        # Run in the watchdog thread.
+        while not self.stopped.wait(self.interval):
+            last_tick = self.last_tick
+            blocked = time.time() - last_tick - self.interval
+            if blocked < self.threshold or self.reactor_thread is None:
+                continue
+            if self.captured and self.captured[0] == last_tick:
+                # already captured during this stall
+                continue
+
+            frame = sys._current_frames().get(self.reactor_thread)
+            if frame is None:
+                continue
+
+            stack = ''.join(traceback.format_stack(frame))
+            self.captured = (last_tick, stack)
+            log.warning("Reactor has been blocked for %.3f seconds, in:\n%s",
+                        blocked, stack)
+
+
+STALL_DETECTOR = StallDetector()
+
+
+class TimeSliceStats(object):
+    """
+    Counts the time slices used by a task, and how long it held the
+    reactor for (the sum and the longest of those slices).
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.runs = 0
+        self.slices = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+
+        metric_name = name.replace('-', '.')
+        self.slice_meter = Metrology.meter('%s.slices' % metric_name)
+        self.run_timer = Metrology.timer('%s.run_time' % metric_name)
+
+    def record(self, elapsed):
+        self.slices += 1
+        self.total_time += elapsed
+        self.max_time = max(self.max_time, elapsed)
+        self.slice_meter.mark()
+
+
+TASK_STATS = {}
+
+
+class TimeSlicer(object):
+    """
+    Cooperative scheduling for long loops run in the reactor thread.
+
+    A loop in an inlineCallbacks generator checks expired() as it goes,
+    and once its budget (in seconds) has been used, yields pause() to give
+    the reactor a chance to service other work (such as incoming requests)
+    before it continues:
+
+        for item in items:
+            if slicer.expired():
+                yield slicer.pause()
+
+    Deferreds that are yielded by the loop should be wrapped with wait(), so
+    that time spent waiting on them is not counted against the budget.
+    """
+
+    def __init__(self, stats, budget):
+        self.stats = stats
+        self.budget = budget
+        self.started = time.time()
+
+    def expired(self):
+        return time.time() - self.started >= self.budget
+
+    def wait(self, d):
+        # (d may be any value that can be yielded by an inlineCallbacks
+        # generator, not only a Deferred.)
+        if not isinstance(d, defer.Deferred) or d.called:
+            return d
+
+        self.stats.record(time.time() - self.started)
+
+        def resume(result):
+            self.started = time.time()
+            return result
+
+        return d.addBoth(resume)
+
+    def pause(self):
+        return self.wait(task.deferLater(reactor, 0, lambda: None))
+
+    def finish(self):
+        self.stats.record(time.time() - self.started)
+
+
+class OpenStackTask(BaseTask):
+    """
+    Base class for the zenopenstack tasks.
+
+    Tasks may be started by the DrainScheduler as well as on their regular
+    schedule, so a run of the task which starts while a previous one is
+    still in progress does nothing.  Each task's doTask() passes the
+    function which does its work to run_task().
+    """
 
-class OpenStackEventTask(BaseTask):
     zope.interface.implements(IScheduledTask)
 
     def __init__(self, taskName, configId, scheduleIntervalSeconds=60, taskConfig=None):
-        super(OpenStackEventTask, self).__init__(
+        super(OpenStackTask, self).__init__(
             taskName, configId, scheduleIntervalSeconds, taskConfig)
 
         self.name = taskName
         self.configId = configId
         self.state = TaskStates.STATE_IDLE
         self.interval = scheduleIntervalSeconds
+        self.running = False
+
+        preferences = zope.component.queryUtility(
+            ICollectorPreferences, 'zenopenstack')
+        self.timeslice = preferences.options.timeslice / 1000.0
+        self.stats = TASK_STATS.setdefault(taskName, TimeSliceStats(taskName))
+        self.slicer = None
+
+    def run_task(self, process):
+        # Run process(), which returns a Deferred, unless the previous run
+        # is still in progress.
+        if self.running:
+            log.debug("%s: previous run still in progress", self.name)
+            return defer.succeed(None)
+
+        started = time.time()
+
+        def finished(result):
+            self.slicer.finish()
+            self.stats.run_timer.update(time.time() - started)
+            self.running = False
+            return result
+
+        self.running = True
+        self.stats.runs += 1
+        self.slicer = TimeSlicer(self.stats, self.timeslice)
+        return process().addBoth(finished)
+
+
+class OpenStackEventTask(OpenStackTask):
+
+    def __init__(self, taskName, configId, scheduleIntervalSeconds=60, taskConfig=None):
+        super(OpenStackEventTask, self).__init__(
+            taskName, configId, scheduleIntervalSeconds, taskConfig)
+
         self._collector = zope.component.queryUtility(ICollector)
 
-    @defer.inlineCallbacks
     def doTask(self):
+        return self.run_task(self.process)
+
+    @defer.inlineCallbacks
+    def process(self):
         if len(EVENT_QUEUE):
             log.debug("Draining event queue")
             self.state = 'SEND_EVENTS'
 
             while len(EVENT_QUEUE):
                 event = EVENT_QUEUE.popleft()
-                yield self._collector.sendEvent(event)
+                yield self.slicer.wait(self._collector.sendEvent(event))
+
+                if self.slicer.expired():
+                    yield self.slicer.pause()
 
             self.state = TaskStates.STATE_IDLE
 
 
-class OpenStackPerfTask(BaseTask):
-    zope.interface.implements(IScheduledTask)
+class OpenStackPerfTask(OpenStackTask):
 
     def __init__(self, taskName, configId, scheduleIntervalSeconds=60, taskConfig=None):
         super(OpenStackPerfTask, self).__init__(
             taskName, configId, scheduleIntervalSeconds, taskConfig)
 
-        self.name = taskName
-        self.configId = configId
-        self.state = TaskStates.STATE_IDLE
-        self.interval = scheduleIntervalSeconds
         self._dataService = zope.component.queryUtility(IDataService)
 
         self.writeMetricWithMetadata = hasattr(
             self._dataService, 'writeMetricWithMetadata')
+        self.write_timer = Metrology.timer('zenopenstack.metrics.write_time')
+
+        preferences = zope.component.queryUtility(
+            ICollectorPreferences, 'zenopenstack')
+        self.batch_size = preferences.options.publishbatchsize
+        self.semaphore = defer.DeferredSemaphore(
+            preferences.options.publishconcurrency)
 
-    @defer.inlineCallbacks
     def doTask(self):
+        return self.run_task(self.process)
+
+    @defer.inlineCallbacks
+    def process(self):
         if len(METRIC_QUEUE):
             log.debug("Draining metric queue")
             self.state = 'STORE_PERF_DATA'
 
             while len(METRIC_QUEUE):
-                dp, value, timestamp = METRIC_QUEUE.popleft()
-                log.debug("Publishing datapoint %s value %f @ %f", dp.rrdPath, value, timestamp)
-
-                if self.writeMetricWithMetadata:
-                    yield defer.maybeDeferred(
-                        self._dataService.writeMetricWithMetadata,
-                        dp.dpName,
-                        value,
-                        dp.rrdType,
-                        timestamp=timestamp,
-                        min=dp.rrdMin,
-                        max=dp.rrdMax,
-                        metadata=dp.metadata)
+                batch = METRIC_QUEUE.popbatch(self.batch_size)
+
+                # Publish the batch, with up to publishconcurrency writes
+                # outstanding at any time.
+                results = yield self.slicer.wait(defer.DeferredList(
+                    [self.semaphore.run(self.publish, dp, value, timestamp)
+                     for dp, value, timestamp in batch],
+                    consumeErrors=True))
+
+                for (success, result), (dp, value, timestamp) in zip(results, batch):
+                    if not success:
+                        log.error("Error publishing datapoint %s value %f @ %f: %s",
+                                  dp.rrdPath, value, timestamp, result.getErrorMessage())
+
+                if self.slicer.expired():
+                    yield self.slicer.pause()
 
-                else:
-                    self._dataService.writeRRD(
-                        dp.rrdPath,
-                        value,
-                        dp.rrdType,
-                        rrdCommand=dp.rrdCreateCommand,
-                        cycleTime=self.interval,
-                        min=dp.rrdMin,
-                        max=dp.rrdMax,
-                        timestamp=timestamp,
-                        allowStaleDatapoint=False)
             self.state = TaskStates.STATE_IDLE
 
+    def publish(self, dp, value, timestamp):
+        log.debug("Publishing datapoint %s value %f @ %f", dp.rrdPath, value, timestamp)
 
-class OpenStackMapTask(BaseTask):
-    zope.interface.implements(IScheduledTask)
+        start = time.time()
+        d = defer.maybeDeferred(self.write, dp, value, timestamp)
+        d.addCallback(self.written, start)
+        return d
+
+    def written(self, result, start):
+        self.write_timer.update(time.time() - start)
+        return result
+
+    def write(self, dp, value, timestamp):
+        if self.writeMetricWithMetadata:
+            return self._dataService.writeMetricWithMetadata(
+                dp.dpName,
+                value,
+                dp.rrdType,
+                timestamp=timestamp,
+                min=dp.rrdMin,
+                max=dp.rrdMax,
+                metadata=dp.metadata)
+
+        else:
+            return self._dataService.writeRRD(
+                dp.rrdPath,
+                value,
+                dp.rrdType,
+                rrdCommand=dp.rrdCreateCommand,
+                cycleTime=self.interval,
+                min=dp.rrdMin,
+                max=dp.rrdMax,
+                timestamp=timestamp,
+                allowStaleDatapoint=False)
+
+
+class OpenStackMapTask(OpenStackTask):
 
     def __init__(self, taskName, configId, scheduleIntervalSeconds=60, taskConfig=None):
         super(OpenStackMapTask, self).__init__(
             taskName, configId, scheduleIntervalSeconds, taskConfig)
 
-        self.name = taskName
-        self.configId = configId
-        self.state = TaskStates.STATE_IDLE
-        self.interval = scheduleIntervalSeconds
         self._collector = zope.component.queryUtility(ICollector)
 
-    @defer.inlineCallbacks
     def doTask(self):
+        return self.run_task(self.process)
+
+    @defer.inlineCallbacks
+    def process(self):
+
+        drain_timer = Metrology.timer('zenopenstack.maps.drain_time')
+        apply_timer = Metrology.timer('zenopenstack.maps.apply_time')
 
         maps = {}
-        for device_id, queue in MAP_QUEUE.iteritems():
-            for datamap in queue.drain():
+        for device_id, queue in MAP_QUEUE.items():
+            start = time.time()
+            datamaps = queue.drain()
+            drain_timer.update(time.time() - start)
+
+            for datamap in datamaps:
                 maps.setdefault(device_id, [])
                 maps[device_id].append(datamap)
 
+            if self.slicer.expired():
+                yield self.slicer.pause()
+
         obsolete_devices = set(MAP_QUEUE.keys()) - set(REGISTRY.all_devices())
         for device_id in obsolete_devices:
             log.info("Removing datamap queue for deleted device %s", device_id)
@@ -943,80 +2897,144 @@ class OpenStackMapTask(BaseTask):
             remoteProxy = self._collector.getServiceNow('ModelerService')
 
             for device_id in maps:
-                yield remoteProxy.callRemote(
-                    'applyDataMaps', device_id, maps[device_id])
+                start = time.time()
+                yield self.slicer.wait(remoteProxy.callRemote(
+                    'applyDataMaps', device_id, maps[device_id]))
+                apply_timer.update(time.time() - start)
 
             self.state = TaskStates.STATE_IDLE
 
 
-class OpenStackVnicTask(BaseTask):
-    zope.interface.implements(IScheduledTask)
+class OpenStackConfigTask(OpenStackTask):
 
     def __init__(self, taskName, configId, scheduleIntervalSeconds=60, taskConfig=None):
-        super(OpenStackVnicTask, self).__init__(
+        super(OpenStackConfigTask, self).__init__(
             taskName, configId, scheduleIntervalSeconds, taskConfig)
 
-        self.name = taskName
-        self.configId = configId
-        self.state = TaskStates.STATE_IDLE
-        self.interval = scheduleIntervalSeconds
+        self._collector = zope.component.queryUtility(ICollector)
+        self._service = zope.component.queryUtility(
+            ICollectorPreferences, 'zenopenstack').configurationService
+
+    def doTask(self):
+        return self.run_task(self.process)
 
     @defer.inlineCallbacks
+    def process(self):
+        # Fetch just the changes to each device's datasources since its
+        # config was last loaded (or updated by this task), and apply them,
+        # rather than waiting for the next full config cycle.
+
+        remoteProxy = self._collector.getServiceNow(self._service)
+
+        self.state = 'FETCH_CONFIG_CHANGES'
+        for device_id, cfg in self._collector.device_configs.items():
+            token = getattr(cfg, 'config_token', None)
+            if token is None:
+                continue
+
+            try:
+                delta = yield self.slicer.wait(remoteProxy.callRemote(
+                    'getDatasourceChanges', device_id, token))
+            except Exception, e:
+                log.warning("%s: Unable to fetch config changes: %s", device_id, e)
+                continue
+
+            # The device may have been removed, or had its config replaced,
+            # while the changes were being fetched.
+            if delta is None or self._collector.device_configs.get(device_id) is not cfg:
+                continue
+
+            resolve_datapoints(delta.datasources, delta.datapoint_table)
+            if delta.full:
+                cfg.datasources = delta.datasources
+            elif delta.components or delta.removed:
+                components = set(delta.components) | set(delta.removed)
+                cfg.datasources = [
+                    ds for ds in cfg.datasources
+                    if ds.component not in components] + delta.datasources
+            cfg.thresholds = delta.thresholds
+            cfg.config_token = delta.token
+
+            if delta.full or delta.components or delta.removed:
+                log.info("%s: Applying config changes (%s)", device_id,
+                         "full" if delta.full else "%d components changed, %d removed" % (
+                             len(delta.components), len(delta.removed)))
+                self._collector._updateConfig(cfg)
+
+        self.state = TaskStates.STATE_IDLE
+
+
+class OpenStackVnicTask(OpenStackTask):
+
+    # We only attempt to model a vnic for 20 minutes, then give up.
+    # this is to allow time for a new instance to be modeled.  If samples
+    # continue to arrive for it, it will be tried again.
+    potential_vnic_timeout = 20 * 60
+
     def doTask(self):
+        return self.run_task(self.process)
+
+    @defer.inlineCallbacks
+    def process(self):
         # Periodically look for new vnics, and if found, build ObjectMaps
         # for them, which will be picked up by the map task.
 
         now = time.time()
-        i = 0
-        for device_id, vnics in VNICS.iteritems():
-            if not vnics['potential']:
+        for device_id, vnics in VNICS.items():
+            if not REGISTRY.has_device(device_id):
+                del VNICS[device_id]
                 continue
 
-            for resourceId, first_seen in vnics['potential'].iteritems():
-                # We only attempt to model a vnic for 20 minutes, then give up.
-                # this is to allow time for a new instance to be modeled, but
-                # also to save processing time, because for every potential
-                # vnic, we need to loop over every possible instance.
-                # 20 minutes lets us try this many times, and if it
-                # isn't working by then, it presumably never will.
-                if now - first_seen > 20 * 60:
-                    continue
+            # Once a modeled vnic shows up in the config, samples for it
+            # will no longer be treated as potential vnics.
+            vnics['modeled'] = set(
+                resourceId for resourceId in vnics['modeled']
+                if not REGISTRY.has_resource(device_id, resourceId))
+
+            for resourceId, first_seen in vnics['potential'].items():
+                if self.slicer.expired():
+                    yield self.slicer.pause()
 
                 # We only ever model each vnic once.
                 if resourceId in vnics['modeled']:
+                    del vnics['potential'][resourceId]
+                    continue
+
+                vnic = self.find_vnic(device_id, resourceId)
+                if vnic is None:
+                    if now - first_seen > self.potential_vnic_timeout:
+                        log.debug("Unable to find instance for potential vNIC %s", resourceId)
+                        del vnics['potential'][resourceId]
                     continue
 
-                # Loop over every known instance to see if it is the parent
-                # of this potential vnic.
-                for instanceUUID in REGISTRY.device_resource_ids(device_id, 'OpenStackInfrastructureInstance'):
-                    # give time back to the reactor occasionally
-                    i += 1
-                    if i % 500:
-                        yield task.deferLater(reactor, 0, lambda: None)
-
-                    # Vnic resourceIds are of the form:
-                    #  [instanceName]-[instanceUUID]-[vnicName]
-                    #  instance-00000001-95223d22-d3af-4b06-a91c-81114d557bd1-tap908bc571-0d
-
-                    log.debug("Searching for instance %s in %s" % (instanceUUID, resourceId))
-                    match = re.search("-%s-(.*)$" % instanceUUID, resourceId)
-                    if match:
-                        vnicName = match.group(1)
-                        instance_id = REGISTRY.get_component_id(device_id, instanceUUID)
-                        vnic_id = prepId(str('vnic-%s-%s' % (instanceUUID, vnicName)))
-
-                        log.info("Discovered new vNIC (%s) on instance %s", vnic_id, instance_id)
-                        vnics['modeled'].add(resourceId)
-
-                        MAP_QUEUE[device_id].append(ObjectMap({
-                            'modname': 'ZenPacks.zenoss.OpenStackInfrastructure.Vnic',
-                            'id': vnic_id,
-                            'compname': 'components/%s' % instance_id,
-                            'relname': 'vnics',
-                            'title': vnicName,
-                            'resourceId': resourceId
-                        }))
-                        break
+                instanceUUID, instance_id, vnicName = vnic
+                vnic_id = prepId(str('vnic-%s-%s' % (instanceUUID, vnicName)))
+
+                log.info("Discovered new vNIC (%s) on instance %s", vnic_id, instance_id)
+                vnics['modeled'].add(resourceId)
+                del vnics['potential'][resourceId]
+
+                MAP_QUEUE[device_id].append(ObjectMap({
+                    'modname': 'ZenPacks.zenoss.OpenStackInfrastructure.Vnic',
+                    'id': vnic_id,
+                    'compname': 'components/%s' % instance_id,
+                    'relname': 'vnics',
+                    'title': vnicName,
+                    'resourceId': resourceId
+                }))
+
+    def find_vnic(self, device_id, resourceId):
+        # Given a potential vnic's resourceId, return a tuple of
+        # (instance UUID, instance component ID, vnic name), or None if
+        # it does not belong to any known instance.
+        for match in VNIC_INSTANCE_UUID.finditer(resourceId):
+            # instances are registered by their (lowercase) UUIDs
+            instanceUUID = match.group(1).lower()
+            instance_id = REGISTRY.get_instance_id(device_id, instanceUUID)
+            if instance_id:
+                return instanceUUID, instance_id, resourceId[match.end(1) + 1:]
+
+        return None
 
 
 class Preferences(object):
@@ -1046,6 +3064,212 @@ class Preferences(object):
             default=100,
             help="Size of HTTP request debug log buffer")
 
+        parser.add_option(
+            '--httpdebugsamplerate',
+            dest='httpdebugsamplerate',
+            type='float',
+            default=1.0,
+            help="Fraction (0.0 - 1.0) of successful HTTP requests to store "
+                 "in the debug log buffer.  Errors are always stored.")
+
+        parser.add_option(
+            '--httpdebugmaxbody',
+            dest='httpdebugmaxbody',
+            type='int',
+            default=64 * 1024,
+            help="Maximum bytes of each request and response body to store "
+                 "in the debug log buffer (0 for no limit)")
+
+        parser.add_option(
+            '--httpdebugactions',
+            dest='httpdebugactions',
+            type='choice',
+            choices=['counts', 'full'],
+            default='counts',
+            help="Store only the number of metrics, events and datamaps "
+                 "produced by each request in the debug log buffer (counts), "
+                 "or the items themselves (full)")
+
+        parser.add_option(
+            '--streamingjson',
+            dest='streamingjson',
+            action='store_true',
+            default=False,
+            help="Decode ceilometer payloads incrementally, one sample or "
+                 "event at a time, to limit memory use for large batches")
+
+        parser.add_option(
+            '--workerthreads',
+            dest='workerthreads',
+            type='int',
+            default=0,
+            help="Number of threads used to decode ceilometer payloads "
+                 "outside of the reactor thread (default 0: decode them "
+                 "in the reactor thread)")
+
+        parser.add_option(
+            '--workerbacklog',
+            dest='workerbacklog',
+            type='int',
+            default=50,
+            help="Number of requests which may wait for a worker thread "
+                 "before further requests are rejected (HTTP 503)")
+
+        parser.add_option(
+            '--maxmetricqueue',
+            dest='maxmetricqueue',
+            type='int',
+            default=1000000,
+            help="Maximum number of datapoints waiting to be published "
+                 "before further samples are rejected (0 for no limit)")
+
+        parser.add_option(
+            '--maxeventqueue',
+            dest='maxeventqueue',
+            type='int',
+            default=100000,
+            help="Maximum number of events waiting to be sent "
+                 "before further events are rejected (0 for no limit)")
+
+        parser.add_option(
+            '--devicequeueshare',
+            dest='devicequeueshare',
+            type='int',
+            default=100,
+            help="Percentage of the metric and event queue limits which "
+                 "the data from any one device may use")
+
+        parser.add_option(
+            '--devicesamplerate',
+            dest='devicesamplerate',
+            type='int',
+            default=0,
+            help="Maximum samples per second accepted from each device, "
+                 "averaged over --deviceburstseconds, before its requests "
+                 "are refused (0 for no limit)")
+
+        parser.add_option(
+            '--deviceeventrate',
+            dest='deviceeventrate',
+            type='int',
+            default=0,
+            help="Maximum events per second accepted from each device, "
+                 "averaged over --deviceburstseconds, before its requests "
+                 "are refused (0 for no limit)")
+
+        parser.add_option(
+            '--deviceburstseconds',
+            dest='deviceburstseconds',
+            type='int',
+            default=60,
+            help="Seconds' worth of samples or events which a device may "
+                 "send at once, within its rate limit")
+
+        parser.add_option(
+            '--columnarmetrics',
+            dest='columnarmetrics',
+            action='store_true',
+            default=False,
+            help="Hold queued metrics in compact arrays rather than as "
+                 "python objects, to reduce memory use for large queues")
+
+        parser.add_option(
+            '--journaldir',
+            dest='journaldir',
+            default=None,
+            help="Directory in which to keep metrics and events which do "
+                 "not fit in their queues, and the contents of the queues "
+                 "across restarts (not used unless set)")
+
+        parser.add_option(
+            '--journalmaxsize',
+            dest='journalmaxsize',
+            type='int',
+            default=1024,
+            help="Maximum megabytes of metrics, and of events, held in "
+                 "the journal before further data is rejected")
+
+        parser.add_option(
+            '--journalsegmentsize',
+            dest='journalsegmentsize',
+            type='int',
+            default=64,
+            help="Size in megabytes of each of the journal's files")
+
+        parser.add_option(
+            '--publishbatchsize',
+            dest='publishbatchsize',
+            type='int',
+            default=1000,
+            help="Number of datapoints published between returns to the "
+                 "reactor, while draining the metric queue")
+
+        parser.add_option(
+            '--publishconcurrency',
+            dest='publishconcurrency',
+            type='int',
+            default=20,
+            help="Maximum number of datapoint writes outstanding at once")
+
+        parser.add_option(
+            '--metricdrainsize',
+            dest='metricdrainsize',
+            type='int',
+            default=10000,
+            help="Start publishing queued datapoints as soon as this many "
+                 "are waiting (0 to disable)")
+
+        parser.add_option(
+            '--eventdrainsize',
+            dest='eventdrainsize',
+            type='int',
+            default=100,
+            help="Start sending queued events as soon as this many "
+                 "are waiting (0 to disable)")
+
+        parser.add_option(
+            '--drainlatency',
+            dest='drainlatency',
+            type='int',
+            default=10,
+            help="Maximum seconds that a datapoint or event waits before "
+                 "its queue is drained (0 to wait for the next regular "
+                 "60 second cycle)")
+
+        parser.add_option(
+            '--retryafter',
+            dest='retryafter',
+            type='int',
+            default=60,
+            help="Seconds ceilometer is asked to wait (Retry-After) before "
+                 "resending rejected requests")
+
+        parser.add_option(
+            '--timeslice',
+            dest='timeslice',
+            type='int',
+            default=50,
+            help="Milliseconds the queue processing tasks may run for "
+                 "before giving time back to the web server")
+
+        parser.add_option(
+            '--stallthreshold',
+            dest='stallthreshold',
+            type='int',
+            default=0,
+            help="Log the stack of, and count, any request handler or task "
+                 "which blocks the web server for longer than this many "
+                 "milliseconds (default 0, disabled)")
+
+        parser.add_option(
+            '--configchangeinterval',
+            dest='configchangeinterval',
+            type='int',
+            default=0,
+            help="Seconds between fetches of just the changes to each "
+                 "device's datasources and thresholds, between full config "
+                 "loads (0 to disable)")
+
         # Twisted manhole options. Disabled by default for security reasons.
         manhole_group = optparse.OptionGroup(parser, "Manhole Options")
         parser.add_option_group(manhole_group)
@@ -1072,6 +3296,21 @@ class Preferences(object):
             default=DEFAULT_MANHOLE_PASSWORD,
             help='Twisted manhole password (default %default)')
 
+        # /health/profile options. Disabled unless a password is set.
+        profile_group = optparse.OptionGroup(parser, "Profiling Options")
+        parser.add_option_group(profile_group)
+
+        profile_group.add_option(
+            '--profile-username',
+            default=DEFAULT_PROFILE_USERNAME,
+            help='Username for /health/profile (default %default)')
+
+        profile_group.add_option(
+            '--profile-password',
+            default=None,
+            help='Password for /health/profile, which is disabled '
+                 'unless this is set')
+
     def postStartup(self):
         pass
 
@@ -1079,11 +3318,23 @@ class Preferences(object):
 
         # We run one task for each type of processing- each consumes and sends
         # on data from a corresponding queue.
-        yield OpenStackPerfTask('zenopenstack-perf', configId='zenopenstack-perf', scheduleIntervalSeconds=60)
-        yield OpenStackEventTask('zenopenstack-event', configId='zenopenstack-event', scheduleIntervalSeconds=60)
+        perf_task = OpenStackPerfTask('zenopenstack-perf', configId='zenopenstack-perf', scheduleIntervalSeconds=60)
+        event_task = OpenStackEventTask('zenopenstack-event', configId='zenopenstack-event', scheduleIntervalSeconds=60)
+
+        # The metric and event queues are also drained as they fill, rather
+        # than only once a minute.
+        DRAIN_SCHEDULER.register(METRIC_QUEUE, perf_task, self.options.metricdrainsize, self.options.drainlatency)
+        DRAIN_SCHEDULER.register(EVENT_QUEUE, event_task, self.options.eventdrainsize, self.options.drainlatency)
+
+        yield perf_task
+        yield event_task
         yield OpenStackMapTask('zenopenstack-map', configId='zenopenstack-map', scheduleIntervalSeconds=60)
         yield OpenStackVnicTask('zenopenstack-vnic', configId='zenopenstack-vnic', scheduleIntervalSeconds=60)
 
+        if self.options.configchangeinterval:
+            yield OpenStackConfigTask('zenopenstack-config', configId='zenopenstack-config',
+                                      scheduleIntervalSeconds=self.options.configchangeinterval)
+
 
 def get_manhole_port(base_port_number):
     """
@@ -1106,6 +3357,8 @@ def get_manhole_port(base_port_number):
 
 
 def main():
+    global METRIC_QUEUE
+
     preferences = Preferences()
     task_splitter = TaskSplitter()
     webserver = WebServer()
@@ -1116,6 +3369,10 @@ def main():
         initializationCallback=webserver.initialize)
 
     config = preferences.options
+    if config.columnarmetrics:
+        METRIC_QUEUE = DeviceQueues(
+            'metrics', lambda name: ColumnarMetricQueue(name, REGISTRY))
+
     if config.manhole:
         namespace = dict(
             preferences=preferences,
@@ -0,0 +1,277 @@
+#!/usr/bin/env python
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2026, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+"""bench_config
+
+Compare the size of a device's zenopenstack config, as sent over PB by
+the OpenStackConfig service, and the memory used by zenopenstack to load
+it, between the format used before datapoint tables (a DataPointConfig
+for every datapoint of every component, each with its own copy of the
+component's metric metadata) and the current one.
+
+Each format is loaded in its own child process, which reports how much
+its RSS grew by to hold the loaded config (as zenopenstack does).
+
+Also times checking whether each of the device's components has changed,
+when none has, between the component signatures used before they were
+keyed on serials (which read each component's metric metadata and
+compared the device's zProperties) and the current ones.
+
+    load_model.py -d test_ostack --instances=2250
+    bench_config.py -d test_ostack
+
+"""
+
+import Globals
+
+import copy
+import gc
+import json
+import optparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from twisted.spread import banana, jelly
+
+from Products.ZenRRD.zencommand import DataPointConfig
+from Products.ZenUtils.Utils import unused
+from Products.ZenUtils.ZenScriptBase import ZenScriptBase
+
+from ZenPacks.zenoss.OpenStackInfrastructure.services.OpenStackConfig import (
+    OpenStackConfig,
+    TemplateCache,
+    resolve_datapoints,
+    serial,
+    zproperty_values
+)
+from ZenPacks.zenoss.OpenStackInfrastructure.zenopenstack import PublishRecord, Registry
+
+unused(Globals)
+
+FORMATS = ('expanded', 'table')
+
+
+def rss_kb():
+    gc.collect()
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * resource.getpagesize() / 1024
+
+
+def decode(data, chunk_size=64 * 1024):
+    # Decode data in chunks, as it is when received over PB.  (Decoding it
+    # in one go, as banana.decode() does, takes time quadratic in its size.)
+    expressions = []
+    protocol = banana.Banana()
+    protocol.connectionMade()
+    protocol._selectDialect('none')
+    protocol.expressionReceived = expressions.append
+    for offset in xrange(0, len(data), chunk_size):
+        protocol.dataReceived(data[offset:offset + chunk_size])
+    return expressions[0]
+
+
+def expand(proxy):
+    # Return a copy of proxy in the format used before datapoint tables.
+    skeletons = proxy.datapoint_table
+
+    datasources = []
+    for ds in proxy.datasources:
+        expanded = copy.copy(ds)
+        expanded.points = []
+        for i in ds.points:
+            dp_id, dpName, rrdType, rrdCreateCommand, rrdMin, rrdMax = skeletons[i]
+            dp_config = DataPointConfig()
+            dp_config.id = dp_id
+            dp_config.dpName = dpName
+            dp_config.component = ds.component
+            dp_config.rrdPath = '/'.join((ds.rrdPath, dpName))
+            dp_config.rrdType = rrdType
+            dp_config.rrdCreateCommand = rrdCreateCommand
+            dp_config.rrdMin = rrdMin
+            dp_config.rrdMax = rrdMax
+            if ds.metadata is not None:
+                dp_config.metadata = dict(ds.metadata)
+            expanded.points.append(dp_config)
+
+        del expanded.rrdPath
+        del expanded.metadata
+        datasources.append(expanded)
+
+    proxy = copy.copy(proxy)
+    proxy.datasources = datasources
+    del proxy.datapoint_table
+    return proxy
+
+
+def baseline_signature(component, collector, template_cache, zproperties):
+    # As OpenStackConfig.component_signature was before it only read
+    # serials.
+    metadata = None
+    if hasattr(component, 'getMetricMetadata'):
+        metadata = tuple(sorted(component.getMetricMetadata().items()))
+
+    return (
+        component.rrdPath(),
+        tuple(template_cache.signature(template) for template in component.getRRDTemplates()),
+        serial(component),
+        serial(collector),
+        metadata,
+        zproperties)
+
+
+def time_signatures(device, collector, signature):
+    # Return the time taken to find that none of device's components has
+    # changed, comparing signature(component, template_cache, zproperties)
+    # with the signature computed before, as DeviceConfigCache.update does.
+    components = device.getMonitoredComponents()
+    template_cache = TemplateCache(collector)
+    zproperties = zproperty_values(device)
+    previous = [signature(component, template_cache, zproperties) for component in components]
+
+    start = time.time()
+    template_cache = TemplateCache(collector)
+    zproperties = zproperty_values(device)
+    unchanged = all(
+        signature(component, template_cache, zproperties) == previous[i]
+        for i, component in enumerate(components))
+    elapsed = time.time() - start
+
+    assert unchanged
+    return elapsed
+
+
+def load_expanded(registry, device_id, cfg):
+    # As zenopenstack loaded configs before datapoint tables.
+    component_metadata = {}
+    configs = registry.configs.setdefault(device_id, {})
+    for ds in cfg.datasources:
+        records = []
+        for dp in ds.points:
+            metadata = getattr(dp, 'metadata', None)
+            if metadata is not None:
+                shared = component_metadata.setdefault(ds.component, metadata)
+                if shared == metadata:
+                    metadata = shared
+            records.append(registry.add_datapoint(PublishRecord(dp.rrdPath, dp, metadata)))
+        configs.setdefault(ds.resourceId, {})[ds.meter] = tuple(records)
+
+
+def run_child(config_format, path):
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    baseline = rss_kb()
+
+    start = time.time()
+    cfg = jelly.unjelly(decode(data))
+
+    registry = Registry()
+    if config_format == 'table':
+        resolve_datapoints(cfg.datasources, cfg.datapoint_table)
+        cfg.datapoint_table = None
+        registry.set_config(cfg.configId, cfg)
+    else:
+        load_expanded(registry, cfg.configId, cfg)
+    load_time = time.time() - start
+
+    print json.dumps({
+        'format': config_format,
+        'rss_kb': rss_kb() - baseline,
+        'load_time': load_time,
+        'datapoints': len(registry.datapoint_table),
+    })
+
+
+class BenchConfig(ZenScriptBase):
+
+    def buildOptions(self):
+        super(BenchConfig, self).buildOptions()
+
+        self.parser.add_option(
+            '-d', dest='device',
+            help='Device Name',
+            default='test_ostack')
+
+        self.parser.add_option('--format', dest='format', help=optparse.SUPPRESS_HELP)
+        self.parser.add_option('--file', dest='file', help=optparse.SUPPRESS_HELP)
+
+    def run(self):
+        if self.options.format:
+            run_child(self.options.format, self.options.file)
+            return
+
+        self.connect()
+
+        device = self.dmd.Devices.findDeviceByIdExact(self.options.device)
+        if device is None:
+            print "Device %s not found" % self.options.device
+            sys.exit(1)
+
+        service = OpenStackConfig(self.dmd, device.getPerformanceServerName())
+
+        start = time.time()
+        proxy = service._createDeviceProxy(device)
+        build_time = time.time() - start
+
+        start = time.time()
+        service._createDeviceProxy(device)
+        rebuild_time = time.time() - start
+
+        print "%s: %d datasources, %d distinct datapoints" % (
+            device.id, len(proxy.datasources), len(proxy.datapoint_table))
+        print "config built in %.3f seconds (%.3f seconds when unchanged)" % (
+            build_time, rebuild_time)
+
+        collector = device.getPerformanceServer()
+        baseline_time = time_signatures(
+            device, collector,
+            lambda component, template_cache, zproperties: baseline_signature(
+                component, collector, template_cache, zproperties))
+        serial_time = time_signatures(
+            device, collector,
+            lambda component, template_cache, zproperties: (
+                service.component_signature(component, collector, template_cache)))
+        print "unchanged components checked in %.3f seconds (%.3f seconds before)" % (
+            serial_time, baseline_time)
+        print
+        print "%-10s %16s %16s %16s" % ('format', 'PB bytes', 'RSS (KB)', 'load (s)')
+
+        for config_format in FORMATS:
+            cfg = expand(proxy) if config_format == 'expanded' else proxy
+            data = banana.encode(jelly.jelly(cfg))
+
+            fd, path = tempfile.mkstemp()
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(data)
+
+                output = subprocess.check_output([
+                    sys.executable, __file__,
+                    '--format', config_format,
+                    '--file', path])
+            finally:
+                os.remove(path)
+
+            result = json.loads(output.strip().splitlines()[-1])
+            print "%-10s %16d %16d %16.3f" % (
+                config_format, len(data), result['rss_kb'], result['load_time'])
+
+
+def main():
+    script = BenchConfig()
+    script.run()
+
+
+if __name__ == '__main__':
+    main()
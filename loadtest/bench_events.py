@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2026, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+"""bench_events
+
+Measure the time taken by map_event to build an objmap for each of the
+sample events in tests/data/eventdata.json.
+
+Traits such as trait_fixed_ips arrive as strings, either in JSON or as a
+python repr(), depending on how the notification was produced.  Each
+format is timed with ast.literal_eval, which was used to parse them
+before, and with parse_trait_literal, both as it is (when most values
+are found in its cache) and with its cache cleared before each call (so
+that each value is parsed).  Since only some events have these traits,
+the time taken to parse them alone is shown too.
+
+    bench_events.py --iterations=2000
+
+"""
+
+import Globals
+
+import ast
+import json
+import optparse
+import os
+import re
+import time
+
+from Products.ZenUtils.Utils import unused
+
+from ZenPacks.zenoss.OpenStackInfrastructure import events as events_module
+from ZenPacks.zenoss.OpenStackInfrastructure.events import map_event, parse_trait_literal
+
+unused(Globals)
+
+
+def parse_uncached(value):
+    events_module._LITERAL_CACHE.clear()
+    return parse_trait_literal(value)
+
+
+FORMATS = (('repr', str), ('json', json.dumps))
+PARSERS = (
+    ('literal_eval', ast.literal_eval),
+    ('parse_trait_literal', parse_trait_literal),
+    ('uncached', parse_uncached))
+
+EVENTDATA = os.path.join(
+    os.path.dirname(__file__),
+    '..', 'ZenPacks', 'zenoss', 'OpenStackInfrastructure',
+    'tests', 'data', 'eventdata.json')
+
+
+def load_events(encode):
+    # Return the sample events, with trait_fixed_ips encoded as a string by
+    # encode(), as received from ceilometer.
+    with open(EVENTDATA) as json_file:
+        eventdata = json.load(json_file)
+
+    events = []
+    for event in eventdata.values():
+        event['openstack_event_type'] = \
+            re.sub(r'^openstack-', '', event.get('eventClassKey', ''))
+
+        if 'trait_fixed_ips' in event:
+            event['trait_fixed_ips'] = encode(event['trait_fixed_ips'])
+
+        events.append(event)
+
+    return events
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('--iterations', type='int', default=2000,
+                      help='Number of times to map each event (default %default)')
+    options, args = parser.parse_args()
+
+    print "%-6s %-20s %10s %10s %14s %12s %14s" % (
+        'traits', 'parser', 'events', 'mapped', 'usec/event', 'events/sec', 'usec/parse')
+
+    for format_name, encode in FORMATS:
+        events = load_events(encode)
+        for parser_name, parser in PARSERS:
+            events_module.parse_trait_literal = parser
+            try:
+                mapped = 0
+                start = time.time()
+                for _ in xrange(options.iterations):
+                    for event in events:
+                        if map_event(event) is not None:
+                            mapped += 1
+                elapsed = time.time() - start
+            finally:
+                events_module.parse_trait_literal = parse_trait_literal
+
+            traits = [event['trait_fixed_ips'] for event in events if 'trait_fixed_ips' in event]
+            start = time.time()
+            for _ in xrange(options.iterations):
+                for trait in traits:
+                    parser(trait)
+            parse_time = (time.time() - start) / (options.iterations * len(traits))
+
+            total = options.iterations * len(events)
+            print "%-6s %-20s %10d %10d %14.1f %12.0f %14.1f" % (
+                format_name, parser_name, total, mapped,
+                elapsed / total * 1000000, total / elapsed, parse_time * 1000000)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2026, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+"""bench_ingest
+
+Compare peak memory (RSS) and per-request latency of decoding a ceilometer
+sample batch all at once (json.loads) with decoding it incrementally
+(zenopenstack --streamingjson).
+
+Each mode is measured in its own child process, since peak RSS can only
+be observed for a whole process.
+
+    bench_ingest.py --samples=50000 --requests=5
+
+"""
+
+import Globals
+
+import json
+import optparse
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from Products.ZenUtils.Utils import unused
+
+from ZenPacks.zenoss.OpenStackInfrastructure.utils import (
+    amqp_timestamp_to_int,
+    iter_json_array
+)
+
+unused(Globals)
+
+MODES = ('loads', 'streaming')
+
+
+def write_body(fileobj, samples):
+    # Written one sample at a time, so that building the body does not
+    # itself raise the peak RSS of the process.
+    fileobj.write('[')
+    for i in xrange(samples):
+        if i:
+            fileobj.write(',')
+        fileobj.write(json.dumps({
+            "counter_name": "cpu_util",
+            "counter_type": "gauge",
+            "counter_unit": "%",
+            "counter_volume": float(i % 100),
+            "name": "cpu_util",
+            "project_id": "a3b0f6a3e5b44a18b7f0b5b1c6cbf7c2",
+            "resource_id": "instance-%08x-95223d22-d3af-4b06-a91c-81114d557bd1" % i,
+            "resource_metadata": {
+                "display_name": "instance%d" % i,
+                "host": "compute%d" % (i % 30),
+                "flavor": {"name": "m1.small", "vcpus": 1, "ram": 2048}
+            },
+            "source": "openstack",
+            "timestamp": "2026-10-18T12:00:00.000000",
+            "type": "gauge",
+            "unit": "%",
+            "user_id": "0c1d2c5e3e8c4bd0b4bbd2fbd4b9a0f1",
+            "volume": float(i % 100)
+        }))
+    fileobj.write(']')
+
+
+def peak_rss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def process(content, mode):
+    # Mirrors CeilometerV1Samples.render_POST: decode, then validate each
+    # sample into a (resourceId, meter, value, timestamp) tuple.
+    content.seek(0)
+    if mode == 'streaming':
+        payload = iter_json_array(content)
+    else:
+        payload = json.loads(content.read())
+
+    count = 0
+    for sample in payload:
+        (sample['resource_id'], sample['name'], sample['volume'],
+         amqp_timestamp_to_int(sample['timestamp']))
+        count += 1
+    return count
+
+
+def run_child(mode, samples, requests):
+    # Like twisted.web, hold large request bodies in a temporary file.
+    content = tempfile.TemporaryFile()
+    write_body(content, samples)
+
+    baseline = peak_rss_kb()
+    latencies = []
+    for _ in range(requests):
+        start = time.time()
+        process(content, mode)
+        latencies.append(time.time() - start)
+
+    print json.dumps({
+        'mode': mode,
+        'peak_rss_kb': peak_rss_kb() - baseline,
+        'latency_mean': sum(latencies) / len(latencies),
+        'latency_max': max(latencies),
+    })
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('--samples', type='int', default=50000,
+                      help='Number of samples per request (default %default)')
+    parser.add_option('--requests', type='int', default=5,
+                      help='Number of requests per mode (default %default)')
+    parser.add_option('--mode', choices=MODES, help=optparse.SUPPRESS_HELP)
+    options, args = parser.parse_args()
+
+    if options.mode:
+        run_child(options.mode, options.samples, options.requests)
+        return
+
+    print "%d samples per request, %d requests per mode" % (
+        options.samples, options.requests)
+    print "%-10s %16s %16s %16s" % ('mode', 'peak RSS (KB)', 'mean latency (s)', 'max latency (s)')
+    for mode in MODES:
+        output = subprocess.check_output([
+            sys.executable, __file__,
+            '--mode', mode,
+            '--samples', str(options.samples),
+            '--requests', str(options.requests)])
+        result = json.loads(output.strip().splitlines()[-1])
+        print "%-10s %16d %16.3f %16.3f" % (
+            mode, result['peak_rss_kb'], result['latency_mean'], result['latency_max'])
+
+
+if __name__ == '__main__':
+    main()
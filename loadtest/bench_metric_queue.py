@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2026, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+"""bench_metric_queue
+
+Compare the memory used per queued metric by zenopenstack's default
+metric queue (a deque of tuples) and its columnar one (--columnarmetrics).
+
+Each queue is measured in its own child process, since peak RSS can only
+be observed for a whole process.
+
+    bench_metric_queue.py --metrics=1000000 --datapoints=10000
+
+"""
+
+import Globals
+
+import json
+import optparse
+import resource
+import subprocess
+import sys
+import time
+
+from Products.ZenUtils.Utils import unused
+
+from ZenPacks.zenoss.OpenStackInfrastructure.services.OpenStackConfig import DataPointSkeleton
+from ZenPacks.zenoss.OpenStackInfrastructure.zenopenstack import (
+    BoundedQueue,
+    ColumnarMetricQueue,
+    PublishRecord,
+    Registry
+)
+
+unused(Globals)
+
+QUEUES = ('deque', 'columnar')
+
+
+DATAPOINT = DataPointSkeleton(
+    id='cpu_util',
+    dpName='cpu_util_cpu_util',
+    rrdType='GAUGE',
+    rrdCreateCommand='',
+    rrdMin=None,
+    rrdMax=None)
+
+
+def peak_rss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run_child(queue_type, metrics, datapoints):
+    registry = Registry()
+    records = [registry.add_datapoint(PublishRecord(
+                   'Devices/openstack/instance-%d/cpu_util_cpu_util' % i, DATAPOINT))
+               for i in xrange(datapoints)]
+
+    if queue_type == 'columnar':
+        queue = ColumnarMetricQueue('metrics', registry)
+    else:
+        queue = BoundedQueue('metrics')
+
+    baseline = peak_rss_kb()
+    now = time.time()
+
+    start = time.time()
+    for i in xrange(metrics):
+        # values and timestamps are distinct objects, as they would be
+        # when decoded from separate samples.
+        queue.append((records[i % datapoints], float(i % 100) + 0.5, now + i))
+    append_time = time.time() - start
+
+    peak = peak_rss_kb() - baseline
+
+    start = time.time()
+    while len(queue):
+        queue.popbatch(1000)
+    drain_time = time.time() - start
+
+    print json.dumps({
+        'queue': queue_type,
+        'bytes_per_metric': peak * 1024.0 / metrics,
+        'append_time': append_time,
+        'drain_time': drain_time,
+    })
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('--metrics', type='int', default=1000000,
+                      help='Number of metrics to queue (default %default)')
+    parser.add_option('--datapoints', type='int', default=10000,
+                      help='Number of distinct datapoints (default %default)')
+    parser.add_option('--queue', choices=QUEUES, help=optparse.SUPPRESS_HELP)
+    options, args = parser.parse_args()
+
+    if options.queue:
+        run_child(options.queue, options.metrics, options.datapoints)
+        return
+
+    print "%d metrics for %d datapoints" % (options.metrics, options.datapoints)
+    print "%-10s %16s %16s %16s" % ('queue', 'bytes/metric', 'append (s)', 'drain (s)')
+    for queue_type in QUEUES:
+        output = subprocess.check_output([
+            sys.executable, __file__,
+            '--queue', queue_type,
+            '--metrics', str(options.metrics),
+            '--datapoints', str(options.datapoints)])
+        result = json.loads(output.strip().splitlines()[-1])
+        print "%-10s %16.1f %16.3f %16.3f" % (
+            queue_type, result['bytes_per_metric'],
+            result['append_time'], result['drain_time'])
+
+
+if __name__ == '__main__':
+    main()